@@ -0,0 +1,84 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_WORKERS = 2
+"""Number of threads computing CPU-heavy responses at once.
+More threads wouldn't compute responses faster (they all share the GIL),
+but would slow down every other request handled by the server."""
+
+DEFAULT_MAX_PENDING = 8
+"""Number of offloaded responses (computed or waiting for a worker),
+above which new requests are rejected"""
+
+RETRY_AFTER = 1
+"""Value of the Retry-After header (in seconds) of rejected requests"""
+
+
+class PoolBusy(Exception):
+    """Raised by ApiPool.run when too many responses are already pending"""
+
+
+class ApiPool:
+    """ApiPool computes CPU-heavy API responses on a small pool of threads.
+
+    The Flask server handles every request on a separate thread, so a burst of heavy
+    requests (like all the concurrent fetches of a map page) makes every thread
+    fight for the GIL - and all requests, including cheap ones, stall until the burst is over.
+    Funneling heavy requests through a few workers keeps the rest of the server responsive,
+    and the bounded queue (`max_pending`) sheds load instead of building up
+    an ever-growing backlog.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # NOTE: Created lazily, as most Applications (e.g. in jvig export) never use it
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="jvig-api")
+            return self._executor
+
+    def run(self, func: Callable[[], T]) -> T:
+        """Computes `func()` on one of the workers and waits for the result.
+        Raises PoolBusy if `max_pending` calls are already in progress."""
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy()
+        try:
+            return self.executor.submit(func).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
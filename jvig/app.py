@@ -0,0 +1,1043 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2022-2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from flask import (
+    Flask,
+    copy_current_request_context,
+    has_request_context,
+    jsonify,
+    render_template,
+    request,
+)
+from flask.wrappers import Response
+from jinja2 import BytecodeCache, FileSystemBytecodeCache
+
+from .api import RETRY_AFTER, ApiPool, PoolBusy
+from .blocks import BlockEngine
+from .compression import (
+    COMPRESSIBLE_MIMETYPES,
+    MIN_SIZE,
+    CompressedPayload,
+    CompressionCache,
+    compress,
+    negotiate,
+)
+from .diff import FeedDiff
+from .duplicates import DuplicateCluster, find_duplicate_stops
+from .fragments import RowCompiler, RowFragmentCache
+from .gtfs import TABLE_KEYS, Gtfs, Row
+from .headways import Departure, HeadwayExpander
+from .memory import MemoryGovernor
+from .planner import Journey, Planner
+from .report import ValidationReport, validate_feed
+from .spatial import NEARBY_RADIUS
+from .stats import FeedStats, compute_stats
+from .tables import (
+    agency,
+    calendar,
+    calendar_dates,
+    frequencies,
+    pathways,
+    routes,
+    stops,
+    times,
+    transfers,
+    trips,
+)
+from .util import (
+    BackgroundTask,
+    int_to_time,
+    parse_gtfs_date,
+    time_to_int,
+    to_js_literal,
+    user_cache_dir,
+)
+
+TRIP_SORT_KEYS: dict[str, str] = {
+    "first_time": "first_departure",
+    "last_time": "last_arrival",
+    "duration": "duration",
+}
+"""Maps the accepted values of the `sort` query parameter of the trips view
+to the TripSummary attributes."""
+
+CACHED_ENDPOINTS = {
+    "route_stops",
+    "route_calendars",
+    "route_calendar",
+    "route_api_map_stops",
+    "route_api_map_shape",
+    "route_api_map_route",
+    "route_api_map_shapes",
+    "route_api_calendar_dates",
+    "route_api_calendar_summary",
+}
+"""Endpoints whose responses only depend on the loaded feed and the request URL.
+Compressed bodies of those responses are cached."""
+
+OFFLOADED_ENDPOINTS = {
+    "route_api_map_stops",
+    "route_api_map_stop",
+    "route_api_map_trip",
+    "route_api_map_shape",
+    "route_api_map_route",
+    "route_api_map_shapes",
+    "route_api_stop_departures",
+    "route_api_block",
+    "route_api_calendar_dates",
+}
+"""CPU-heavy JSON endpoints, whose responses are computed on the ApiPool"""
+
+MAX_DUPLICATE_CLUSTERS = 1000
+"""Number of clusters of near-duplicate stops shown on the HTML page (JSON has all of them)"""
+
+ROW_FORMATTERS: dict[str, tuple[RowCompiler, tuple[str, ...]]] = {
+    "stops": (stops.compile_row, ("stop_id",)),
+    "trips": (trips.compile_row, ("trip_id",)),
+    "stop_times": (times.compile_row, ("trip_id", "stop_sequence")),
+}
+"""Row formatter compilers and primary key columns of tables, whose rows are rendered
+through the RowFragmentCache (with the `format_row` template function)"""
+
+
+def _in_window(time: int, start: int, end: int) -> bool:
+    """Checks if `time` falls between `start` and `end` (inclusive).
+    Negative `start` or `end` mean that the window is unbounded in that direction.
+    Unknown (negative) times are never in a bounded window."""
+    return time >= 0 and (start < 0 or time >= start) and (end < 0 or time <= end)
+
+
+def _cache_key() -> str:
+    """Returns the key of the current request in the CompressionCache"""
+    return request.full_path if request.query_string else request.path
+
+
+def default_template_cache_dir() -> Path:
+    """Returns the default directory for compiled templates, inside the user's cache directory"""
+    return user_cache_dir() / "templates"
+
+
+@lru_cache(maxsize=None)
+def template_cache(directory: Path) -> Optional[BytecodeCache]:
+    """Returns a cache of compiled templates, shared by all Applications,
+    so that templates are only compiled once - and not on every start.
+    Returns None if the directory can't be created."""
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(str(directory))
+
+
+class Application:
+    def __init__(self, gtfs: Gtfs, memory_budget: Optional[int] = None) -> None:
+        self.gtfs = gtfs
+        self.blocks = BlockEngine(gtfs)
+        self.headways = HeadwayExpander(gtfs)
+        self.planner = Planner(gtfs, self.headways)
+        self.report: BackgroundTask[ValidationReport] = BackgroundTask(
+            lambda: validate_feed(gtfs),
+            name="jvig-validation",
+        )
+        self.stats: BackgroundTask[FeedStats] = BackgroundTask(
+            lambda: compute_stats(gtfs, self.headways),
+            name="jvig-stats",
+        )
+        self.duplicate_stops: BackgroundTask[list[DuplicateCluster]] = BackgroundTask(
+            lambda: find_duplicate_stops(gtfs.stops),
+            name="jvig-duplicate-stops",
+        )
+        self.diff: Optional[BackgroundTask[FeedDiff]] = None
+        """Changes from an older version of the feed - only set if such feed was provided"""
+        self.relative_base = False
+        """Makes the <base> of every page relative to the page itself (see jvig.export),
+        instead of pointing at the root of the application"""
+        self.compressed = CompressionCache()
+        self.fragments = RowFragmentCache()
+        self.api = ApiPool()
+        self.memory = MemoryGovernor(memory_budget)
+        self._init_memory()
+        self.flask = Flask(__name__)
+        self.flask.jinja_env.bytecode_cache = template_cache(default_template_cache_dir())
+        self._init_app()
+
+    def _base_href(self) -> str:
+        if not has_request_context():
+            return "/"
+        elif self.relative_base:
+            # Exported pages are saved as index.html in a directory named after the URL
+            depth = sum(1 for i in request.path.split("/") if i)
+            return "../" * depth or "./"
+        return request.script_root + "/"
+
+    def _init_memory(self) -> None:
+        # Evictable structures, from the cheapest to rebuild
+        self.memory.register(
+            "row_fragments",
+            self.fragments.estimated_size,
+            self.fragments.clear,
+        )
+        self.memory.register(
+            "compressed_responses",
+            lambda: self.compressed.size,
+            self.compressed.clear,
+        )
+        self.memory.register("headways", self.headways.estimated_size, self.headways.clear)
+        self.memory.register("block_analyses", self.blocks.estimated_size, self.blocks.clear)
+        self.memory.register(
+            "planner_days",
+            self.planner.days_estimated_size,
+            self.planner.clear_days,
+        )
+        for name in self.gtfs.evictable_structures():
+            self.memory.register(
+                name,
+                lambda name=name: self.gtfs.estimated_size(name),
+                lambda name=name: self.gtfs.evict(name),
+            )
+
+        # Structures which can't be rebuilt
+        for name in (*TABLE_KEYS, "dangling"):
+            self.memory.register(name, lambda name=name: self.gtfs.estimated_size(name))
+        if "stop_times_by_stops" not in self.gtfs.evictable_structures():
+            self.memory.register(
+                "stop_times_by_stops",
+                lambda: self.gtfs.estimated_size("stop_times_by_stops"),
+            )
+        self.memory.register("planner", self.planner.estimated_size)
+
+    def _init_app(self) -> None:
+        self._init_template_functions()
+        self._init_html_routes()
+        self._init_api_routes()
+        self._init_compression()
+
+    def _init_template_functions(self) -> None:
+        # Apply template filters
+        self.flask.add_template_global(agency.header_class, "agency_header_class")
+        self.flask.add_template_global(routes.header_class, "routes_header_class")
+        self.flask.add_template_global(routes.compile_row, "routes_compile_row")
+        self.flask.add_template_global(stops.header_class, "stops_header_class")
+        self.flask.add_template_global(stops.compile_row, "stops_compile_row")
+        self.flask.add_template_global(trips.header_class, "trips_header_class")
+        self.flask.add_template_global(trips.compile_row, "trips_compile_row")
+        self.flask.add_template_global(times.header_class, "times_header_class")
+        self.flask.add_template_global(times.compile_row, "times_compile_row")
+        self.flask.add_template_global(frequencies.header_class, "frequencies_header_class")
+        self.flask.add_template_global(frequencies.compile_row, "frequencies_compile_row")
+        self.flask.add_template_global(calendar.header_class, "calendar_header_class")
+        self.flask.add_template_global(calendar.compile_row, "calendar_compile_row")
+        self.flask.add_template_global(calendar_dates.header_class, "calendar_dates_header_class")
+        self.flask.add_template_global(calendar_dates.compile_row, "calendar_dates_compile_row")
+        self.flask.add_template_global(transfers.header_class, "transfers_header_class")
+        self.flask.add_template_global(transfers.compile_row, "transfers_compile_row")
+        self.flask.add_template_global(pathways.header_class, "pathways_header_class")
+        self.flask.add_template_global(pathways.compile_row, "pathways_compile_row")
+
+        # All links are relative to the <base> of the application,
+        # so that it can be mounted under any path (see jvig.serve)
+        self.flask.context_processor(lambda: {"base_href": self._base_href()})
+
+        # Helper functions
+        self.flask.add_template_global(self._format_row, "format_row")
+        self.flask.add_template_global(to_js_literal, "to_js_literal")
+        self.flask.add_template_global(int_to_time, "int_to_time")
+        self.flask.add_template_global(self._trip_first_time, "trip_first_time")
+        self.flask.add_template_global(self._trip_last_time, "trip_last_time")
+        self.flask.add_template_global(self._trip_duration, "trip_duration")
+
+    def _trip_first_time(self, trip_id: str) -> str:
+        return int_to_time(self.gtfs.trip_summary(trip_id).first_departure)
+
+    def _trip_last_time(self, trip_id: str) -> str:
+        return int_to_time(self.gtfs.trip_summary(trip_id).last_arrival)
+
+    def _trip_duration(self, trip_id: str) -> str:
+        return int_to_time(self.gtfs.trip_summary(trip_id).duration)
+
+    def _format_row(self, table: str, row: Row, header: list[str]) -> str:
+        compile_row, key_columns = ROW_FORMATTERS[table]
+        key = tuple(row.get(column, "") for column in key_columns)
+        return self.fragments.render(table, key, header, row, compile_row)
+
+    def _init_html_routes(self) -> None:
+        self.flask.add_url_rule("/", view_func=self.route_agency)
+        self.flask.add_url_rule("/agency", view_func=self.route_agency)
+        self.flask.add_url_rule("/agency/<path:agency_id>", view_func=self.route_routes)
+        self.flask.add_url_rule("/routes", view_func=self.route_routes)
+        self.flask.add_url_rule("/stops", view_func=self.route_stops)
+        self.flask.add_url_rule("/route/<path:route_id>", view_func=self.route_trips)
+        self.flask.add_url_rule("/block/<path:block_id>", view_func=self.route_block)
+        self.flask.add_url_rule("/stop/<path:stop_id>", view_func=self.route_stop)
+        self.flask.add_url_rule("/trip/<path:trip_id>", view_func=self.route_trip)
+        self.flask.add_url_rule("/calendars", view_func=self.route_calendars)
+        self.flask.add_url_rule("/calendar/<path:service_id>", view_func=self.route_calendar)
+        self.flask.add_url_rule("/report", view_func=self.route_report)
+        self.flask.add_url_rule("/report/duplicate-stops", view_func=self.route_duplicate_stops)
+        self.flask.add_url_rule("/integrity", view_func=self.route_integrity)
+        self.flask.add_url_rule("/stats", view_func=self.route_stats)
+        self.flask.add_url_rule("/diff", view_func=self.route_diff)
+        self.flask.add_url_rule("/plan", view_func=self.route_plan)
+
+    def _init_api_routes(self) -> None:
+        self.flask.add_url_rule("/api/map/stops", view_func=self.route_api_map_stops)
+        self.flask.add_url_rule("/api/map/stop/<path:stop_id>", view_func=self.route_api_map_stop)
+        self.flask.add_url_rule("/api/map/trip/<path:trip_id>", view_func=self.route_api_map_trip)
+        self.flask.add_url_rule(
+            "/api/map/shape/<path:shape_id>",
+            view_func=self.route_api_map_shape,
+        )
+        self.flask.add_url_rule("/api/map/shapes", view_func=self.route_api_map_shapes)
+        self.flask.add_url_rule(
+            "/api/map/route/<path:route_id>",
+            view_func=self.route_api_map_route,
+        )
+        self.flask.add_url_rule(
+            "/api/stop/departures/<path:stop_id>",
+            view_func=self.route_api_stop_departures,
+        )
+        self.flask.add_url_rule("/api/stops/nearby", view_func=self.route_api_stops_nearby)
+        self.flask.add_url_rule("/api/pathways/path", view_func=self.route_api_pathways_path)
+        self.flask.add_url_rule("/api/block/<path:block_id>", view_func=self.route_api_block)
+        self.flask.add_url_rule("/api/report", view_func=self.route_api_report)
+        self.flask.add_url_rule(
+            "/api/report/duplicate-stops",
+            view_func=self.route_api_duplicate_stops,
+        )
+        self.flask.add_url_rule("/api/stats", view_func=self.route_api_stats)
+        self.flask.add_url_rule("/api/metrics", view_func=self.route_api_metrics)
+        self.flask.add_url_rule("/api/memory", view_func=self.route_api_memory)
+        self.flask.add_url_rule("/api/diff", view_func=self.route_api_diff)
+        self.flask.add_url_rule(
+            "/api/calendar/days/<path:service_id>",
+            view_func=self.route_api_calendar_dates,
+        )
+        self.flask.add_url_rule(
+            "/api/calendar/summary",
+            view_func=self.route_api_calendar_summary,
+        )
+
+        for endpoint in OFFLOADED_ENDPOINTS:
+            self.flask.view_functions[endpoint] = self._offloaded(
+                self.flask.view_functions[endpoint]
+            )
+
+    def _init_compression(self) -> None:
+        self.flask.before_request(self._serve_compressed)
+        self.flask.after_request(self._compress_response)
+
+    # Offloading heavy requests
+
+    def _offloaded(self, view: Callable[..., Response]) -> Callable[..., Response]:
+        """Wraps a view, so that its response is computed on the ApiPool.
+        Requests which can't be queued are rejected with 503 Service Unavailable."""
+
+        def wrapper(**kwargs: Any) -> Response:
+            try:
+                return self.api.run(copy_current_request_context(lambda: view(**kwargs)))
+            except PoolBusy:
+                return Response(
+                    "too many pending requests",
+                    status=503,
+                    headers={"Retry-After": str(RETRY_AFTER)},
+                )
+
+        return wrapper
+
+    # Response compression
+
+    def _serve_compressed(self) -> Optional[Response]:
+        """Responds with cached compressed bodies, skipping the view altogether"""
+        if request.endpoint not in CACHED_ENDPOINTS:
+            return None
+
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+        payload = self.compressed.get(_cache_key(), encoding) if encoding else None
+        if payload is None:
+            return None
+
+        response = Response(payload.data, content_type=payload.content_type)
+        response.headers["Content-Encoding"] = payload.encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def _compress_response(self, response: Response) -> Response:
+        """Compresses responses with the content coding preferred by the client"""
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+        data = response.get_data()
+        if encoding is None or len(data) < MIN_SIZE:
+            return response
+
+        cached = request.endpoint in CACHED_ENDPOINTS
+        data = compress(data, encoding, thorough=cached)
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+
+        if cached:
+            self.compressed.put(
+                _cache_key(),
+                encoding,
+                CompressedPayload(data, encoding, response.content_type or ""),
+            )
+
+        return response
+
+    # HTML routes
+
+    def route_agency(self) -> str:
+        return render_template(
+            "agency.html.jinja",
+            missing=not self.gtfs.agency,
+            header=self.gtfs.header_of("agency"),
+            data=self.gtfs.agency.values(),
+        )
+
+    def route_routes(self, agency_id: Optional[str] = None) -> str:
+        if agency_id:
+            data = filter(lambda row: row["agency_id"] == agency_id, self.gtfs.routes.values())
+        else:
+            data = self.gtfs.routes.values()
+
+        return render_template(
+            "routes.html.jinja",
+            missing=not self.gtfs.routes,
+            header=self.gtfs.header_of("routes"),
+            data=data,
+        )
+
+    def route_stops(self) -> str:
+        return render_template(
+            "stops.html.jinja",
+            missing=not self.gtfs.stops,
+            header=self.gtfs.header_of("stops"),
+            data=self.gtfs.stops.values(),
+        )
+
+    def route_trips(self, route_id: str) -> str:
+        data: Iterable[Row] = map(
+            self.gtfs.trips.__getitem__,
+            self.gtfs.route_trips.get(route_id, []),
+        )
+
+        # Filter trips by the time window of their first departure
+        window_from = request.args.get("from", "")
+        window_to = request.args.get("to", "")
+        window_start = time_to_int(window_from)
+        window_end = time_to_int(window_to)
+
+        if window_start >= 0 or window_end >= 0:
+            data = filter(
+                lambda row: _in_window(
+                    self.gtfs.trip_summary(row["trip_id"]).first_departure,
+                    window_start,
+                    window_end,
+                ),
+                data,
+            )
+
+        # Sort trips by a TripSummary attribute
+        sort = request.args.get("sort", "")
+        if sort in TRIP_SORT_KEYS:
+            attribute = TRIP_SORT_KEYS[sort]
+            data = sorted(
+                data,
+                key=lambda row: getattr(self.gtfs.trip_summary(row["trip_id"]), attribute),
+            )
+
+        return render_template(
+            "trips.html.jinja",
+            route_id=route_id,
+            missing=not self.gtfs.trips,
+            header=self.gtfs.header_of("trips"),
+            data=data,
+            sort=sort,
+            window_from=window_from,
+            window_to=window_to,
+        )
+
+    def route_block(self, block_id: str) -> str:
+        analysis = self.blocks.analyze(block_id)
+        return render_template(
+            "block.html.jinja",
+            block_id=block_id,
+            missing=analysis is None,
+            analysis=analysis,
+            header=self.gtfs.header_of("trips"),
+            trips=self.gtfs.trips,
+        )
+
+    def route_stop(self, stop_id: str) -> str:
+        # Special case for missing stops
+        if stop_id not in self.gtfs.stops:
+            return render_template(
+                "stop.html.jinja",
+                missing=True,
+                stop={"stop_id": stop_id},
+            )
+
+        stop = self.gtfs.stops[stop_id]
+
+        # Gather the stop_times of this stop,
+        # and their trip_short_names and trip_headsigns
+        times_by_service: dict[str, list[Row]] = {}
+        trip_short_names: Optional[dict[str, str]] = (
+            {} if "trip_short_name" in self.gtfs.header_of("trips") else None
+        )
+        trip_headsigns: Optional[dict[str, str]] = (
+            {} if "trip_headsign" in self.gtfs.header_of("trips") else None
+        )
+
+        orphaned_times: list[Row] = []
+
+        for time in self.gtfs.stop_times_by_stops.get(stop_id, []):
+            if self.gtfs.is_dangling("stop_times", "trip_id", time["trip_id"]):
+                orphaned_times.append(time)
+                continue
+            trip = self.gtfs.trips[time["trip_id"]]
+
+            times_by_service.setdefault(trip["service_id"], []).append(time)
+
+            if trip_short_names is not None:
+                trip_short_names[trip["trip_id"]] = trip["trip_short_name"]
+            if trip_headsigns is not None:
+                trip_headsigns[trip["trip_id"]] = trip["trip_headsign"]
+
+        # Ensure times_by_service are ordered by the departure time
+        for lst in times_by_service.values():
+            lst.sort(key=lambda t: time_to_int(t.get("departure_time", "")))
+
+        # Expand departures of frequency-based trips
+        frequency_departures_by_service: dict[str, list[Departure]] = {}
+        for departure in self.headways.departures_at(stop_id):
+            frequency_departures_by_service.setdefault(departure.service_id, []).append(departure)
+
+        # Find nearby stops, outside of the stop's group
+        stops_in_group = self.gtfs.all_stops_in_group(stop_id)
+        group_ids = {i["stop_id"] for i in stops_in_group}
+        nearby_stops = [
+            i for i in self.gtfs.nearby_stops(stop_id) if i[1]["stop_id"] not in group_ids
+        ]
+
+        # Gather transfers from and to the stop
+        stop_transfers = self.gtfs.transfers.get(stop_id, []) + [
+            i for i in self.gtfs.transfers_to.get(stop_id, []) if i.get("from_stop_id") != stop_id
+        ]
+
+        # Gather pathways of the whole station, and find the path between its nodes (if asked to)
+        station_id = self.gtfs.station_of(stop_id)
+        graph = self.gtfs.station_graphs.get(station_id)
+        path_from = request.args.get("from", stop_id)
+        path_to = request.args.get("to", "")
+        path = graph.shortest_path(path_from, path_to) if graph and path_to else None
+
+        # Calculate colspan
+        colspan = len(self.gtfs.header_of("stop_times"))
+        colspan += trip_short_names is not None
+        colspan += trip_headsigns is not None
+
+        # Render the template
+        return render_template(
+            "stop.html.jinja",
+            missing=False,
+            stop=stop,
+            broken_references=self.gtfs.dangling_columns("stops", stop),
+            stops_header=self.gtfs.header_of("stops"),
+            stops_in_group=stops_in_group,
+            nearby_stops=nearby_stops,
+            nearby_radius=NEARBY_RADIUS,
+            times_header=self.gtfs.header_of("stop_times"),
+            times_by_service=times_by_service,
+            orphaned_times=orphaned_times,
+            trip_short_names=trip_short_names,
+            trip_headsigns=trip_headsigns,
+            times_colspan=colspan,
+            frequency_departures_by_service=frequency_departures_by_service,
+            transfers=stop_transfers,
+            transfers_header=self.gtfs.header_of("transfers"),
+            station_id=station_id,
+            station_nodes=graph.nodes if graph else [],
+            pathways=graph.pathways if graph else [],
+            pathways_header=self.gtfs.header_of("pathways"),
+            path_from=path_from,
+            path_to=path_to,
+            path=path,
+        )
+
+    def route_trip(self, trip_id: str) -> str:
+        # Short circuit for missing trips
+        if trip_id not in self.gtfs.trips:
+            return render_template(
+                "trip.html.jinja",
+                missing=True,
+                trip={"trip_id": trip_id},
+            )
+
+        # Prepare data for rendering
+        trip = self.gtfs.trips[trip_id]
+        times = self.gtfs.stop_times.get(trip_id, [])
+
+        # Missing stops are marked with None
+        stop_names = [
+            (
+                None
+                if self.gtfs.is_dangling("stop_times", "stop_id", i.get("stop_id", ""))
+                else self.gtfs.stops.get(i.get("stop_id", ""), {}).get("stop_name", "")
+            )
+            for i in times
+        ]
+
+        return render_template(
+            "trip.html.jinja",
+            missing=False,
+            trip=trip,
+            broken_references=self.gtfs.dangling_columns("trips", trip),
+            trips_header=self.gtfs.header_of("trips"),
+            times=times,
+            times_header=self.gtfs.header_of("stop_times"),
+            stop_names=stop_names,
+            frequencies=self.gtfs.frequencies.get(trip_id),
+            frequencies_header=self.gtfs.header_of("frequencies"),
+            frequency_starts=self.headways.trip_starts(trip_id),
+            transfers=self.gtfs.transfers_from_trip.get(trip_id),
+            transfers_header=self.gtfs.header_of("transfers"),
+        )
+
+    def route_calendars(self) -> str:
+        return render_template(
+            "calendars.html.jinja",
+            missing=(not self.gtfs.calendar) and (not self.gtfs.calendar_dates),
+            header=self.gtfs.header_of("calendar"),
+            data=self.gtfs.calendar.values(),
+            summary=self.gtfs.calendar_summary,
+            implicit_calendars=[
+                i for i in self.gtfs.calendar_dates if i not in self.gtfs.calendar
+            ],
+        )
+
+    def route_calendar(self, service_id: str) -> str:
+        missing = (
+            service_id not in self.gtfs.calendar and service_id not in self.gtfs.calendar_dates
+        )
+
+        return render_template(
+            "calendar.html.jinja",
+            service_id=service_id,
+            missing=missing,
+            calendar_row=self.gtfs.calendar.get(service_id),
+            calendar_header=self.gtfs.header_of("calendar"),
+            calendar_dates_rows=self.gtfs.calendar_dates.get(service_id),
+            calendar_dates_header=self.gtfs.header_of("calendar_dates"),
+        )
+
+    def route_report(self) -> str:
+        self.report.start()
+        return render_template(
+            "report.html.jinja",
+            ready=self.report.done(),
+            report=self.report.result() if self.report.done() else None,
+        )
+
+    def route_duplicate_stops(self) -> str:
+        self.duplicate_stops.start()
+        return render_template(
+            "duplicate_stops.html.jinja",
+            ready=self.duplicate_stops.done(),
+            clusters=self.duplicate_stops.result() if self.duplicate_stops.done() else None,
+            max_clusters=MAX_DUPLICATE_CLUSTERS,
+            stops=self.gtfs.stops,
+        )
+
+    def route_stats(self) -> str:
+        self.stats.start()
+        return render_template(
+            "stats.html.jinja",
+            ready=self.stats.done(),
+            stats=self.stats.result() if self.stats.done() else None,
+            routes=self.gtfs.routes,
+        )
+
+    def route_diff(self) -> str:
+        if self.diff is not None:
+            self.diff.start()
+        return render_template(
+            "diff.html.jinja",
+            compared=self.diff is not None,
+            ready=self.diff is not None and self.diff.done(),
+            diff=self.diff.result() if self.diff is not None and self.diff.done() else None,
+        )
+
+    def route_integrity(self) -> str:
+        return render_template(
+            "integrity.html.jinja",
+            dangling=self.gtfs.dangling,
+        )
+
+    def route_plan(self) -> str:
+        from_stop_id = request.args.get("from", "")
+        to_stop_id = request.args.get("to", "")
+        day_str = request.args.get("date", "")
+        time_str = request.args.get("time", "")
+
+        error: Optional[str] = None
+        journeys: Optional[list[Journey]] = None
+        if from_stop_id and to_stop_id:
+            try:
+                day = parse_gtfs_date(day_str.replace("-", ""))
+            except ValueError:
+                day = None
+            departure = time_to_int(time_str)
+
+            if from_stop_id not in self.gtfs.stops:
+                error = f"Stop {from_stop_id} doesn't exist"
+            elif to_stop_id not in self.gtfs.stops:
+                error = f"Stop {to_stop_id} doesn't exist"
+            elif day is None:
+                error = f"Invalid date: {day_str!r}"
+            elif departure < 0:
+                error = f"Invalid time: {time_str!r}"
+            else:
+                journeys = self.planner.plan(from_stop_id, to_stop_id, day, departure)
+
+        stop_names = {
+            stop_id: self.gtfs.stops[stop_id].get("stop_name") or stop_id
+            for journey in journeys or []
+            for leg in journey.legs
+            for stop_id in (leg.from_stop_id, leg.to_stop_id)
+            if stop_id in self.gtfs.stops
+        }
+
+        return render_template(
+            "plan.html.jinja",
+            from_stop_id=from_stop_id,
+            to_stop_id=to_stop_id,
+            day=day_str,
+            time=time_str,
+            error=error,
+            journeys=journeys,
+            stop_names=stop_names,
+        )
+
+    # JSON routes for map presentation
+
+    def route_api_map_stops(self) -> Response:
+        return jsonify(
+            [
+                {
+                    "id": stop.get("stop_id"),
+                    "code": stop.get("stop_code"),
+                    "name": stop.get("stop_name"),
+                    "lat": stop.get("stop_lat"),
+                    "lon": stop.get("stop_lon"),
+                }
+                for stop in self.gtfs.stops.values()
+            ]
+        )
+
+    def route_api_map_stop(self, stop_id: str) -> Response:
+        return jsonify(
+            [
+                {
+                    "idx": idx,
+                    "id": stop.get("stop_id"),
+                    "code": stop.get("stop_code"),
+                    "name": stop.get("stop_name"),
+                    "lat": stop.get("stop_lat"),
+                    "lon": stop.get("stop_lon"),
+                }
+                for idx, stop in enumerate(self.gtfs.all_stops_in_group(stop_id))
+            ]
+        )
+
+    def route_api_map_trip(self, trip_id: str) -> Response:
+        stop_to_sequences: dict[str, list[str]] = {}
+        for time in self.gtfs.stop_times.get(trip_id, []):
+            stop_to_sequences.setdefault(time["stop_id"], []).append(time["stop_sequence"])
+
+        stops: list[dict[str, Any]] = []
+        for stop_id, sequences in stop_to_sequences.items():
+            stop = self.gtfs.stops.get(stop_id, {})
+            stops.append(
+                {
+                    "id": stop_id,
+                    "lat": stop.get("stop_lat"),
+                    "lon": stop.get("stop_lon"),
+                    "name": stop.get("stop_name"),
+                    "seq": sequences,
+                }
+            )
+
+        return jsonify(stops)
+
+    def route_api_map_shape(self, shape_id: str) -> Response:
+        return jsonify(self.gtfs.shapes.get(shape_id, []))
+
+    def route_api_map_shapes(self) -> Response:
+        shape_ids = request.args.get("ids", "").split(",")
+        return jsonify(
+            {
+                shape_id: self.gtfs.shapes[shape_id]
+                for shape_id in shape_ids
+                if shape_id in self.gtfs.shapes
+            }
+        )
+
+    def route_api_map_route(self, route_id: str) -> Response:
+        # Different trips usually share shapes and stops - only send every one of those once
+        shape_ids: dict[str, None] = {}
+        trips_at_stop: Counter[str] = Counter()
+        for trip_id in self.gtfs.route_trips.get(route_id, []):
+            shape_id = self.gtfs.trips[trip_id].get("shape_id")
+            if shape_id in self.gtfs.shapes:
+                shape_ids[shape_id] = None
+            trips_at_stop.update(
+                {time["stop_id"] for time in self.gtfs.stop_times.get(trip_id, [])}
+            )
+
+        stops: list[dict[str, Any]] = []
+        for stop_id, trips in trips_at_stop.items():
+            stop = self.gtfs.stops.get(stop_id, {})
+            stops.append(
+                {
+                    "id": stop_id,
+                    "code": stop.get("stop_code"),
+                    "name": stop.get("stop_name"),
+                    "lat": stop.get("stop_lat"),
+                    "lon": stop.get("stop_lon"),
+                    "trips": trips,
+                }
+            )
+
+        return jsonify(
+            {
+                "shapes": {shape_id: self.gtfs.shapes[shape_id] for shape_id in shape_ids},
+                "stops": stops,
+            }
+        )
+
+    # JSON spatial queries
+
+    def route_api_stops_nearby(self) -> Response:
+        # Find out the position to search around
+        stop_id = request.args.get("stop_id", "")
+        try:
+            if stop_id:
+                stop = self.gtfs.stops.get(stop_id)
+                if stop is None:
+                    return Response("unknown stop", status=404)
+                lat = float(stop["stop_lat"])
+                lon = float(stop["stop_lon"])
+            else:
+                lat = float(request.args["lat"])
+                lon = float(request.args["lon"])
+        except (KeyError, ValueError):
+            return Response("missing or invalid position", status=400)
+
+        # Parse the limits
+        try:
+            radius = float(request.args.get("radius", NEARBY_RADIUS))
+            k = int(request.args["k"]) if "k" in request.args else None
+        except ValueError:
+            return Response("invalid radius or k", status=400)
+
+        if k is None:
+            found = self.gtfs.stop_grid.within(lat, lon, radius)
+        else:
+            # NOTE: One more, as the stop itself is going to be skipped
+            found = self.gtfs.stop_grid.nearest(lat, lon, k + bool(stop_id), radius)
+
+        return jsonify(
+            [
+                {
+                    "id": other_id,
+                    "name": self.gtfs.stops[other_id].get("stop_name"),
+                    "lat": self.gtfs.stops[other_id].get("stop_lat"),
+                    "lon": self.gtfs.stops[other_id].get("stop_lon"),
+                    "distance": round(distance, 1),
+                }
+                for distance, other_id in found
+                if other_id != stop_id
+            ][:k]
+        )
+
+    def route_api_pathways_path(self) -> Response:
+        from_stop_id = request.args.get("from", "")
+        to_stop_id = request.args.get("to", "")
+        if not from_stop_id or not to_stop_id:
+            return Response("missing from or to", status=400)
+
+        station_id = self.gtfs.station_of(from_stop_id)
+        if station_id != self.gtfs.station_of(to_stop_id):
+            return Response("stops belong to different stations", status=400)
+
+        graph = self.gtfs.station_graphs.get(station_id)
+        path = graph.shortest_path(from_stop_id, to_stop_id) if graph else None
+        if path is None:
+            return Response("no path between the stops", status=404)
+
+        return jsonify({"station_id": station_id, **path.as_json()})
+
+    # JSON departure data
+
+    def route_api_stop_departures(self, stop_id: str) -> Response:
+        # Parse the date and time window
+        day: Optional[date] = None
+        try:
+            if "date" in request.args:
+                day = parse_gtfs_date(request.args["date"])
+        except ValueError:
+            return Response("invalid date", status=400)
+
+        start = time_to_int(request.args.get("from", "00:00:00"))
+        end = time_to_int(request.args.get("to", "48:00:00"))
+        if start < 0 or end < 0:
+            return Response("invalid time window", status=400)
+
+        # Regular departures, except for the template times of frequency-based trips
+        departures: list[dict[str, Any]] = []
+        for time in self.gtfs.stop_times_by_stops.get(stop_id, []):
+            trip = self.gtfs.trips.get(time["trip_id"])
+            if trip is None or trip["trip_id"] in self.gtfs.frequencies:
+                continue
+            elif day is not None and day not in self.gtfs.service_dates(trip["service_id"]):
+                continue
+            elif not start <= time_to_int(time.get("departure_time", "")) < end:
+                continue
+
+            departures.append(
+                {
+                    "trip_id": trip["trip_id"],
+                    "service_id": trip["service_id"],
+                    "stop_id": stop_id,
+                    "stop_sequence": time.get("stop_sequence", ""),
+                    "arrival_time": time.get("arrival_time", ""),
+                    "departure_time": time.get("departure_time", ""),
+                    "frequency_based": False,
+                }
+            )
+
+        # Virtual departures of frequency-based trips
+        for departure in self.headways.departures_at(stop_id, start, end, day):
+            departures.append({**departure.as_json(), "frequency_based": True})
+
+        departures.sort(key=lambda d: time_to_int(d["departure_time"]))
+        return jsonify(departures)
+
+    # JSON validation report
+
+    def route_api_report(self) -> Response:
+        self.report.start()
+        if not self.report.done():
+            return Response(status=202)
+        return jsonify(self.report.result().as_json())
+
+    def route_api_duplicate_stops(self) -> Response:
+        self.duplicate_stops.start()
+        if not self.duplicate_stops.done():
+            return Response(status=202)
+        return jsonify([i.as_json() for i in self.duplicate_stops.result()])
+
+    # JSON feed statistics
+
+    def route_api_stats(self) -> Response:
+        self.stats.start()
+        if not self.stats.done():
+            return Response(status=202)
+        return jsonify(self.stats.result().as_json())
+
+    # JSON server metrics
+
+    def route_api_metrics(self) -> Response:
+        return jsonify(
+            {
+                "row_fragments": self.fragments.as_json(),
+                "compression_cache": self.compressed.as_json(),
+            }
+        )
+
+    # JSON feed diff
+
+    def route_api_memory(self) -> Response:
+        return jsonify(self.memory.as_json())
+
+    def route_api_diff(self) -> Response:
+        if self.diff is None:
+            return Response(status=404)
+        self.diff.start()
+        if not self.diff.done():
+            return Response(status=202)
+        return jsonify(self.diff.result().as_json())
+
+    # JSON block data
+
+    def route_api_block(self, block_id: str) -> Response:
+        analysis = self.blocks.analyze(block_id)
+        if analysis is None:
+            return Response(status=404)
+        return jsonify(analysis.as_json())
+
+    # JSON calendar data
+
+    def route_api_calendar_dates(self, service_id: str) -> Response:
+        return jsonify([i.isoformat() for i in self.gtfs.all_dates_of(service_id)])
+
+    def route_api_calendar_summary(self) -> Response:
+        return jsonify(self.gtfs.calendar_summary.as_json())
+
+    # Main entry point
+
+    def run(self, debug: bool = False) -> None:
+        # Validate the feed (compute its statistics and compare it) in the background,
+        # so that the report, stats and diff pages open instantly
+        self.report.start()
+        self.duplicate_stops.start()
+        self.stats.start()
+        if self.diff is not None:
+            self.diff.start()
+        self.memory.start()
+        return self.flask.run(load_dotenv=False, debug=debug, use_evalex=False)
+
+
+def make_app() -> Flask:
+    # Parse the arguments
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("file", type=Path, help="path to GTFS directory/zip")
+    args = arg_parser.parse_args()
+
+    # Load GTFS data
+    gtfs = Gtfs.from_user_input(args.file)
+
+    # Create the application
+    app = Application(gtfs)
+
+    # Return the created Flask instance
+    return app.flask
@@ -0,0 +1,219 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Optional
+
+from . import valid
+from .gtfs import Gtfs, Point
+from .memory import estimate_size
+from .util import haversine
+
+MAX_DEADHEAD_SPEED = 100 / 3.6
+"""Maximum speed (in m/s) at which a vehicle may travel between two consecutive trips
+of a block, before the connection is considered to be a teleport."""
+
+TELEPORT_TOLERANCE = 200.0
+"""Distance (in meters) between the last stop of a trip and the first stop of the next one,
+below which the connection is never considered to be a teleport."""
+
+
+@dataclass
+class BlockLink:
+    """BlockLink describes how a vehicle gets from one trip of a block to the next one."""
+
+    from_trip_id: str
+    to_trip_id: str
+    from_stop_id: str
+    to_stop_id: str
+
+    layover: Optional[int]
+    """Time (in seconds) between the arrival of the first trip and the departure
+    of the next one, or None if any of those times is unknown"""
+
+    distance: Optional[float]
+    """Distance (in meters) between `from_stop_id` and `to_stop_id`, if it's known"""
+
+    overlap: bool = False
+    """Set if the next trip departs before the first one arrives"""
+
+    teleport: bool = False
+    """Set if the vehicle would have to move unrealistically fast between the trips"""
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "from_trip_id": self.from_trip_id,
+            "to_trip_id": self.to_trip_id,
+            "from_stop_id": self.from_stop_id,
+            "to_stop_id": self.to_stop_id,
+            "layover": self.layover,
+            "distance": self.distance,
+            "overlap": self.overlap,
+            "teleport": self.teleport,
+        }
+
+
+@dataclass
+class BlockDay:
+    """BlockDay describes the chain of trips a block operates on a set of service days
+    on which exactly the same trips are active."""
+
+    dates: list[date]
+    trip_ids: list[str]
+    links: list[BlockLink] = field(default_factory=list)
+
+    @property
+    def has_issues(self) -> bool:
+        return any(link.overlap or link.teleport for link in self.links)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "dates": [i.isoformat() for i in self.dates],
+            "trip_ids": self.trip_ids,
+            "links": [i.as_json() for i in self.links],
+        }
+
+
+@dataclass
+class BlockAnalysis:
+    """BlockAnalysis holds the vehicle-chaining analysis of a single block."""
+
+    block_id: str
+    trip_ids: list[str]
+    """All trips of the block, ordered by their first departure"""
+
+    days: list[BlockDay]
+
+    @property
+    def has_issues(self) -> bool:
+        return any(day.has_issues for day in self.days)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "block_id": self.block_id,
+            "trip_ids": self.trip_ids,
+            "has_issues": self.has_issues,
+            "days": [i.as_json() for i in self.days],
+        }
+
+
+class BlockEngine:
+    """BlockEngine analyzes blocks of a Gtfs instance (based on its `blocks` index),
+    caching the results for every block."""
+
+    def __init__(self, gtfs: Gtfs) -> None:
+        self.gtfs = gtfs
+        self._cache: dict[str, BlockAnalysis] = {}
+        self._lock = threading.Lock()
+
+    def analyze(self, block_id: str) -> Optional[BlockAnalysis]:
+        """Returns the BlockAnalysis of a particular block,
+        or None if no trips belong to the block."""
+        with self._lock:
+            analysis = self._cache.get(block_id)
+
+        if analysis is None:
+            trip_ids = self.gtfs.blocks.get(block_id)
+            if not trip_ids:
+                return None
+
+            analysis = BlockAnalysis(block_id, trip_ids, self._days_of(trip_ids))
+            with self._lock:
+                self._cache[block_id] = analysis
+
+        return analysis
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def estimated_size(self) -> int:
+        with self._lock:
+            return estimate_size(self._cache)
+
+    def _days_of(self, trip_ids: list[str]) -> list[BlockDay]:
+        # Find out which services are active on every date
+        services = {self.gtfs.trips[trip_id].get("service_id", "") for trip_id in trip_ids}
+        services_by_date: dict[date, set[str]] = {}
+        for service_id in services:
+            for day in self.gtfs.service_dates(service_id):
+                services_by_date.setdefault(day, set()).add(service_id)
+
+        # Group dates on which the same services are active
+        dates_by_services: dict[frozenset[str], list[date]] = {}
+        for day, day_services in sorted(services_by_date.items()):
+            dates_by_services.setdefault(frozenset(day_services), []).append(day)
+
+        # Without any calendars, at least analyze all of the block's trips together
+        if not dates_by_services:
+            dates_by_services[frozenset(services)] = []
+
+        days: list[BlockDay] = []
+        for day_services, dates in dates_by_services.items():
+            day_trips = [
+                i for i in trip_ids if self.gtfs.trips[i].get("service_id", "") in day_services
+            ]
+            days.append(BlockDay(dates, day_trips, self._links_between(day_trips)))
+
+        return days
+
+    def _links_between(self, trip_ids: list[str]) -> list[BlockLink]:
+        links: list[BlockLink] = []
+
+        for from_trip_id, to_trip_id in zip(trip_ids, trip_ids[1:]):
+            from_times = self.gtfs.stop_times.get(from_trip_id)
+            to_times = self.gtfs.stop_times.get(to_trip_id)
+            if not from_times or not to_times:
+                continue
+
+            from_stop_id = from_times[-1].get("stop_id", "")
+            to_stop_id = to_times[0].get("stop_id", "")
+
+            arrival = self.gtfs.trip_summary(from_trip_id).last_arrival
+            departure = self.gtfs.trip_summary(to_trip_id).first_departure
+            layover = departure - arrival if arrival >= 0 and departure >= 0 else None
+
+            distance: Optional[float] = None
+            if from_stop_id != to_stop_id:
+                from_pt = self._stop_position(from_stop_id)
+                to_pt = self._stop_position(to_stop_id)
+                if from_pt is not None and to_pt is not None:
+                    distance = haversine(from_pt, to_pt)
+            else:
+                distance = 0.0
+
+            link = BlockLink(from_trip_id, to_trip_id, from_stop_id, to_stop_id, layover, distance)
+            link.overlap = layover is not None and layover < 0
+            link.teleport = (
+                layover is not None
+                and distance is not None
+                and distance > TELEPORT_TOLERANCE
+                and distance > max(layover, 0) * MAX_DEADHEAD_SPEED
+            )
+            links.append(link)
+
+        return links
+
+    def _stop_position(self, stop_id: str) -> Optional[Point]:
+        stop = self.gtfs.stops.get(stop_id)
+        if stop is None:
+            return None
+
+        lat = valid.latitude(stop.get("stop_lat", ""))
+        lon = valid.longitude(stop.get("stop_lon", ""))
+        return (lat, lon) if lat is not None and lon is not None else None
@@ -14,326 +14,261 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# NOTE: Only the lightest modules are imported here, so that `jvig --version`,
+#       `jvig COMMAND --help` and argument errors are instant. Everything else
+#       (Flask, Jinja and the GTFS machinery) is only imported by the commands that need it.
+
 import argparse
+import json
+import sys
 from pathlib import Path
-from typing import Any, Optional
-
-from flask import Flask, jsonify, render_template
-from flask.wrappers import Response
+from typing import Any, Callable, Optional
 
 from .__version__ import __version__
-from .gtfs import Gtfs, Row
-from .tables import agency, calendar, calendar_dates, frequencies, routes, stops, times, trips
-from .util import time_to_int, to_js_literal
-
-
-class Application:
-    def __init__(self, gtfs: Gtfs) -> None:
-        self.gtfs = gtfs
-        self.flask = Flask(__name__)
-        self._init_app()
-
-    def _init_app(self) -> None:
-        self._init_template_functions()
-        self._init_html_routes()
-        self._init_api_routes()
-
-    def _init_template_functions(self) -> None:
-        # Apply template filters
-        self.flask.add_template_global(agency.header_class, "agency_header_class")
-        self.flask.add_template_global(routes.header_class, "routes_header_class")
-        self.flask.add_template_global(routes.format_cell, "routes_format_cell")
-        self.flask.add_template_global(stops.header_class, "stops_header_class")
-        self.flask.add_template_global(stops.format_cell, "stops_format_cell")
-        self.flask.add_template_global(trips.header_class, "trips_header_class")
-        self.flask.add_template_global(trips.format_cell, "trips_format_cell")
-        self.flask.add_template_global(times.header_class, "times_header_class")
-        self.flask.add_template_global(times.format_cell, "times_format_cell")
-        self.flask.add_template_global(frequencies.header_class, "frequencies_header_class")
-        self.flask.add_template_global(frequencies.format_cell, "frequencies_format_cell")
-        self.flask.add_template_global(calendar.header_class, "calendar_header_class")
-        self.flask.add_template_global(calendar.format_cell, "calendar_format_cell")
-        self.flask.add_template_global(calendar_dates.header_class, "calendar_dates_header_class")
-        self.flask.add_template_global(calendar_dates.format_cell, "calendar_dates_format_cell")
-
-        # Helper functions
-        self.flask.add_template_global(to_js_literal, "to_js_literal")
-        self.flask.add_template_global(
-            lambda trip_id: self.gtfs.stop_times[trip_id][0]["departure_time"],  # type: ignore
-            "trip_first_time",
-        )
-        self.flask.add_template_global(
-            lambda trip_id: self.gtfs.stop_times[trip_id][-1]["departure_time"],  # type: ignore
-            "trip_last_time",
-        )
 
-    def _init_html_routes(self) -> None:
-        self.flask.add_url_rule("/", view_func=self.route_agency)
-        self.flask.add_url_rule("/agency", view_func=self.route_agency)
-        self.flask.add_url_rule("/agency/<path:agency_id>", view_func=self.route_routes)
-        self.flask.add_url_rule("/routes", view_func=self.route_routes)
-        self.flask.add_url_rule("/stops", view_func=self.route_stops)
-        self.flask.add_url_rule("/route/<path:route_id>", view_func=self.route_trips)
-        self.flask.add_url_rule("/block/<path:block_id>", view_func=self.route_trips)
-        self.flask.add_url_rule("/stop/<path:stop_id>", view_func=self.route_stop)
-        self.flask.add_url_rule("/trip/<path:trip_id>", view_func=self.route_trip)
-        self.flask.add_url_rule("/calendars", view_func=self.route_calendars)
-        self.flask.add_url_rule("/calendar/<path:service_id>", view_func=self.route_calendar)
-
-    def _init_api_routes(self) -> None:
-        self.flask.add_url_rule("/api/map/stops", view_func=self.route_api_map_stops)
-        self.flask.add_url_rule("/api/map/stop/<path:stop_id>", view_func=self.route_api_map_stop)
-        self.flask.add_url_rule("/api/map/trip/<path:trip_id>", view_func=self.route_api_map_trip)
-        self.flask.add_url_rule(
-            "/api/map/shape/<path:shape_id>",
-            view_func=self.route_api_map_shape,
-        )
-        self.flask.add_url_rule(
-            "/api/calendar/days/<path:service_id>",
-            view_func=self.route_api_calendar_dates,
-        )
 
-    # HTML routes
+def __getattr__(name: str) -> Any:
+    # The Application used to be defined in this module
+    if name in {"Application", "make_app"}:
+        from . import app
 
-    def route_agency(self) -> str:
-        return render_template(
-            "agency.html.jinja",
-            missing=not self.gtfs.agency,
-            header=self.gtfs.header_of("agency"),
-            data=self.gtfs.agency.values(),
-        )
+        return getattr(app, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    def route_routes(self, agency_id: Optional[str] = None) -> str:
-        if agency_id:
-            data = filter(lambda row: row["agency_id"] == agency_id, self.gtfs.routes.values())
-        else:
-            data = self.gtfs.routes.values()
-
-        return render_template(
-            "routes.html.jinja",
-            missing=not self.gtfs.routes,
-            header=self.gtfs.header_of("routes"),
-            data=data,
-        )
 
-    def route_stops(self) -> str:
-        return render_template(
-            "stops.html.jinja",
-            missing=not self.gtfs.stops,
-            header=self.gtfs.header_of("stops"),
-            data=self.gtfs.stops.values(),
-        )
+def validate(argv: list[str]) -> int:
+    from .gtfs import Gtfs
+    from .report import DEFAULT_MAX_EXAMPLES, validate_feed
 
-    def route_trips(self, route_id: Optional[str] = None, block_id: Optional[str] = None) -> str:
-        if route_id:
-            data = filter(lambda row: row["route_id"] == route_id, self.gtfs.trips.values())
-        elif block_id:
-            data = filter(lambda row: row["block_id"] == block_id, self.gtfs.trips.values())
-        else:
-            raise RuntimeError("Trips view must be filtered by either a block_id or route_id")
-
-        return render_template(
-            "trips.html.jinja",
-            missing=not self.gtfs.trips,
-            header=self.gtfs.header_of("trips"),
-            data=data,
-        )
+    # Parse the arguments
+    arg_parser = argparse.ArgumentParser(
+        prog="jvig validate",
+        description="check every field of a GTFS feed",
+    )
+    arg_parser.add_argument("file", type=Path, help="path to GTFS directory/zip")
+    arg_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["text", "json", "html"],
+        default="text",
+        help="format of the report (default: text)",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    arg_parser.add_argument(
+        "-n",
+        "--max-examples",
+        type=int,
+        default=DEFAULT_MAX_EXAMPLES,
+        help=f"offending rows listed for every issue (default: {DEFAULT_MAX_EXAMPLES})",
+    )
+    args = arg_parser.parse_args(argv)
 
-    def route_stop(self, stop_id: str) -> str:
-        # Special case for missing stops
-        if stop_id not in self.gtfs.stops:
-            return render_template(
-                "stop.html.jinja",
-                missing=True,
-                stop={"stop_id": stop_id},
-            )
-
-        stop = self.gtfs.stops[stop_id]
-
-        # Gather the stop_times of this stop,
-        # and their trip_short_names and trip_headsigns
-        times_by_service: dict[str, list[Row]] = {}
-        trip_short_names: Optional[dict[str, str]] = (
-            {} if "trip_short_name" in self.gtfs.header_of("trips") else None
-        )
-        trip_headsigns: Optional[dict[str, str]] = (
-            {} if "trip_headsign" in self.gtfs.header_of("trips") else None
-        )
+    # Load GTFS data and validate it
+    gtfs = Gtfs.from_user_input(args.file)
+    report = validate_feed(gtfs, args.processes, args.max_examples)
 
-        for time in self.gtfs.stop_times_by_stops.get(stop_id, []):
-            if time["trip_id"] not in self.gtfs.trips:
-                continue
-            trip = self.gtfs.trips[time["trip_id"]]
-
-            times_by_service.setdefault(trip["service_id"], []).append(time)
-
-            if trip_short_names is not None:
-                trip_short_names[trip["trip_id"]] = trip["trip_short_name"]
-            if trip_headsigns is not None:
-                trip_headsigns[trip["trip_id"]] = trip["trip_headsign"]
-
-        # Ensure times_by_service are ordered by the departure time
-        for lst in times_by_service.values():
-            lst.sort(key=lambda t: time_to_int(t.get("departure_time", "")))
-
-        # Calculate colspan
-        colspan = len(self.gtfs.header_of("stop_times"))
-        colspan += trip_short_names is not None
-        colspan += trip_headsigns is not None
-
-        # Render the template
-        return render_template(
-            "stop.html.jinja",
-            missing=False,
-            stop=stop,
-            stops_header=self.gtfs.header_of("stops"),
-            stops_in_group=self.gtfs.all_stops_in_group(stop_id),
-            times_header=self.gtfs.header_of("stop_times"),
-            times_by_service=times_by_service,
-            trip_short_names=trip_short_names,
-            trip_headsigns=trip_headsigns,
-            times_colspan=colspan,
-        )
+    # Print the report
+    if args.format == "json":
+        json.dump(report.as_json(), sys.stdout, indent=2)
+        print()
+    elif args.format == "html":
+        from flask import render_template
 
-    def route_trip(self, trip_id: str) -> str:
-        # Short circuit for missing trips
-        if trip_id not in self.gtfs.trips:
-            return render_template(
-                "trip.html.jinja",
-                missing=True,
-                trip={"trip_id": trip_id},
-            )
-
-        # Prepare data for rendering
-        trip = self.gtfs.trips[trip_id]
-        times = self.gtfs.stop_times.get(trip_id, [])
-
-        stop_names = [
-            self.gtfs.stops.get(i.get("stop_id", ""), {}).get("stop_name", "") for i in times
-        ]
-
-        return render_template(
-            "trip.html.jinja",
-            missing=False,
-            trip=trip,
-            trips_header=self.gtfs.header_of("trips"),
-            times=times,
-            times_header=self.gtfs.header_of("stop_times"),
-            stop_names=stop_names,
-            frequencies=self.gtfs.frequencies.get(trip_id),
-            frequencies_header=self.gtfs.header_of("frequencies"),
-        )
+        from .app import Application
 
-    def route_calendars(self) -> str:
-        return render_template(
-            "calendars.html.jinja",
-            missing=(not self.gtfs.calendar) and (not self.gtfs.calendar_dates),
-            header=self.gtfs.header_of("calendar"),
-            data=self.gtfs.calendar.values(),
-            implicit_calendars=[
-                i for i in self.gtfs.calendar_dates if i not in self.gtfs.calendar
-            ],
-        )
+        app = Application(gtfs)
+        with app.flask.app_context():
+            print(render_template("report.html.jinja", ready=True, report=report))
+    else:
+        print(report.as_text())
 
-    def route_calendar(self, service_id: str) -> str:
-        missing = (
-            service_id not in self.gtfs.calendar and service_id not in self.gtfs.calendar_dates
-        )
+    return 1 if report.total_issues else 0
 
-        return render_template(
-            "calendar.html.jinja",
-            service_id=service_id,
-            missing=missing,
-            calendar_row=self.gtfs.calendar.get(service_id),
-            calendar_header=self.gtfs.header_of("calendar"),
-            calendar_dates_rows=self.gtfs.calendar_dates.get(service_id),
-            calendar_dates_header=self.gtfs.header_of("calendar_dates"),
-        )
 
-    # JSON routes for map presentation
-
-    def route_api_map_stops(self) -> Response:
-        return jsonify(
-            [
-                {
-                    "id": stop.get("stop_id"),
-                    "code": stop.get("stop_code"),
-                    "name": stop.get("stop_name"),
-                    "lat": stop.get("stop_lat"),
-                    "lon": stop.get("stop_lon"),
-                }
-                for stop in self.gtfs.stops.values()
-            ]
-        )
+def export(argv: list[str]) -> int:
+    from .export import export_feed
+
+    # Parse the arguments
+    arg_parser = argparse.ArgumentParser(
+        prog="jvig export",
+        description="render all pages of a GTFS feed into a static website",
+    )
+    arg_parser.add_argument("file", type=Path, help="path to GTFS directory/zip")
+    arg_parser.add_argument("output", type=Path, help="path to the output directory")
+    arg_parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    args = arg_parser.parse_args(argv)
+
+    # Export the feed
+    stats = export_feed(args.file, args.output, args.processes)
+    print(stats.as_text())
+    return 1 if stats.failed else 0
 
-    def route_api_map_stop(self, stop_id: str) -> Response:
-        return jsonify(
-            [
-                {
-                    "idx": idx,
-                    "id": stop.get("stop_id"),
-                    "code": stop.get("stop_code"),
-                    "name": stop.get("stop_name"),
-                    "lat": stop.get("stop_lat"),
-                    "lon": stop.get("stop_lon"),
-                }
-                for idx, stop in enumerate(self.gtfs.all_stops_in_group(stop_id))
-            ]
-        )
 
-    def route_api_map_trip(self, trip_id: str) -> Response:
-        stop_to_sequences: dict[str, list[str]] = {}
-        for time in self.gtfs.stop_times.get(trip_id, []):
-            stop_to_sequences.setdefault(time["stop_id"], []).append(time["stop_sequence"])
+def diff(argv: list[str]) -> int:
+    from .diff import diff_gtfs, diff_streaming
+    from .gtfs import Gtfs
 
-        stops: list[dict[str, Any]] = []
-        for stop_id, sequences in stop_to_sequences.items():
-            stop = self.gtfs.stops.get(stop_id, {})
-            stops.append(
-                {
-                    "id": stop_id,
-                    "lat": stop.get("stop_lat"),
-                    "lon": stop.get("stop_lon"),
-                    "name": stop.get("stop_name"),
-                    "seq": sequences,
-                }
-            )
+    # Parse the arguments
+    arg_parser = argparse.ArgumentParser(
+        prog="jvig diff",
+        description="list added, removed and modified entities between two GTFS feeds",
+    )
+    arg_parser.add_argument("old", type=Path, help="path to the older GTFS directory/zip")
+    arg_parser.add_argument("new", type=Path, help="path to the newer GTFS directory/zip")
+    arg_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["text", "json", "html"],
+        default="text",
+        help="format of the diff (default: text)",
+    )
+    arg_parser.add_argument(
+        "-s",
+        "--streaming",
+        action="store_true",
+        help="compare the files directly, without loading the feeds into memory",
+    )
+    args = arg_parser.parse_args(argv)
 
-        return jsonify(stops)
+    # Compare the feeds
+    new_gtfs: Optional[Gtfs] = None
+    if args.streaming:
+        result = diff_streaming(args.old, args.new)
+    else:
+        new_gtfs = Gtfs.from_user_input(args.new)
+        result = diff_gtfs(Gtfs.from_user_input(args.old), new_gtfs)
 
-    def route_api_map_shape(self, shape_id: str) -> Response:
-        return jsonify(self.gtfs.shapes.get(shape_id, []))
+    # Print the diff
+    if args.format == "json":
+        json.dump(result.as_json(), sys.stdout, indent=2)
+        print()
+    elif args.format == "html":
+        from flask import render_template
 
-    # JSON calendar data
+        from .app import Application
 
-    def route_api_calendar_dates(self, service_id: str) -> Response:
-        return jsonify([i.isoformat() for i in self.gtfs.all_dates_of(service_id)])
+        app = Application(new_gtfs or Gtfs())
+        with app.flask.app_context():
+            print(render_template("diff.html.jinja", compared=True, ready=True, diff=result))
+    else:
+        print(result.as_text())
 
-    # Main entry point
+    return 1 if result.has_changes else 0
 
-    def run(self, debug: bool = False) -> None:
-        return self.flask.run(load_dotenv=False, debug=debug, use_evalex=False)
 
+def transfers(argv: list[str]) -> int:
+    import csv
+
+    from .gtfs import Gtfs
+    from .planner import MAX_WALK_DISTANCE, walking_transfers
 
-def make_app() -> Flask:
     # Parse the arguments
-    arg_parser = argparse.ArgumentParser()
+    arg_parser = argparse.ArgumentParser(
+        prog="jvig transfers",
+        description="print candidate walking transfers between nearby stops, as transfers.txt",
+    )
     arg_parser.add_argument("file", type=Path, help="path to GTFS directory/zip")
-    args = arg_parser.parse_args()
+    arg_parser.add_argument(
+        "-d",
+        "--max-distance",
+        type=float,
+        default=MAX_WALK_DISTANCE,
+        help=f"maximum walking distance, in meters (default: {MAX_WALK_DISTANCE:.0f})",
+    )
+    args = arg_parser.parse_args(argv)
 
-    # Load GTFS data
+    # Load GTFS data and print the transfers (in both directions)
     gtfs = Gtfs.from_user_input(args.file)
+    w = csv.writer(sys.stdout)
+    w.writerow(("from_stop_id", "to_stop_id", "transfer_type", "min_transfer_time"))
+    for a, b, duration in walking_transfers(gtfs, args.max_distance):
+        w.writerow((a, b, "2", str(duration)))
+        w.writerow((b, a, "2", str(duration)))
 
-    # Create the application
-    app = Application(gtfs)
+    return 0
+
+
+def serve(argv: list[str]) -> int:
+    from .serve import DEFAULT_MEMORY_LIMIT, FeedPool, FeedServer, find_feeds
+    from .snapshot import default_snapshot_dir
+
+    # Parse the arguments
+    arg_parser = argparse.ArgumentParser(
+        prog="jvig serve",
+        description="view all GTFS feeds from a directory, each one under /feed/NAME/",
+    )
+    arg_parser.add_argument("directory", type=Path, help="directory with GTFS zips/directories")
+    arg_parser.add_argument(
+        "-m",
+        "--memory-limit",
+        type=int,
+        default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+        metavar="MB",
+        help="estimated memory usage of loaded feeds, above which feeds are unloaded "
+        "(default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--snapshot-dir",
+        type=Path,
+        default=default_snapshot_dir(),
+        help="directory with snapshots of loaded feeds (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--no-snapshots",
+        action="store_true",
+        help="always load feeds from their .txt files",
+    )
+    arg_parser.add_argument(
+        "-d",
+        "--debug",
+        action="store_true",
+        help="enable the debugger",
+    )
+    args = arg_parser.parse_args(argv)
 
-    # Return the created Flask instance
-    return app.flask
+    # Create the server and run it
+    pool = FeedPool(
+        find_feeds(args.directory),
+        args.memory_limit * 1024 * 1024,
+        None if args.no_snapshots else args.snapshot_dir,
+    )
+    FeedServer(pool).run(args.debug)
+    return 0
 
 
-def main() -> int:
+COMMANDS: dict[str, Callable[[list[str]], int]] = {
+    "validate": validate,
+    "export": export,
+    "diff": diff,
+    "serve": serve,
+    "transfers": transfers,
+}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Dispatch subcommands
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
     # Parse the arguments
-    arg_parser = argparse.ArgumentParser()
+    arg_parser = argparse.ArgumentParser(
+        epilog=f"other commands: {', '.join(COMMANDS)} (see jvig COMMAND --help)",
+    )
     arg_parser.add_argument("file", type=Path, help="path to GTFS directory/zip")
     arg_parser.add_argument(
         "-d",
@@ -341,14 +276,52 @@ def main() -> int:
         action="store_true",
         help="enable debug mode in Flask",
     )
+    arg_parser.add_argument(
+        "-c",
+        "--compare",
+        type=Path,
+        metavar="OLD_FILE",
+        help="older version of the feed, changes from which are shown at /diff",
+    )
+    arg_parser.add_argument(
+        "-m",
+        "--memory-limit",
+        type=int,
+        metavar="MB",
+        help="keep stop_times on disk, using about MB megabytes of memory to sort them "
+        "(for feeds too big to fit in memory)",
+    )
+    arg_parser.add_argument(
+        "-b",
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="estimated memory usage of the loaded feed, above which caches and indexes "
+        "are released (and rebuilt when needed)",
+    )
     arg_parser.add_argument("-V", "--version", action="version", version=f"jvig {__version__}")
-    args = arg_parser.parse_args()
+    args = arg_parser.parse_args(argv)
+
+    from .app import Application
+    from .diff import diff_streaming
+    from .gtfs import Gtfs
+    from .util import BackgroundTask
 
     # Load GTFS data
-    gtfs = Gtfs.from_user_input(args.file)
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit is not None else None
+    gtfs = Gtfs.from_user_input(args.file, memory_limit)
 
     # Create the application
-    app = Application(gtfs)
+    app = Application(
+        gtfs,
+        args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+    )
+    if args.compare:
+        # The older feed is never loaded - only its fingerprints are kept in memory
+        app.diff = BackgroundTask(
+            lambda: diff_streaming(args.compare, args.file),
+            name="jvig-diff",
+        )
 
     # Run it
     app.run(args.debug)
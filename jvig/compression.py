@@ -0,0 +1,137 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024
+"""Responses smaller than this (in bytes) are never compressed"""
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/plain",
+}
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+SUPPORTED_ENCODINGS: tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+"""Supported content codings, in the order of preference.
+Brotli is only available if the optional brotli package is installed."""
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Picks the preferred supported content coding from an Accept-Encoding header value.
+    Returns None if the response shouldn't be compressed."""
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+
+        accepted[coding] = q
+
+    best: Optional[str] = None
+    best_q = 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best = coding
+            best_q = q
+    return best
+
+
+def compress(data: bytes, encoding: str, thorough: bool = False) -> bytes:
+    """Compresses data with the provided content coding.
+    Set `thorough` for payloads which are compressed once, but sent many times."""
+    if encoding == "br":
+        assert brotli is not None
+        return brotli.compress(data, quality=9 if thorough else 4)  # type: ignore
+    elif encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if thorough else 6, mtime=0)
+    else:
+        raise ValueError(f"unsupported content coding: {encoding}")
+
+
+class CompressedPayload(NamedTuple):
+    data: bytes
+    encoding: str
+    content_type: str
+
+
+class CompressionCache:
+    """CompressionCache keeps compressed bodies of responses which never change
+    for a loaded feed, so that each of them is only compressed once.
+
+    Entries are keyed by (path, content coding), and least recently used entries
+    are evicted once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[tuple[str, str], CompressedPayload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, encoding: str) -> Optional[CompressedPayload]:
+        with self._lock:
+            payload = self._entries.get((path, encoding))
+            if payload is not None:
+                self._entries.move_to_end((path, encoding))
+            return payload
+
+    def put(self, path: str, encoding: str, payload: CompressedPayload) -> None:
+        if len(payload.data) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop((path, encoding), None)
+            if old is not None:
+                self.size -= len(old.data)
+
+            self._entries[path, encoding] = payload
+            self.size += len(payload.data)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def as_json(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
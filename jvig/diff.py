@@ -0,0 +1,297 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from io import TextIOWrapper
+from itertools import chain
+from operator import itemgetter
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, NamedTuple, Optional
+
+from .gtfs import TABLE_KEYS, Gtfs, Row
+
+DIGEST_MASK = (1 << 128) - 1
+
+Fingerprints = dict[str, list[int]]
+"""Maps keys of entities to digests of every table describing them (see Entity.tables)"""
+
+
+class Entity(NamedTuple):
+    """Entity describes a kind of compared objects, identified by a key
+    shared by all of its `tables` (see TABLE_KEYS)."""
+
+    name: str
+    tables: tuple[str, ...]
+
+    defined_by: int = 1
+    """Number of leading `tables`, a row in any of which makes the entity exist"""
+
+    def exists(self, fingerprint: list[int]) -> bool:
+        return any(fingerprint[: self.defined_by])
+
+
+ENTITIES: tuple[Entity, ...] = (
+    Entity("agency", ("agency",)),
+    Entity("stops", ("stops",)),
+    Entity("routes", ("routes",)),
+    Entity("trips", ("trips", "stop_times", "frequencies")),
+    Entity("calendars", ("calendar", "calendar_dates"), defined_by=2),
+    Entity("shapes", ("shapes",)),
+)
+
+
+Columns = dict[str, list[str]]
+"""Maps table names to the (sorted) union of their columns in both compared feeds.
+Hashing values in the same column order makes rows from feeds with different headers
+comparable: columns missing from one of the feeds are treated as empty."""
+
+
+def _digest(values: Iterable[str]) -> int:
+    """Computes a 128-bit digest of a row's values"""
+    text = "\x1f".join(values)
+    return int.from_bytes(blake2b(text.encode("utf-8"), digest_size=16).digest(), "little")
+
+
+def _add_digest(fingerprints: Fingerprints, key: str, part: int, parts: int, digest: int) -> None:
+    # Digests of rows are summed, which makes the fingerprint
+    # independent of the order of rows in the table
+    fingerprint = fingerprints.get(key)
+    if fingerprint is None:
+        fingerprint = [0] * parts
+        fingerprints[key] = fingerprint
+    fingerprint[part] = (fingerprint[part] + digest) & DIGEST_MASK
+
+
+# Fingerprints of loaded feeds
+
+
+def _rows_of(gtfs: Gtfs, table_name: str) -> Iterator[Row]:
+    table = getattr(gtfs, table_name)
+    if table and isinstance(next(iter(table.values())), list):
+        return chain.from_iterable(table.values())
+    return iter(table.values())
+
+
+def _gtfs_columns(old: Gtfs, new: Gtfs) -> Columns:
+    return {
+        table_name: sorted({*old.header_of(table_name), *new.header_of(table_name)})
+        for entity in ENTITIES
+        for table_name in entity.tables
+        if table_name != "shapes"
+    }
+
+
+def fingerprint_gtfs(gtfs: Gtfs, entity: Entity, columns: Columns) -> Fingerprints:
+    """Computes fingerprints of all entities of a kind from a loaded feed."""
+    fingerprints: Fingerprints = {}
+    parts = len(entity.tables)
+
+    for part, table_name in enumerate(entity.tables):
+        # Shapes are only kept as lists of points
+        if table_name == "shapes":
+            for shape_id, points in gtfs.shapes.items():
+                digest = _digest(f"{lat}\x1e{lon}" for lat, lon in points)
+                _add_digest(fingerprints, shape_id, part, parts, digest)
+            continue
+
+        key_column = TABLE_KEYS[table_name]
+        table_columns = columns[table_name]
+        for row in _rows_of(gtfs, table_name):
+            digest = _digest([row.get(i) or "" for i in table_columns])
+            _add_digest(fingerprints, row[key_column], part, parts, digest)
+
+    return fingerprints
+
+
+# Fingerprints of feeds streamed straight from the files
+
+
+@contextmanager
+def _open_table(where: Path, table_name: str) -> Iterator[Optional[IO[str]]]:
+    """Opens a table of a GTFS feed (zip archive or directory) for reading.
+    Yields None if the table doesn't exist."""
+    if where.is_file():
+        with zipfile.ZipFile(where, mode="r") as archive:
+            try:
+                info = archive.getinfo(f"{table_name}.txt")
+            except KeyError:
+                yield None
+                return
+
+            with archive.open(info, mode="r") as binary_stream:
+                yield TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+
+    else:
+        path = where / f"{table_name}.txt"
+        if not path.is_file():
+            yield None
+            return
+
+        with path.open(mode="r", encoding="utf-8-sig", newline="") as stream:
+            yield stream
+
+
+def _read_header(where: Path, table_name: str) -> list[str]:
+    with _open_table(where, table_name) as stream:
+        return next(csv.reader(stream), []) if stream is not None else []
+
+
+def _stream_columns(old: Path, new: Path) -> Columns:
+    return {
+        table_name: sorted({*_read_header(old, table_name), *_read_header(new, table_name)})
+        for entity in ENTITIES
+        for table_name in entity.tables
+    }
+
+
+def fingerprint_stream(where: Path, entity: Entity, columns: Columns) -> Fingerprints:
+    """Computes fingerprints of all entities of a kind, straight from the feed's files.
+    Only the fingerprints are kept in memory - rows are discarded as soon as they are read."""
+    fingerprints: Fingerprints = {}
+    parts = len(entity.tables)
+
+    for part, table_name in enumerate(entity.tables):
+        with _open_table(where, table_name) as stream:
+            if stream is None:
+                continue
+
+            reader = csv.reader(stream)
+            header = next(reader, None)
+            if header is None or TABLE_KEYS[table_name] not in header:
+                continue
+
+            # Columns missing from this feed are read from an extra, empty field
+            width = len(header)
+            key_index = header.index(TABLE_KEYS[table_name])
+            order = [header.index(i) if i in header else width for i in columns[table_name]]
+            padded = width in order
+            getter = itemgetter(*order) if len(order) > 1 else lambda v: (v[order[0]],)
+
+            for values in reader:
+                if not values:
+                    continue
+                elif padded or len(values) != width:
+                    values = (values + [""] * width)[:width] + [""]
+                _add_digest(fingerprints, values[key_index], part, parts, _digest(getter(values)))
+
+    return fingerprints
+
+
+# Comparing fingerprints
+
+
+@dataclass
+class EntityDiff:
+    """EntityDiff lists changes of a single kind of entities between two feeds."""
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    modified: dict[str, list[str]] = field(default_factory=dict)
+    """Maps keys of modified entities to names of tables in which they've changed"""
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.removed or self.modified)
+
+    def as_json(self) -> dict[str, Any]:
+        return {"added": self.added, "removed": self.removed, "modified": self.modified}
+
+
+@dataclass
+class FeedDiff:
+    """FeedDiff holds all changes between two GTFS feeds."""
+
+    entities: dict[str, EntityDiff] = field(default_factory=dict)
+
+    @property
+    def has_changes(self) -> bool:
+        return any(i.has_changes for i in self.entities.values())
+
+    def as_json(self) -> dict[str, Any]:
+        return {name: i.as_json() for name, i in self.entities.items()}
+
+    def as_text(self) -> str:
+        lines: list[str] = []
+        for name, entity_diff in self.entities.items():
+            lines.append(
+                f"{name}: {len(entity_diff.added)} added, {len(entity_diff.removed)} removed, "
+                f"{len(entity_diff.modified)} modified"
+            )
+            lines.extend(f"  + {i}" for i in entity_diff.added)
+            lines.extend(f"  - {i}" for i in entity_diff.removed)
+            lines.extend(
+                f"  ~ {key} ({', '.join(tables)})" for key, tables in entity_diff.modified.items()
+            )
+        return "\n".join(lines)
+
+
+def compare(entity: Entity, old: Fingerprints, new: Fingerprints) -> EntityDiff:
+    """Compares fingerprints of a single kind of entities"""
+    # Skip over rows referencing non-existing entities (like stop_times of unknown trips)
+    old_keys = {key for key, fingerprint in old.items() if entity.exists(fingerprint)}
+    new_keys = {key for key, fingerprint in new.items() if entity.exists(fingerprint)}
+
+    result = EntityDiff(
+        added=sorted(new_keys - old_keys),
+        removed=sorted(old_keys - new_keys),
+    )
+
+    for key in sorted(old_keys & new_keys):
+        old_fingerprint = old[key]
+        new_fingerprint = new[key]
+        if old_fingerprint != new_fingerprint:
+            result.modified[key] = [
+                table_name
+                for table_name, a, b in zip(entity.tables, old_fingerprint, new_fingerprint)
+                if a != b
+            ]
+
+    return result
+
+
+def diff_gtfs(old: Gtfs, new: Gtfs) -> FeedDiff:
+    """Finds all changes between two loaded feeds."""
+    columns = _gtfs_columns(old, new)
+    return FeedDiff(
+        {
+            entity.name: compare(
+                entity,
+                fingerprint_gtfs(old, entity, columns),
+                fingerprint_gtfs(new, entity, columns),
+            )
+            for entity in ENTITIES
+        }
+    )
+
+
+def diff_streaming(old: Path, new: Path) -> FeedDiff:
+    """Finds all changes between two feeds, without loading any of them.
+    Only fingerprints of a single kind of entities are kept in memory at once."""
+    columns = _stream_columns(old, new)
+    return FeedDiff(
+        {
+            entity.name: compare(
+                entity,
+                fingerprint_stream(old, entity, columns),
+                fingerprint_stream(new, entity, columns),
+            )
+            for entity in ENTITIES
+        }
+    )
@@ -0,0 +1,146 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Mapping
+
+from .spatial import StopGrid
+
+Row = Mapping[str, str]
+
+SAME_POSITION_DISTANCE = 1.0
+"""Distance (in meters), below which stops are considered duplicates regardless of their names"""
+
+SIMILAR_NAME_DISTANCE = 25.0
+"""Distance (in meters), below which stops with similar names are considered duplicates"""
+
+MIN_NAME_SIMILARITY = 0.85
+"""Minimal similarity (see name_similarity) of names of duplicate stops"""
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def name_similarity(a: str, b: str) -> float:
+    """Returns the similarity of two stop names, from 0.0 (nothing in common)
+    to 1.0 (same names, ignoring case and whitespace)."""
+    a = _normalize_name(a)
+    b = _normalize_name(b)
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+@dataclass
+class DuplicatePair:
+    stop_id: str
+    other_stop_id: str
+    distance: float
+    """Distance between the stops, in meters"""
+
+    name_similarity: float
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "stop_id": self.stop_id,
+            "other_stop_id": self.other_stop_id,
+            "distance": round(self.distance, 2),
+            "name_similarity": round(self.name_similarity, 3),
+        }
+
+
+@dataclass
+class DuplicateCluster:
+    """DuplicateCluster is a group of stops, connected by DuplicatePairs"""
+
+    stop_ids: list[str] = field(default_factory=list)
+    pairs: list[DuplicatePair] = field(default_factory=list)
+
+    def as_json(self) -> dict[str, Any]:
+        return {"stop_ids": self.stop_ids, "pairs": [i.as_json() for i in self.pairs]}
+
+
+def _may_be_duplicates(a: Row, b: Row) -> bool:
+    """Checks if two stops may be duplicates at all - stops of different kinds,
+    a station and its own stop, or platforms with different codes are expected
+    to be close to each other."""
+    return (
+        (a.get("location_type") or "0") == (b.get("location_type") or "0")
+        and a.get("parent_station") != b.get("stop_id")
+        and b.get("parent_station") != a.get("stop_id")
+        and (
+            not a.get("platform_code")
+            or not b.get("platform_code")
+            or a.get("platform_code") == b.get("platform_code")
+        )
+    )
+
+
+def find_duplicate_stops(
+    stops: Mapping[str, Row],
+    same_position_distance: float = SAME_POSITION_DISTANCE,
+    similar_name_distance: float = SIMILAR_NAME_DISTANCE,
+    min_name_similarity: float = MIN_NAME_SIMILARITY,
+) -> list[DuplicateCluster]:
+    """Finds clusters of stops, which are likely duplicates of each other:
+    stops at (almost) the same position, or with similar names close to each other.
+
+    Only pairs of stops from neighboring cells of a StopGrid are compared, so the time
+    is linear in the number of stops (unless thousands of stops are within a few meters).
+    Clusters are ordered by their size (largest first), and then by their first stop_id.
+    """
+    radius = max(same_position_distance, similar_name_distance)
+    grid = StopGrid.from_stops(stops.values(), cell_size=radius)
+
+    # Find duplicate pairs, and merge them into clusters with a union-find
+    pairs: list[DuplicatePair] = []
+    parents: dict[str, str] = {}
+
+    def find(stop_id: str) -> str:
+        root = stop_id
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while stop_id != root:
+            parents[stop_id], stop_id = root, parents[stop_id]
+        return root
+
+    for a, b, distance in grid.pairs_within(radius):
+        stop_a, stop_b = stops[a], stops[b]
+        if not _may_be_duplicates(stop_a, stop_b):
+            continue
+
+        similarity = name_similarity(stop_a.get("stop_name") or "", stop_b.get("stop_name") or "")
+        if distance <= same_position_distance or (
+            distance <= similar_name_distance and similarity >= min_name_similarity
+        ):
+            a, b = sorted((a, b))
+            pairs.append(DuplicatePair(a, b, distance, similarity))
+            parents[find(b)] = find(a)
+
+    # Group the pairs by their clusters
+    clusters: dict[str, DuplicateCluster] = {}
+    for pair in sorted(pairs, key=lambda i: (i.stop_id, i.other_stop_id)):
+        cluster = clusters.setdefault(find(pair.stop_id), DuplicateCluster())
+        cluster.pairs.append(pair)
+
+    for cluster in clusters.values():
+        cluster.stop_ids = sorted(
+            {stop_id for pair in cluster.pairs for stop_id in (pair.stop_id, pair.other_stop_id)}
+        )
+
+    return sorted(clusters.values(), key=lambda i: (-len(i.stop_ids), i.stop_ids[0]))
@@ -0,0 +1,422 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+from urllib.parse import quote, unquote
+
+from .__version__ import __version__
+from .app import Application
+from .gtfs import Gtfs
+
+logger = logging.getLogger("jvig.export")
+
+MANIFEST_NAME = ".jvig-export.json"
+"""Name of the file (in the output directory) describing the previous export"""
+
+CHUNK_SIZE = 64
+"""Number of pages rendered by a single worker task"""
+
+PARALLEL_THRESHOLD = 512
+"""Minimal number of pages to render for the export to be spread across processes"""
+
+STATIC_DIR = Path(__file__).with_name("static")
+
+ALL_TABLES = (
+    "agency",
+    "stops",
+    "routes",
+    "trips",
+    "calendar",
+    "calendar_dates",
+    "frequencies",
+    "stop_times",
+    "shapes",
+    "transfers",
+    "pathways",
+)
+
+
+def _url(prefix: str, value: str) -> str:
+    return prefix + quote(value, safe="/")
+
+
+class PageKind(NamedTuple):
+    """PageKind describes a group of exported pages, which depend on the same GTFS tables.
+    A whole group is skipped on re-export, if none of its tables have changed."""
+
+    name: str
+    tables: tuple[str, ...]
+    urls: Callable[[Gtfs], Iterable[str]]
+
+
+PAGE_KINDS: tuple[PageKind, ...] = (
+    PageKind("agency", ("agency",), lambda gtfs: ["/", "/agency"]),
+    PageKind(
+        "routes",
+        ("agency", "routes"),
+        lambda gtfs: ["/routes", *(_url("/agency/", i) for i in gtfs.agency)],
+    ),
+    PageKind("stops", ("stops",), lambda gtfs: ["/stops", "/api/map/stops"]),
+    PageKind(
+        "stop",
+        ("stops", "trips", "frequencies", "stop_times", "transfers", "pathways"),
+        lambda gtfs: (
+            url for i in gtfs.stops for url in (_url("/stop/", i), _url("/api/map/stop/", i))
+        ),
+    ),
+    PageKind(
+        "route",
+        ("stops", "routes", "trips", "stop_times", "shapes"),
+        lambda gtfs: (
+            url for i in gtfs.routes for url in (_url("/route/", i), _url("/api/map/route/", i))
+        ),
+    ),
+    PageKind(
+        "block",
+        ("stops", "trips", "calendar", "calendar_dates", "stop_times"),
+        lambda gtfs: (_url("/block/", i) for i in gtfs.blocks),
+    ),
+    PageKind(
+        "trip",
+        ALL_TABLES[1:],
+        lambda gtfs: (
+            url for i in gtfs.trips for url in (_url("/trip/", i), _url("/api/map/trip/", i))
+        ),
+    ),
+    PageKind(
+        "shape",
+        ("shapes",),
+        lambda gtfs: (_url("/api/map/shape/", i) for i in gtfs.shapes),
+    ),
+    PageKind(
+        "calendar",
+        ("trips", "calendar", "calendar_dates"),
+        lambda gtfs: [
+            "/calendars",
+            "/api/calendar/summary",
+            *(
+                url
+                for i in {**gtfs.calendar, **gtfs.calendar_dates}
+                for url in (_url("/calendar/", i), _url("/api/calendar/days/", i))
+            ),
+        ],
+    ),
+    PageKind("integrity", ALL_TABLES, lambda gtfs: ["/integrity"]),
+)
+"""All exported pages. The validation report and statistics are not exported, as computing them
+may take longer than exporting the whole feed."""
+
+
+@dataclass
+class ExportStats:
+    """ExportStats counts what happened to the exported files"""
+
+    rendered: int = 0
+    written: int = 0
+    linked: int = 0
+    """Files with content identical to other files, hard-linked instead of written"""
+
+    unchanged: int = 0
+    """Rendered files, which were identical to the previously exported ones"""
+
+    skipped: int = 0
+    """Files of page kinds whose tables have not changed since the previous export"""
+
+    removed: int = 0
+    failed: int = 0
+
+    def as_text(self) -> str:
+        return (
+            f"{self.rendered} pages rendered: {self.written} written, {self.linked} linked, "
+            f"{self.unchanged} unchanged; {self.skipped} skipped, {self.removed} removed, "
+            f"{self.failed} failed"
+        )
+
+
+@dataclass
+class _KindManifest:
+    inputs: str
+    files: dict[str, str] = field(default_factory=dict)
+    """Maps relative paths to SHA-256 digests of their content"""
+
+
+def table_digests(where: Path) -> dict[str, str]:
+    """Computes digests of every GTFS table, as cheaply as possible:
+    from CRCs stored in the zip archive, or from the content of .txt files."""
+    digests: dict[str, str] = {}
+
+    if where.is_file():
+        with zipfile.ZipFile(where, mode="r") as archive:
+            for info in archive.infolist():
+                if info.filename.endswith(".txt"):
+                    digests[info.filename[:-4]] = f"{info.CRC:08x}-{info.file_size}"
+
+    else:
+        for f in where.glob("*.txt"):
+            h = hashlib.sha256()
+            with f.open(mode="rb") as stream:
+                for block in iter(lambda: stream.read(1024 * 1024), b""):
+                    h.update(block)
+            digests[f.stem] = h.hexdigest()
+
+    return digests
+
+
+def _inputs_digest(kind: PageKind, digests: dict[str, str]) -> str:
+    h = hashlib.sha256(__version__.encode("utf-8"))
+    for table_name in kind.tables:
+        h.update(f"\0{table_name}={digests.get(table_name, '')}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def output_path(url: str) -> Optional[PurePosixPath]:
+    """Returns the path (relative to the output directory) of an exported URL.
+    HTML pages are saved as index.html files in a directory named after the URL,
+    while API responses are saved exactly under their URL.
+
+    Returns None for URLs which can't be safely mapped onto files."""
+    parts = url.strip("/").split("/") if url != "/" else []
+    if any(i in {"", ".", ".."} or "\0" in i for i in parts):
+        return None
+
+    path = PurePosixPath(*parts) if parts else PurePosixPath()
+    return path if parts and parts[0] == "api" else path / "index.html"
+
+
+# Rendering - done in worker processes (or inline)
+
+_app: Optional[Application] = None
+
+
+def _export_app(gtfs: Gtfs) -> Application:
+    # Links of exported pages are relative to the pages themselves, so that the output
+    # can be opened from any directory
+    app = Application(gtfs)
+    app.relative_base = True
+    return app
+
+
+def _init_worker(where: Path) -> None:
+    # On platforms with fork() the application is inherited from the parent
+    global _app
+    if _app is None:
+        _app = _export_app(Gtfs.from_user_input(where))
+
+
+def _render_chunk(urls: list[tuple[str, str]]) -> list[tuple[str, str, int, bytes]]:
+    assert _app is not None
+    client = _app.flask.test_client()
+    results: list[tuple[str, str, int, bytes]] = []
+    for kind, url in urls:
+        response = client.get(url)
+        results.append((kind, url, response.status_code, response.get_data()))
+    return results
+
+
+def _chunks(urls: Iterable[tuple[str, str]]) -> Iterator[list[tuple[str, str]]]:
+    chunk: list[tuple[str, str]] = []
+    for url in urls:
+        chunk.append(url)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Writing the output
+
+
+class _Writer:
+    """_Writer saves exported files atomically, skipping files identical to the previously
+    exported ones, and hard-linking files with content identical to other exported files."""
+
+    def __init__(self, out: Path, previous: dict[str, str], stats: ExportStats) -> None:
+        self.out = out
+        self.previous = previous
+        self.stats = stats
+        self.by_digest: dict[str, str] = {}
+
+    def keep(self, path: str, digest: str) -> None:
+        """Registers a file kept from the previous export"""
+        self.by_digest.setdefault(digest, path)
+
+    def write(self, path: str, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        target = self.out / path
+
+        if self.previous.get(path) == digest and target.is_file():
+            self.stats.unchanged += 1
+            self.by_digest.setdefault(digest, path)
+            return digest
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp = target.with_name(f".{target.name}.tmp")
+        temp.unlink(missing_ok=True)
+
+        # Files are always replaced (never overwritten in-place),
+        # so that rewriting a file doesn't change the files linked to it
+        linked = False
+        same = self.by_digest.get(digest)
+        if same is not None:
+            try:
+                os.link(self.out / same, temp)
+                linked = True
+            except OSError:
+                pass
+
+        if linked:
+            self.stats.linked += 1
+        else:
+            temp.write_bytes(content)
+            self.stats.written += 1
+            self.by_digest.setdefault(digest, path)
+
+        os.replace(temp, target)
+        return digest
+
+
+def _load_manifest(out: Path) -> dict[str, _KindManifest]:
+    try:
+        with (out / MANIFEST_NAME).open(mode="r", encoding="utf-8") as f:
+            data: dict[str, Any] = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if data.get("version") != __version__:
+        return {}
+
+    return {
+        name: _KindManifest(kind["inputs"], kind["files"])
+        for name, kind in data.get("kinds", {}).items()
+    }
+
+
+def _save_manifest(out: Path, kinds: dict[str, _KindManifest]) -> None:
+    data = {
+        "version": __version__,
+        "kinds": {name: {"inputs": i.inputs, "files": i.files} for name, i in kinds.items()},
+    }
+    with (out / MANIFEST_NAME).open(mode="w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+
+
+def _copy_static(out: Path) -> None:
+    target = out / "static"
+    target.mkdir(parents=True, exist_ok=True)
+    for f in STATIC_DIR.iterdir():
+        if f.is_file():
+            shutil.copyfile(f, target / f.name)
+
+
+def export_feed(where: Path, out: Path, processes: Optional[int] = None) -> ExportStats:
+    """Renders every page of a GTFS feed into static files in the `out` directory.
+
+    Pages are rendered by a pool of `processes` workers (defaults to the number of CPUs);
+    pass `processes=1` to render everything in the calling process.
+
+    Re-exporting into the same directory only renders the pages which depend on tables
+    that have changed since (see PageKind), and only rewrites files with different content.
+    """
+    global _app
+
+    stats = ExportStats()
+    out.mkdir(parents=True, exist_ok=True)
+    _copy_static(out)
+
+    # Find out which kinds of pages have to be rendered
+    digests = table_digests(where)
+    previous = _load_manifest(out)
+    previous_files = {p: d for kind in previous.values() for p, d in kind.files.items()}
+    kinds: dict[str, _KindManifest] = {}
+    writer = _Writer(out, previous_files, stats)
+
+    gtfs: Optional[Gtfs] = None
+    to_render: list[tuple[str, str]] = []
+
+    for kind in PAGE_KINDS:
+        inputs = _inputs_digest(kind, digests)
+        old = previous.get(kind.name)
+
+        if old and old.inputs == inputs and all((out / p).is_file() for p in old.files):
+            logger.info(f"Skipping unchanged {kind.name} pages")
+            kinds[kind.name] = old
+            stats.skipped += len(old.files)
+            for path, digest in old.files.items():
+                writer.keep(path, digest)
+        else:
+            # The feed is only loaded if anything has to be rendered
+            if gtfs is None:
+                gtfs = Gtfs.from_user_input(where)
+            kinds[kind.name] = _KindManifest(inputs)
+            to_render.extend((kind.name, url) for url in kind.urls(gtfs))
+
+    # Render the pages, writing them as soon as they arrive
+    _app = _export_app(gtfs) if gtfs is not None else None
+    try:
+        if processes == 1 or len(to_render) < PARALLEL_THRESHOLD:
+            results: Iterable[list[tuple[str, str, int, bytes]]] = map(
+                _render_chunk, _chunks(to_render)
+            )
+            _write_results(results, out, kinds, writer, stats)
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(where,)) as p:
+                results = p.map(_render_chunk, _chunks(to_render))
+                _write_results(results, out, kinds, writer, stats)
+    finally:
+        _app = None
+
+    # Remove files which are no longer exported
+    exported = {p for kind in kinds.values() for p in kind.files}
+    for path in previous_files.keys() - exported:
+        (out / path).unlink(missing_ok=True)
+        stats.removed += 1
+
+    _save_manifest(out, kinds)
+    return stats
+
+
+def _write_results(
+    results: Iterable[list[tuple[str, str, int, bytes]]],
+    out: Path,
+    kinds: dict[str, _KindManifest],
+    writer: _Writer,
+    stats: ExportStats,
+) -> None:
+    for chunk in results:
+        for kind, url, status, content in chunk:
+            stats.rendered += 1
+            path = output_path(unquote(url))
+
+            if status != 200 or path is None:
+                logger.warning(f"Can't export {url} (status {status})")
+                stats.failed += 1
+                continue
+
+            try:
+                kinds[kind].files[str(path)] = writer.write(str(path), content)
+            except OSError as e:
+                logger.warning(f"Can't export {url}: {e}")
+                stats.failed += 1
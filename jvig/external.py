@@ -0,0 +1,296 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import os
+import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from heapq import merge
+from io import StringIO
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, Mapping, NamedTuple, Sequence
+
+Row = Mapping[str, str]
+
+CACHE_SIZE = 256
+"""Number of recently read groups of rows kept by an ExternalTable"""
+
+MIN_RUN_ROWS = 1000
+"""Minimal number of rows in a single sorted run, regardless of the memory limit"""
+
+MAX_MERGED_RUNS = 64
+"""Maximum number of runs merged at once (each one needs an open file)"""
+
+
+class SortOrder(NamedTuple):
+    """SortOrder describes one of the on-disk orderings produced by external_sort."""
+
+    group_by: int
+    """Index of the column by which rows are grouped (and looked up)"""
+
+    key: Callable[[list[str]], Any]
+    """Key function ordering rows - must order by the `group_by` column first"""
+
+
+class _Lines:
+    """Collects text written by csv.writer, so that it can be encoded in bulk"""
+
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+        self.write = self.parts.append
+
+
+def _remove(f: IO[bytes], path: str) -> None:
+    f.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ExternalTable(Mapping[str, list[Row]]):
+    """ExternalTable is a read-only mapping from keys to groups of rows,
+    which are stored in a sorted CSV file on disk (see external_sort). Only the offsets
+    of every group are kept in memory; rows are parsed on every access,
+    apart from the recently accessed groups.
+
+    The file is removed once the ExternalTable is garbage collected.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        group_by: int,
+        index: dict[str, tuple[int, int]],
+        to_row: Callable[[list[str]], Row],
+    ) -> None:
+        self.path = path
+        self.group_by = group_by
+        self.index = index
+        self.to_row = to_row
+        self._file = open(path, mode="rb")
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, list[Row]]" = OrderedDict()
+        self._finalizer = weakref.finalize(self, _remove, self._file, path)
+
+    def __getitem__(self, key: str) -> list[Row]:
+        with self._lock:
+            rows = self._cache.get(key)
+            if rows is not None:
+                self._cache.move_to_end(key)
+                return rows
+
+            offset, length = self.index[key]
+            self._file.seek(offset)
+            data = self._file.read(length)
+
+        rows = [self.to_row(i) for i in csv.reader(StringIO(data.decode("utf-8"), newline=""))]
+
+        with self._lock:
+            self._cache[key] = rows
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return rows
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def items(self) -> Iterator[tuple[str, list[Row]]]:  # type: ignore
+        """Yields all (key, rows) pairs in a single sequential pass over the file"""
+        with open(self.path, mode="r", encoding="utf-8", newline="") as f:
+            for key, group in groupby(csv.reader(f), _group_key(self.group_by)):
+                yield key, [self.to_row(i) for i in group]
+
+    def values(self) -> Iterator[list[Row]]:  # type: ignore
+        return (rows for _, rows in self.items())
+
+    def close(self) -> None:
+        """Removes the underlying file. The table can't be accessed afterwards."""
+        self._finalizer()
+
+
+def estimate_row_size(values: list[str]) -> int:
+    """Estimates the memory (in bytes) used by a row kept in a sort buffer"""
+    return sys.getsizeof(values) + sum(sys.getsizeof(i) for i in values)
+
+
+def _group_key(group_by: int) -> Callable[[list[str]], str]:
+    return lambda values: values[group_by] if len(values) > group_by else ""
+
+
+def _write_run(directory: str, rows: list[list[str]]) -> str:
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=directory)
+    with open(fd, mode="w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+Group = tuple[str, list[list[str]]]
+
+
+def _read_groups(path: str, group_key: Callable[[list[str]], str]) -> Iterator[Group]:
+    with open(path, mode="r", encoding="utf-8", newline="") as f:
+        for key, group in groupby(csv.reader(f), group_key):
+            yield key, list(group)
+
+
+def _groups_of(
+    rows: Iterable[list[str]], group_key: Callable[[list[str]], str]
+) -> Iterator[Group]:
+    for key, group in groupby(rows, group_key):
+        yield key, list(group)
+
+
+def _merge_groups(runs: list[str], order: SortOrder) -> Iterator[Group]:
+    """Merges sorted runs. Whole groups of rows (instead of single rows) are merged,
+    which is much quicker, as there are far fewer of them. Parts of a group coming
+    from different runs are then joined and sorted again."""
+    group_key = _group_key(order.group_by)
+    merged = merge(*(_read_groups(i, group_key) for i in runs), key=itemgetter(0))
+
+    for key, parts in groupby(merged, itemgetter(0)):
+        rows = next(parts)[1]
+        rest = [part for _, part in parts]
+        if rest:
+            for part in rest:
+                rows.extend(part)
+            # NOTE: Stable sort - rows with equal keys stay in the order of runs
+            rows.sort(key=order.key)
+        yield key, rows
+
+
+def _merge_into_run(directory: str, runs: list[str], order: SortOrder) -> str:
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=directory)
+    with open(fd, mode="w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for _, rows in _merge_groups(runs, order):
+            writer.writerows(rows)
+    for run in runs:
+        os.remove(run)
+    return path
+
+
+def _spill(
+    directory: str,
+    buffer: list[list[str]],
+    orders: Sequence[SortOrder],
+    runs: list[list[str]],
+) -> None:
+    """Sorts the buffer in every order, and writes the results as new runs"""
+    for order, order_runs in zip(orders, runs):
+        # NOTE: Merging consecutive runs keeps rows with equal keys in their original order
+        if len(order_runs) >= MAX_MERGED_RUNS:
+            order_runs[:] = [_merge_into_run(directory, order_runs, order)]
+        order_runs.append(_write_run(directory, sorted(buffer, key=order.key)))
+    buffer.clear()
+
+
+def _write_table(
+    groups: Iterable[Group],
+    order: SortOrder,
+    to_row: Callable[[list[str]], Row],
+    directory: Path,
+) -> ExternalTable:
+    """Writes sorted groups of rows into a single file, recording the offsets of every group"""
+    index: dict[str, tuple[int, int]] = {}
+    fd, path = tempfile.mkstemp(prefix="jvig-", suffix=".csv", dir=directory)
+    lines = _Lines()
+    writer = csv.writer(lines)
+    position = 0
+
+    with open(fd, mode="wb") as f:
+        for key, rows in groups:
+            writer.writerows(rows)
+            data = "".join(lines.parts).encode("utf-8")
+            lines.parts.clear()
+
+            f.write(data)
+            index[key] = (position, len(data))
+            position += len(data)
+
+    return ExternalTable(path, order.group_by, index, to_row)
+
+
+def external_sort(
+    rows: Iterable[list[str]],
+    orders: Sequence[SortOrder],
+    to_row: Callable[[list[str]], Row],
+    memory_limit: int,
+    directory: Path = Path(tempfile.gettempdir()),
+) -> list[ExternalTable]:
+    """Sorts rows which may not fit in memory, returning an ExternalTable for every SortOrder.
+
+    Rows are buffered until their estimated size exceeds `memory_limit` bytes. Every full
+    buffer is sorted in every order and spilled into temporary run files, which are
+    finally merged (k-way, by whole groups) into a single file per order. Rows with equal
+    keys keep their original order.
+
+    Memory used by the merge is bounded by groups, not rows: a whole group (like all
+    stop_times of the busiest stop) from every run is kept in memory at once.
+    Every group must therefore fit in memory - which is needed anyway, as groups are
+    read back in whole by the returned tables.
+
+    Groups of rows (with the same value in the `group_by` column) may be looked up in the
+    returned tables; `to_row` converts the stored values back into rows.
+    """
+    with tempfile.TemporaryDirectory(prefix="jvig-runs-", dir=directory) as run_directory:
+        runs: list[list[str]] = [[] for _ in orders]
+        buffer: list[list[str]] = []
+        capacity = 0
+
+        for values in rows:
+            if not capacity:
+                capacity = max(memory_limit // estimate_row_size(values), MIN_RUN_ROWS)
+
+            buffer.append(values)
+            if len(buffer) >= capacity:
+                _spill(run_directory, buffer, orders, runs)
+
+        # Small inputs never have to touch the disk before being written out
+        if not runs[0]:
+            return [
+                _write_table(
+                    _groups_of(sorted(buffer, key=order.key), _group_key(order.group_by)),
+                    order,
+                    to_row,
+                    directory,
+                )
+                for order in orders
+            ]
+
+        if buffer:
+            _spill(run_directory, buffer, orders, runs)
+
+        return [
+            _write_table(
+                _merge_groups(order_runs, order),
+                order,
+                to_row,
+                directory,
+            )
+            for order, order_runs in zip(orders, runs)
+        ]
@@ -0,0 +1,112 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Sequence
+
+from .gtfs import Row
+from .memory import estimate_size
+from .tables.cells import RowFormatter
+
+DEFAULT_MAX_ROWS = 50_000
+"""Number of row fragments kept by a RowFragmentCache"""
+
+RowCompiler = Callable[[Iterable[str]], RowFormatter]
+"""Function building a RowFormatter for a table header, like `jvig.tables.stops.compile_row`"""
+
+
+class RowFragmentCache:
+    """RowFragmentCache keeps rendered cells (`<td>` elements) of GTFS rows,
+    so that rows shown on multiple pages (like stop_times of popular trips,
+    which appear on the trip page and on the page of every served stop)
+    are only formatted once per loaded feed.
+
+    Entries are keyed by (table, primary key, header) and least recently used entries
+    are evicted once there are more than `max_rows` of them. As primary keys of
+    invalid feeds may be duplicated, an entry is only reused for the very same row object.
+    """
+
+    def __init__(self, max_rows: int = DEFAULT_MAX_ROWS) -> None:
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple[str, Hashable, tuple[str, ...]], tuple[Row, str]]" = (
+            OrderedDict()
+        )
+        self._formatters: dict[tuple[str, tuple[str, ...]], RowFormatter] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def render(
+        self,
+        table: str,
+        key: Hashable,
+        header: Sequence[str],
+        row: Row,
+        compile_row: RowCompiler,
+    ) -> str:
+        """Returns all cells of a row, as rendered by `compile_row(header)`,
+        reusing a previously rendered fragment if possible. Compiled formatters
+        are kept for every (table, header) pair."""
+        header = tuple(header)
+        entry_key = (table, key, header)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] is row:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+            format_row = self._formatters.get((table, header))
+            if format_row is None:
+                format_row = compile_row(header)
+                self._formatters[table, header] = format_row
+
+        fragment = format_row(row)
+
+        with self._lock:
+            self._entries[entry_key] = (row, fragment)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_rows:
+                self._entries.popitem(last=False)
+
+        return fragment
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def estimated_size(self) -> int:
+        with self._lock:
+            return estimate_size(self._entries)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
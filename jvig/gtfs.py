@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022-2023 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -15,29 +15,150 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import csv
+import gc
 import logging
+import threading
 import zipfile
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass, field
 from datetime import date, timedelta
-from io import TextIOWrapper
+from io import BufferedReader, TextIOWrapper
+from itertools import chain
 from math import nan
 from operator import itemgetter
 from pathlib import Path
-from typing import IO, Callable, List, Optional, Union
-
-from .util import parse_gtfs_date, sequence_to_int
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from .external import SortOrder, external_sort
+from .memory import estimate_size
+from .pipelined import DEFAULT_BLOCK_SIZE, PipelinedReader
+from .records import ColumnDictionary, record_type
+from .services import CalendarSummary, summarize_calendars
+from .spatial import NEARBY_RADIUS, StopGrid
+from .stations import StationGraph, build_station_graphs
+from .util import parse_gtfs_date, sequence_to_int, time_to_int
 
 logger = logging.getLogger("jvig.gtfs")
 
-Row = dict[str, str]
+Row = Mapping[str, str]
 Point = tuple[float, float]
 
 TableToOne = dict[str, Row]
 TableToMany = dict[str, list[Row]]
+TableToManyOnDisk = Mapping[str, list[Row]]
+"""Either a TableToMany, or an ExternalTable (for stop_times loaded with a memory_limit)"""
 TableToPoints = dict[str, list[Point]]
 Table = Union[TableToOne, TableToMany, TableToPoints]
 
 
+class TripSummary(NamedTuple):
+    """TripSummary is a compact, precomputed summary of a trip's stop_times."""
+
+    first_departure: int
+    """Departure time from the first stop, in seconds since noon minus 12h, or -1 if unknown"""
+
+    last_arrival: int
+    """Arrival time at the last stop, in seconds since noon minus 12h, or -1 if unknown"""
+
+    stop_count: int
+    """Number of stop_times of the trip"""
+
+    distance: Optional[float]
+    """Difference of the last and first shape_dist_traveled, if both are present"""
+
+    exceptional: bool
+    """Value of the (extended) trips.txt exceptional field"""
+
+    @property
+    def duration(self) -> int:
+        """Returns the trip duration in seconds, or -1 if unknown"""
+        if self.first_departure < 0 or self.last_arrival < 0:
+            return -1
+        return self.last_arrival - self.first_departure
+
+
+EMPTY_TRIP_SUMMARY = TripSummary(-1, -1, 0, None, False)
+
+
+def _summarize_trip(trip: Row, times: list[Row]) -> TripSummary:
+    if not times:
+        return EMPTY_TRIP_SUMMARY._replace(exceptional=trip.get("exceptional") == "1")
+
+    first = times[0]
+    last = times[-1]
+
+    distance: Optional[float] = None
+    try:
+        distance = float(last["shape_dist_traveled"]) - float(first["shape_dist_traveled"])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    return TripSummary(
+        first_departure=time_to_int(
+            first.get("departure_time") or first.get("arrival_time") or ""
+        ),
+        last_arrival=time_to_int(last.get("arrival_time") or last.get("departure_time") or ""),
+        stop_count=len(times),
+        distance=distance,
+        exceptional=trip.get("exceptional") == "1",
+    )
+
+
+class ForeignKey(NamedTuple):
+    """ForeignKey describes a reference from a column of one table to rows of other tables."""
+
+    table: str
+    column: str
+
+    targets: tuple[str, ...]
+    """Names of tables, any of which may contain the referenced key"""
+
+    referrer: str
+    """Column identifying the referencing rows - used to point at the broken entities"""
+
+
+FOREIGN_KEYS: tuple[ForeignKey, ...] = (
+    ForeignKey("routes", "agency_id", ("agency",), "route_id"),
+    ForeignKey("stops", "parent_station", ("stops",), "stop_id"),
+    ForeignKey("trips", "route_id", ("routes",), "trip_id"),
+    ForeignKey("trips", "service_id", ("calendar", "calendar_dates"), "trip_id"),
+    ForeignKey("trips", "shape_id", ("shapes",), "trip_id"),
+    ForeignKey("stop_times", "trip_id", ("trips",), "trip_id"),
+    ForeignKey("stop_times", "stop_id", ("stops",), "trip_id"),
+    ForeignKey("frequencies", "trip_id", ("trips",), "trip_id"),
+    ForeignKey("transfers", "from_stop_id", ("stops",), "from_stop_id"),
+    ForeignKey("transfers", "to_stop_id", ("stops",), "from_stop_id"),
+    ForeignKey("transfers", "from_route_id", ("routes",), "from_stop_id"),
+    ForeignKey("transfers", "to_route_id", ("routes",), "from_stop_id"),
+    ForeignKey("transfers", "from_trip_id", ("trips",), "from_stop_id"),
+    ForeignKey("transfers", "to_trip_id", ("trips",), "from_stop_id"),
+    ForeignKey("pathways", "from_stop_id", ("stops",), "pathway_id"),
+    ForeignKey("pathways", "to_stop_id", ("stops",), "pathway_id"),
+)
+"""All references checked by Gtfs.build_indexes. Empty values are never considered dangling."""
+
+MISSING_AGENCY_ID = "(missing)"
+"""Placeholder agency_id of agencies and routes from files without the agency_id column"""
+
+PIPELINE_THRESHOLD = 1024 * 1024
+"""Minimal uncompressed size of a compressed zip member
+for it to be inflated on a separate thread."""
+
+
 def _get_shape_pt(row: Row) -> Optional[Point]:
     """Tries to parse a shapes.txt row into a Point tuple.
     If there's anything wrong with the row, returns None"""
@@ -47,7 +168,140 @@ def _get_shape_pt(row: Row) -> Optional[Point]:
         return None
 
 
-_table_keys: dict[str, str] = {
+def _read_rows(stream: IO[str]) -> Iterator[Row]:
+    """Reads CSV rows from a stream into dictionaries.
+
+    This is a faster equivalent of iterating over a `csv.DictReader`:
+    well-formed rows are zipped with a single, shared header list.
+    Rows with an unexpected number of fields are handled exactly as `csv.DictReader` would.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is not None:
+        yield from _zip_rows(header, reader)
+
+
+def _zip_rows(header: list[str], reader: Iterator[list[str]]) -> Iterator[Row]:
+    """Zips every row from a `csv.reader` with the shared header. See `_read_rows`."""
+    width = len(header)
+    for values in reader:
+        if len(values) == width:
+            yield dict(zip(header, values))
+        elif values:
+            yield _odd_row(header, values)
+
+
+def _read_records(
+    stream: IO[str],
+    primary_key: str,
+    defaults: Optional[Mapping[str, str]] = None,
+) -> Iterator[Row]:
+    """Reads CSV rows from a stream into Records (see jvig.records), with repeated values
+    of low-cardinality columns deduplicated. Columns from `defaults`, which are missing
+    from the file, are added to every row.
+
+    Rows with an unexpected number of fields are read into dicts, see `_odd_row`.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    missing = [column for column in defaults or {} if column not in header]
+    extra = [defaults[column] for column in missing] if defaults else []
+    width = len(header)
+    make_record = record_type(tuple(header + missing))
+    dictionary = ColumnDictionary(
+        width + len(missing),
+        # NOTE: Primary keys are unique, there's nothing to deduplicate
+        [header.index(primary_key)] if primary_key in header else [],
+    )
+
+    for values in reader:
+        if len(values) == width:
+            values.extend(extra)
+            yield make_record(dictionary.encode(values))
+        elif values:
+            yield {**_odd_row(header, values), **dict(zip(missing, extra))}
+
+
+def _odd_row(header: list[str], values: list[str]) -> Row:
+    """Converts a row with an unexpected number of fields into a dict,
+    the same way as `csv.DictReader` (with default restkey and restval) would."""
+    row: dict[Any, Any] = dict(zip(header, values))
+    if len(values) > len(header):
+        row[None] = values[len(header) :]
+    else:
+        for key in header[len(values) :]:
+            row[key] = None
+    return row
+
+
+def _column_indices(header: list[str], columns: Sequence[str]) -> Optional[list[int]]:
+    """Returns the indices of all `columns` in the header,
+    or None if any of them is missing."""
+    try:
+        return [header.index(column) for column in columns]
+    except ValueError:
+        return None
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Temporarily disables the cyclic garbage collector.
+
+    Loading creates millions of container objects, which are all kept alive;
+    without this, the collector would repeatedly traverse them for nothing."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _maybe_pipelined(info: zipfile.ZipInfo, stream: IO[bytes]) -> ContextManager[IO[bytes]]:
+    """Wraps a stream of a zip member in a PipelinedReader,
+    if the member is compressed and large enough for it to be worth it."""
+    if info.compress_type == zipfile.ZIP_STORED or info.file_size < PIPELINE_THRESHOLD:
+        return nullcontext(stream)
+    return BufferedReader(PipelinedReader(stream), DEFAULT_BLOCK_SIZE)  # type: ignore
+
+
+DERIVED_STRUCTURES = (
+    "stop_grid",
+    "route_trips",
+    "calendar_summary",
+    "trip_summaries",
+    "blocks",
+    "transfers_to",
+    "transfers_from_trip",
+    "station_graphs",
+)
+"""Structures computed by Gtfs.build_indexes, in order"""
+
+REBUILDABLE_STRUCTURES = (
+    "stop_children",
+    "route_trips",
+    "calendar_summary",
+    "transfers_to",
+    "transfers_from_trip",
+    "station_graphs",
+    "stop_grid",
+    "blocks",
+    "stop_times_by_stops",
+    "trip_summaries",
+)
+"""Structures which may be evicted from memory, and rebuilt from the tables when needed;
+ordered from the cheapest to rebuild"""
+
+ROW_INDEXES = {"stop_times_by_stops", "transfers_to", "transfers_from_trip"}
+"""Structures which only group rows of other tables"""
+
+_rebuild_lock = threading.RLock()
+
+TABLE_KEYS: dict[str, str] = {
     "agency": "agency_id",
     "stops": "stop_id",
     "routes": "route_id",
@@ -57,7 +311,10 @@ _table_keys: dict[str, str] = {
     "frequencies": "trip_id",
     "stop_times": "trip_id",
     "shapes": "shape_id",
+    "transfers": "from_stop_id",
+    "pathways": "pathway_id",
 }
+"""Columns by which rows of every table are keyed"""
 
 
 @dataclass
@@ -68,37 +325,59 @@ class Gtfs:
     agency: TableToOne = field(default_factory=dict)
     stops: TableToOne = field(default_factory=dict)
     stop_children: dict[str, list[str]] = field(default_factory=dict)
+    stop_grid: StopGrid = field(default_factory=StopGrid)
     routes: TableToOne = field(default_factory=dict)
     trips: TableToOne = field(default_factory=dict)
+    route_trips: dict[str, list[str]] = field(default_factory=dict)
     calendar: TableToOne = field(default_factory=dict)
     calendar_dates: TableToMany = field(default_factory=dict)
+    calendar_summary: CalendarSummary = field(default_factory=CalendarSummary)
     frequencies: TableToMany = field(default_factory=dict)
-    stop_times: TableToMany = field(default_factory=dict)
-    stop_times_by_stops: TableToMany = field(default_factory=dict)
+    stop_times: TableToManyOnDisk = field(default_factory=dict)
+    stop_times_by_stops: TableToManyOnDisk = field(default_factory=dict)
     shapes: TableToPoints = field(default_factory=dict)
+    trip_summaries: dict[str, TripSummary] = field(default_factory=dict)
+    blocks: dict[str, list[str]] = field(default_factory=dict)
+    transfers: TableToMany = field(default_factory=dict)
+    transfers_to: TableToMany = field(default_factory=dict)
+    transfers_from_trip: TableToMany = field(default_factory=dict)
+    pathways: TableToOne = field(default_factory=dict)
+    station_graphs: dict[str, StationGraph] = field(default_factory=dict)
+    dangling: dict[ForeignKey, dict[str, list[str]]] = field(default_factory=dict)
+    memory_limit: Optional[int] = field(default=None, compare=False)
+    """If set, stop_times are sorted and kept on disk (see jvig.external),
+    using about this many bytes of memory while loading"""
+
+    _service_dates: dict[str, frozenset[date]] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+        compare=False,
+    )
 
     def load_to_row(self, table_name: str, stream: IO[str]) -> None:
         """Loads a table where the key should map into a single row,
         like agency.txt or calendar.txt."""
-        primary_key = _table_keys[table_name]
+        primary_key = TABLE_KEYS[table_name]
         table: TableToOne = getattr(self, table_name)
         table.clear()
 
-        for row in csv.DictReader(stream):
-            # Fix for GTFS feeds without an explicit agency_id
-            if table_name in ("agency", "routes") and "agency_id" not in row:
-                row["agency_id"] = "(missing)"
+        # Fix for GTFS feeds without an explicit agency_id
+        defaults = {"agency_id": MISSING_AGENCY_ID} if table_name in ("agency", "routes") else None
 
+        for row in _read_records(stream, primary_key, defaults):
             table[row[primary_key]] = row
 
     def load_to_rows(self, table_name: str, stream: IO[str]) -> None:
         """Loads a table where the key should map into multiple row, like frequencies.txt."""
-        primary_key = _table_keys[table_name]
+        primary_key = TABLE_KEYS[table_name]
         table: TableToMany = getattr(self, table_name)
         table.clear()
 
-        for row in csv.DictReader(stream):
-            table.setdefault(row[primary_key], []).append(row)
+        # NOTE: The key column may be optional (like transfers.from_stop_id) -
+        #       rows without it are grouped under an empty key
+        for row in _read_rows(stream):
+            table.setdefault(row.get(primary_key, ""), []).append(row)
 
     def load_stops(self, table_name: str, stream: IO[str]) -> None:
         """Specialized loader for stops.txt, which loads data into both
@@ -107,7 +386,7 @@ class Gtfs:
         self.stops.clear()
         self.stop_children.clear()
 
-        for row in csv.DictReader(stream):
+        for row in _read_records(stream, "stop_id"):
             self.stops[row["stop_id"]] = row
 
             # Check if this is a child stop belonging to a larger structure
@@ -121,13 +400,35 @@ class Gtfs:
 
         shapes_with_indices: dict[str, list[tuple[int, Point]]] = {}
 
-        for row in csv.DictReader(stream):
-            idx = sequence_to_int(row.get("shape_pt_sequence", ""))
-            pt = _get_shape_pt(row)
+        # Only 4 columns are needed - project them directly from the csv.reader tuples
+        reader = csv.reader(stream)
+        header = next(reader, [])
+        indices = _column_indices(
+            header,
+            ("shape_id", "shape_pt_sequence", "shape_pt_lat", "shape_pt_lon"),
+        )
+
+        if indices is None:
+            # Odd file - use the slow, dict-based path
+            self._load_shapes_slow(header, reader, shapes_with_indices)
+        else:
+            id_idx, seq_idx, lat_idx, lon_idx = indices
+            last_idx = max(indices)
+
+            for values in reader:
+                if len(values) <= last_idx:
+                    # NOTE: Rows without all the needed columns are silently ignored
+                    continue
 
-            # NOTE: Invalid rows are silently ignored
-            if idx >= 0 and pt is not None:
-                shapes_with_indices.setdefault(row["shape_id"], []).append((idx, pt))
+                try:
+                    idx = int(values[seq_idx])
+                    pt = float(values[lat_idx]), float(values[lon_idx])
+                except ValueError:
+                    # NOTE: Invalid rows are silently ignored
+                    continue
+
+                if idx >= 0:
+                    shapes_with_indices.setdefault(values[id_idx], []).append((idx, pt))
 
         # Sort shapes by shape_pt_sequence
         for shape in shapes_with_indices.values():
@@ -138,28 +439,288 @@ class Gtfs:
             shape_id: [i[1] for i in shape] for shape_id, shape in shapes_with_indices.items()
         }
 
+    @staticmethod
+    def _load_shapes_slow(
+        header: list[str],
+        reader: Iterator[list[str]],
+        shapes_with_indices: dict[str, list[tuple[int, Point]]],
+    ) -> None:
+        for row in _zip_rows(header, reader):
+            idx = sequence_to_int(row.get("shape_pt_sequence", ""))
+            pt = _get_shape_pt(row)
+
+            # NOTE: Invalid rows are silently ignored
+            if idx >= 0 and pt is not None:
+                shapes_with_indices.setdefault(row["shape_id"], []).append((idx, pt))
+
     def load_stop_times(self, table_name: str, stream: IO[str]) -> None:
         """Specialized loader for stop_times.txt, which loads the data
         into self.stop_times and self.stop_times_by_stops."""
 
         assert table_name == "stop_times"
-        self.stop_times.clear()
-        self.stop_times_by_stops.clear()
 
-        for row in csv.DictReader(stream):
-            self.stop_times.setdefault(row["trip_id"], []).append(row)
-            self.stop_times_by_stops.setdefault(row["stop_id"], []).append(row)
+        reader = csv.reader(stream)
+        header = next(reader, [])
+        indices = _column_indices(header, ("trip_id", "stop_id"))
+        width = len(header)
+
+        if self.memory_limit is not None and indices is not None:
+            self._load_stop_times_externally(header, reader, *indices)
+            return
+
+        by_trip: TableToMany = {}
+        by_stop: TableToMany = {}
+        self.stop_times = by_trip
+        self.stop_times_by_stops = by_stop
+
+        if indices is None:
+            # Odd file - use the slow, dict-based path
+            for row in _zip_rows(header, reader):
+                by_trip.setdefault(row["trip_id"], []).append(row)
+                by_stop.setdefault(row["stop_id"], []).append(row)
+        else:
+            trip_idx, stop_idx = indices
+            for values in reader:
+                if len(values) == width:
+                    row = dict(zip(header, values))
+                    trip_id = values[trip_idx]
+                    stop_id = values[stop_idx]
+                elif values:
+                    row = _odd_row(header, values)
+                    trip_id = row["trip_id"]
+                    stop_id = row["stop_id"]
+                else:
+                    continue
+
+                by_trip.setdefault(trip_id, []).append(row)
+                by_stop.setdefault(stop_id, []).append(row)
 
         # Sort stop_times by stop_sequence
-        for trip_stop_times in self.stop_times.values():
+        for trip_stop_times in by_trip.values():
             trip_stop_times.sort(key=lambda row: sequence_to_int(row.get("stop_sequence", "")))
 
+    def _load_stop_times_externally(
+        self,
+        header: list[str],
+        reader: Iterator[list[str]],
+        trip_idx: int,
+        stop_idx: int,
+    ) -> None:
+        """Sorts stop_times.txt (by trips and by stops) into files on disk,
+        which are read back on demand - see jvig.external."""
+        assert self.memory_limit is not None
+        width = len(header)
+        sequence_idx = header.index("stop_sequence") if "stop_sequence" in header else width
+
+        def to_row(values: list[str]) -> Row:
+            return dict(zip(header, values)) if len(values) == width else _odd_row(header, values)
+
+        def by_trip(values: list[str]) -> tuple[str, int]:
+            trip_id = values[trip_idx] if trip_idx < len(values) else ""
+            sequence = values[sequence_idx] if sequence_idx < len(values) else ""
+            return trip_id, sequence_to_int(sequence)
+
+        def by_stop(values: list[str]) -> str:
+            return values[stop_idx] if stop_idx < len(values) else ""
+
+        logger.info(f"Sorting stop_times on disk, using up to {self.memory_limit} bytes")
+        self.stop_times, self.stop_times_by_stops = external_sort(
+            (values for values in reader if values),
+            [SortOrder(trip_idx, by_trip), SortOrder(stop_idx, by_stop)],
+            to_row,
+            self.memory_limit,
+        )
+
+    def build_indexes(self) -> None:
+        """Computes the derived structures, which depend on more than one table.
+        Must be called after all tables are loaded."""
+        for name in DERIVED_STRUCTURES:
+            setattr(self, name, getattr(self, f"_build_{name}")())
+
+        self._service_dates.clear()
+        self._check_references()
+
+    def _build_stop_children(self) -> dict[str, list[str]]:
+        stop_children: dict[str, list[str]] = {}
+        for stop_id, stop in self.stops.items():
+            parent = stop.get("parent_station")
+            if parent and stop.get("location_type") != "1":
+                stop_children.setdefault(parent, []).append(stop_id)
+        return stop_children
+
+    def _build_stop_times_by_stops(self) -> TableToMany:
+        # NOTE: Stop times are ordered by their trips, not by their position in the file
+        by_stop: TableToMany = {}
+        for row in chain.from_iterable(self.stop_times.values()):
+            by_stop.setdefault(row["stop_id"], []).append(row)
+        return by_stop
+
+    def _build_stop_grid(self) -> StopGrid:
+        return StopGrid.from_stops(self.stops.values())
+
+    def _build_route_trips(self) -> dict[str, list[str]]:
+        route_trips: dict[str, list[str]] = {}
+        for trip_id, trip in self.trips.items():
+            route_trips.setdefault(trip.get("route_id", ""), []).append(trip_id)
+        return route_trips
+
+    def _build_calendar_summary(self) -> CalendarSummary:
+        return summarize_calendars(self.calendar, self.calendar_dates, self.trips.values())
+
+    def _build_trip_summaries(self) -> dict[str, TripSummary]:
+        # NOTE: A single pass over stop_times, instead of a lookup for every trip,
+        #       as they might be read from disk
+        summaries = {
+            trip_id: _summarize_trip(self.trips[trip_id], times)
+            for trip_id, times in self.stop_times.items()
+            if trip_id in self.trips
+        }
+        return {
+            trip_id: summaries[trip_id] if trip_id in summaries else _summarize_trip(trip, [])
+            for trip_id, trip in self.trips.items()
+        }
+
+    def _build_blocks(self) -> dict[str, list[str]]:
+        # Group trips by block_id, ordered by their first departure
+        blocks: dict[str, list[str]] = {}
+        for trip_id, trip in self.trips.items():
+            block_id = trip.get("block_id")
+            if block_id:
+                blocks.setdefault(block_id, []).append(trip_id)
+
+        summaries = self.trip_summaries
+        for block_trips in blocks.values():
+            block_trips.sort(key=lambda trip_id: summaries[trip_id].first_departure)
+        return blocks
+
+    def _build_transfers_to(self) -> TableToMany:
+        # NOTE: transfers are loaded by from_stop_id
+        transfers_to: TableToMany = {}
+        for transfer in chain.from_iterable(self.transfers.values()):
+            if transfer.get("to_stop_id"):
+                transfers_to.setdefault(transfer["to_stop_id"], []).append(transfer)
+        return transfers_to
+
+    def _build_transfers_from_trip(self) -> TableToMany:
+        transfers_from_trip: TableToMany = {}
+        for transfer in chain.from_iterable(self.transfers.values()):
+            if transfer.get("from_trip_id"):
+                transfers_from_trip.setdefault(transfer["from_trip_id"], []).append(transfer)
+        return transfers_from_trip
+
+    def _build_station_graphs(self) -> dict[str, StationGraph]:
+        return build_station_graphs(self.pathways.values(), self.station_of)
+
+    def evictable_structures(self) -> list[str]:
+        """Returns the names of structures, which may be released with `evict`"""
+        return [
+            name
+            for name in REBUILDABLE_STRUCTURES
+            # stop_times_by_stops kept on disk can't be rebuilt without loading all stop_times
+            if name != "stop_times_by_stops" or isinstance(self.stop_times_by_stops, dict)
+        ]
+
+    def evict(self, name: str) -> None:
+        """Releases one of REBUILDABLE_STRUCTURES. It's going to be rebuilt
+        once it's accessed again."""
+        if name not in REBUILDABLE_STRUCTURES:
+            raise ValueError(f"{name} can't be evicted")
+        with _rebuild_lock:
+            self.__dict__.pop(name, None)
+
+    def estimated_size(self, name: str) -> int:
+        """Estimates the memory used by a table or a derived structure (see estimate_size).
+        Evicted structures aren't rebuilt, and use no memory."""
+        value = self.__dict__.get(name)
+        if value is None:
+            return 0
+        # Rows are already counted in their tables
+        return estimate_size(value, 1 if name in ROW_INDEXES else -1)
+
+    if not TYPE_CHECKING:
+        # NOTE: Only called for missing attributes - like the evicted structures
+
+        def __getattr__(self, name: str) -> Any:
+            if name not in REBUILDABLE_STRUCTURES:
+                raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+            with _rebuild_lock:
+                value = self.__dict__.get(name)
+                if value is None:
+                    logger.info(f"Rebuilding {name}")
+                    value = getattr(self, f"_build_{name}")()
+                    setattr(self, name, value)
+            return value
+
+    def _check_references(self) -> None:
+        """Finds all dangling references (see FOREIGN_KEYS) in a single pass over every
+        referencing table, and stores them in `dangling`, mapping dangling values
+        to the referrers (like trip_ids) of rows with such broken references."""
+        self.dangling.clear()
+
+        foreign_keys_by_table: dict[str, list[ForeignKey]] = {}
+        for fk in FOREIGN_KEYS:
+            foreign_keys_by_table.setdefault(fk.table, []).append(fk)
+
+        for table_name, foreign_keys in foreign_keys_by_table.items():
+            # Find the columns to check; skipping over those absent from the table
+            header = self.header_of(table_name)
+            checks = [
+                (fk, [getattr(self, i) for i in fk.targets])
+                for fk in foreign_keys
+                if fk.column in header
+            ]
+            if not checks:
+                continue
+
+            table: Union[TableToOne, TableToMany] = getattr(self, table_name)
+            rows: Iterable[Row] = (
+                chain.from_iterable(table.values())  # type: ignore
+                if table and isinstance(next(iter(table.values())), list)
+                else table.values()
+            )
+
+            for row in rows:
+                for fk, targets in checks:
+                    value = row.get(fk.column)
+                    if not value or any(value in target for target in targets):
+                        continue
+                    if fk.column == "agency_id" and value == MISSING_AGENCY_ID:
+                        # Added by load_to_row, not an actual reference
+                        continue
+
+                    referrers = self.dangling.setdefault(fk, {}).setdefault(value, [])
+                    referrer = row.get(fk.referrer, "")
+                    if not referrers or referrers[-1] != referrer:
+                        referrers.append(referrer)
+
+    def is_dangling(self, table_name: str, column: str, value: str) -> bool:
+        """Checks if `value` of a column is a reference to a non-existing row.
+        Returns False for columns which aren't foreign keys."""
+        for fk, values in self.dangling.items():
+            if fk.table == table_name and fk.column == column and value in values:
+                return True
+        return False
+
+    def dangling_columns(self, table_name: str, row: Row) -> list[str]:
+        """Returns the columns of a row, which reference non-existing rows."""
+        return [
+            fk.column
+            for fk, values in self.dangling.items()
+            if fk.table == table_name and row.get(fk.column, "") in values
+        ]
+
+    def trip_summary(self, trip_id: str) -> TripSummary:
+        """Returns the TripSummary of a particular trip,
+        or EMPTY_TRIP_SUMMARY if the trip is unknown."""
+        return self.trip_summaries.get(trip_id, EMPTY_TRIP_SUMMARY)
+
     def header_of(self, table_name: str) -> List[str]:
         """Returns the GTFS header of a particlar table."""
         table: Union[TableToOne, TableToMany] = getattr(self, table_name)
 
         # Get the first entry from the table
-        entry = next(iter(table.values()), Row())
+        entry: Union[Row, list[Row]] = next(iter(table.values()), {})
 
         # If it's a list of rows, get its first row
         if isinstance(entry, list):
@@ -180,12 +741,14 @@ class Gtfs:
             "frequencies": self.load_to_rows,
             "stop_times": self.load_stop_times,
             "shapes": self.load_shapes,
+            "transfers": self.load_to_rows,
+            "pathways": self.load_to_row,
         }
 
     @classmethod
-    def from_directory(cls, where: Path) -> "Gtfs":
+    def from_directory(cls, where: Path, memory_limit: Optional[int] = None) -> "Gtfs":
         """Loads GTFS data from a directory of .txt files"""
-        self = cls()
+        self = cls(memory_limit=memory_limit)
         loaders = self._loader_table
 
         for f in where.glob("*.txt"):
@@ -194,15 +757,16 @@ class Gtfs:
 
             if loader:
                 logger.info(f"Loading table {table_name}")
-                with f.open(mode="r", encoding="utf-8-sig", newline="") as stream:
+                with f.open(mode="r", encoding="utf-8-sig", newline="") as stream, gc_paused():
                     loader(table_name, stream)
 
+        self.build_indexes()
         return self
 
     @classmethod
-    def from_zip(cls, where: Path) -> "Gtfs":
+    def from_zip(cls, where: Path, memory_limit: Optional[int] = None) -> "Gtfs":
         """Loads GTFS data from a .zip archive"""
-        self = cls()
+        self = cls(memory_limit=memory_limit)
         loaders = self._loader_table
 
         with zipfile.ZipFile(where, mode="r") as archive:
@@ -217,19 +781,30 @@ class Gtfs:
                 if loader:
                     logger.info(f"Loading table {table_name}")
                     with archive.open(f, mode="r") as binary_stream:
-                        stream = TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
-                        loader(table_name, stream)
+                        with _maybe_pipelined(f, binary_stream) as pipelined_stream:
+                            stream = TextIOWrapper(
+                                pipelined_stream,
+                                encoding="utf-8-sig",
+                                newline="",
+                            )
+                            with gc_paused():
+                                loader(table_name, stream)
 
                 else:
                     logger.warning(f"Unrecognized file in zip: {f.filename}")
 
+        self.build_indexes()
         return self
 
     @classmethod
-    def from_user_input(cls, where: Path) -> "Gtfs":
+    def from_user_input(cls, where: Path, memory_limit: Optional[int] = None) -> "Gtfs":
         """Loads data from a .zip file (if `where` is a file),
-        or from a directory with .txt files (if `where` is not a file)"""
-        return cls.from_zip(where) if where.is_file() else cls.from_directory(where)
+        or from a directory with .txt files (if `where` is not a file).
+
+        If `memory_limit` is set, stop_times are kept on disk (see Gtfs.memory_limit)."""
+        if where.is_file():
+            return cls.from_zip(where, memory_limit)
+        return cls.from_directory(where, memory_limit)
 
     def all_stops_in_group(self, stop_id: str) -> list[Row]:
         """Returns all stops in the group to which `stop_id` belongs.
@@ -270,6 +845,49 @@ class Gtfs:
 
         return stops
 
+    def station_of(self, stop_id: str) -> str:
+        """Returns the id of the station to which a stop belongs, following parent_station
+        of boarding areas through their platforms. Stops outside of stations
+        (and stations themselves) are their own stations."""
+        for _ in range(3):
+            parent_id = self.stops.get(stop_id, {}).get("parent_station")
+            if not parent_id:
+                break
+            stop_id = parent_id
+        return stop_id
+
+    def station_graph(self, stop_id: str) -> Optional[StationGraph]:
+        """Returns the StationGraph of the station to which a stop belongs,
+        if it has any pathways"""
+        return self.station_graphs.get(self.station_of(stop_id))
+
+    def nearby_stops(self, stop_id: str, radius: float = NEARBY_RADIUS) -> list[tuple[float, Row]]:
+        """Returns (distance, stop) pairs of all other stops within `radius` meters
+        from the provided stop, ordered by the distance (see StopGrid.within).
+
+        If the stop doesn't exist or has no valid position, returns an empty list.
+        """
+        stop = self.stops.get(stop_id)
+        try:
+            lat = float(stop["stop_lat"])  # type: ignore
+            lon = float(stop["stop_lon"])  # type: ignore
+        except (TypeError, KeyError, ValueError):
+            return []
+
+        return [
+            (distance, self.stops[other_id])
+            for distance, other_id in self.stop_grid.within(lat, lon, radius)
+            if other_id != stop_id
+        ]
+
+    def service_dates(self, service_id: str) -> frozenset[date]:
+        """Returns a (cached) set of all dates on which a particular calendar is active"""
+        dates = self._service_dates.get(service_id)
+        if dates is None:
+            dates = frozenset(self.all_dates_of(service_id))
+            self._service_dates[service_id] = dates
+        return dates
+
     def all_dates_of(self, service_id: str) -> set[date]:
         """Returns a set of all date on which a particular calendar is active"""
         dates: set[date] = set()
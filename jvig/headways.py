@@ -0,0 +1,218 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+from .gtfs import Gtfs
+from .memory import estimate_size
+from .util import int_to_time, sequence_to_int, time_to_int
+
+DEFAULT_CACHE_SIZE = 4096
+
+WHOLE_DAY = (0, 48 * 3600)
+"""Default window of expanded departures, covering times up to 47:59:59"""
+
+
+class Departure(NamedTuple):
+    """Departure represents a single virtual departure of a frequency-based trip from a stop."""
+
+    trip_id: str
+    service_id: str
+    stop_id: str
+    stop_sequence: str
+    trip_start: int
+    arrival: int
+    departure: int
+    exact_times: bool
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "trip_id": self.trip_id,
+            "service_id": self.service_id,
+            "stop_id": self.stop_id,
+            "stop_sequence": self.stop_sequence,
+            "trip_start": int_to_time(self.trip_start),
+            "arrival_time": int_to_time(self.arrival),
+            "departure_time": int_to_time(self.departure),
+            "exact_times": self.exact_times,
+        }
+
+
+class _StopCall(NamedTuple):
+    trip_id: str
+    service_id: str
+    stop_sequence: str
+    arrival_offset: int
+    departure_offset: int
+
+
+class HeadwayExpander:
+    """HeadwayExpander lazily generates virtual departures of frequency-based trips
+    (trips from frequencies.txt) from their template stop_times.
+
+    Nothing is materialized up-front: the start times of a trip are only generated
+    for a requested time window, and those are memoized per (trip, window) in a bounded
+    LRU cache.
+    """
+
+    def __init__(self, gtfs: Gtfs, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.gtfs = gtfs
+        self.cache_size = cache_size
+        self._starts: "OrderedDict[tuple[str, int, int], tuple[tuple[int, bool], ...]]" = (
+            OrderedDict()
+        )
+        self._calls: dict[str, list[_StopCall]] = {}
+        self._lock = threading.Lock()
+
+    def trip_starts(
+        self,
+        trip_id: str,
+        start: int = WHOLE_DAY[0],
+        end: int = WHOLE_DAY[1],
+    ) -> tuple[tuple[int, bool], ...]:
+        """Returns (start_time, exact_times) pairs of all virtual trips
+        of a frequency-based trip, which depart from the first stop in [start, end)."""
+        key = (trip_id, start, end)
+        with self._lock:
+            starts = self._starts.get(key)
+            if starts is not None:
+                self._starts.move_to_end(key)
+                return starts
+
+        starts = tuple(self._generate_starts(trip_id, start, end))
+
+        with self._lock:
+            self._starts[key] = starts
+            while len(self._starts) > self.cache_size:
+                self._starts.popitem(last=False)
+
+        return starts
+
+    def _generate_starts(self, trip_id: str, start: int, end: int) -> list[tuple[int, bool]]:
+        starts: list[tuple[int, bool]] = []
+
+        for row in self.gtfs.frequencies.get(trip_id, []):
+            period_start = time_to_int(row.get("start_time", ""))
+            period_end = time_to_int(row.get("end_time", ""))
+            headway = sequence_to_int(row.get("headway_secs", ""))
+            exact_times = row.get("exact_times") == "1"
+
+            # NOTE: Invalid rows are silently ignored - they're marked on the trip page
+            if period_start < 0 or period_end < 0 or headway <= 0:
+                continue
+
+            # Skip over the virtual trips starting before the window
+            t = period_start
+            if t < start:
+                t += -(-(start - t) // headway) * headway
+
+            while t < period_end and t < end:
+                starts.append((t, exact_times))
+                t += headway
+
+        starts.sort()
+        return starts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._starts.clear()
+            self._calls.clear()
+
+    def estimated_size(self) -> int:
+        with self._lock:
+            return estimate_size((self._starts, self._calls))
+
+    def _calls_at(self, stop_id: str) -> list[_StopCall]:
+        """Returns calls of frequency-based trips at a particular stop,
+        with times relative to the start of the trip."""
+        with self._lock:
+            calls = self._calls.get(stop_id)
+        if calls is not None:
+            return calls
+
+        calls = []
+        for time in self.gtfs.stop_times_by_stops.get(stop_id, []):
+            trip_id = time["trip_id"]
+            trip = self.gtfs.trips.get(trip_id)
+            if trip is None or trip_id not in self.gtfs.frequencies:
+                continue
+
+            trip_start = self.gtfs.trip_summary(trip_id).first_departure
+            arrival = time_to_int(time.get("arrival_time") or time.get("departure_time") or "")
+            departure = time_to_int(time.get("departure_time") or time.get("arrival_time") or "")
+            if trip_start < 0 or arrival < 0 or departure < 0:
+                continue
+
+            calls.append(
+                _StopCall(
+                    trip_id,
+                    trip.get("service_id", ""),
+                    time.get("stop_sequence", ""),
+                    arrival - trip_start,
+                    departure - trip_start,
+                )
+            )
+
+        with self._lock:
+            self._calls[stop_id] = calls
+        return calls
+
+    def has_departures_at(self, stop_id: str) -> bool:
+        """Checks if any frequency-based trip calls at a particular stop"""
+        return bool(self._calls_at(stop_id))
+
+    def departures_at(
+        self,
+        stop_id: str,
+        start: int = WHOLE_DAY[0],
+        end: int = WHOLE_DAY[1],
+        day: Optional[date] = None,
+    ) -> list[Departure]:
+        """Returns virtual departures of all frequency-based trips from a particular stop,
+        which depart in [start, end), ordered by the departure time.
+
+        If `day` is provided, only trips active on that day are considered.
+        """
+        departures: list[Departure] = []
+
+        for call in self._calls_at(stop_id):
+            if day is not None and day not in self.gtfs.service_dates(call.service_id):
+                continue
+
+            # Shift the window, so that it applies to the trip start times
+            for trip_start, exact_times in self.trip_starts(
+                call.trip_id,
+                start - call.departure_offset,
+                end - call.departure_offset,
+            ):
+                departures.append(
+                    Departure(
+                        call.trip_id,
+                        call.service_id,
+                        stop_id,
+                        call.stop_sequence,
+                        trip_start,
+                        trip_start + call.arrival_offset,
+                        trip_start + call.departure_offset,
+                        exact_times,
+                    )
+                )
+
+        departures.sort(key=lambda d: d.departure)
+        return departures
@@ -0,0 +1,182 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import sys
+import threading
+from itertools import islice
+from typing import Any, Callable, NamedTuple, Optional
+
+logger = logging.getLogger("jvig.memory")
+
+SAMPLE_SIZE = 32
+"""Number of elements of every container, whose sizes are measured by estimate_size"""
+
+DEFAULT_INTERVAL = 10.0
+"""Default time (in seconds) between budget checks of a MemoryGovernor"""
+
+
+def _size(obj: Any, depth: int, seen: set[int]) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if depth == 0 or isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, dict):
+        count = len(obj)  # type: ignore
+        sampled = sum(
+            _size(k, depth - 1, seen) + _size(v, depth - 1, seen)
+            for k, v in islice(obj.items(), SAMPLE_SIZE)  # type: ignore
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        count = len(obj)  # type: ignore
+        sampled = sum(_size(i, depth - 1, seen) for i in islice(obj, SAMPLE_SIZE))  # type: ignore
+    elif hasattr(obj, "__dict__"):
+        return size + _size(vars(obj), depth, seen)
+    elif hasattr(obj, "__slots__"):
+        return size + sum(
+            _size(getattr(obj, name), depth - 1, seen)
+            for cls in type(obj).__mro__
+            for name in getattr(cls, "__slots__", ())
+            if hasattr(obj, name)
+        )
+    else:
+        return size
+
+    return size + (sampled * count // SAMPLE_SIZE if count > SAMPLE_SIZE else sampled)
+
+
+def estimate_size(obj: Any, depth: int = -1) -> int:
+    """Estimates the memory (in bytes) used by an object and everything it contains,
+    up to `depth` levels of containers deep (-1 means no limit).
+
+    Only SAMPLE_SIZE elements of every container are measured, and the result is
+    extrapolated - this is quick, but rough. Objects reachable in multiple ways
+    (like header strings, shared by all rows of a table) are only counted once."""
+    return _size(obj, depth, set())
+
+
+class Structure(NamedTuple):
+    """Structure describes a part of a loaded feed, whose memory usage is tracked"""
+
+    name: str
+    size: Callable[[], int]
+
+    evict: Optional[Callable[[], None]] = None
+    """Releases the structure, which has to be rebuilt lazily on next use.
+    None for structures which can't be rebuilt, like the loaded tables."""
+
+
+class MemoryGovernor:
+    """MemoryGovernor tracks the approximate memory usage of registered structures,
+    and enforces a budget by evicting rebuildable structures.
+
+    Structures are evicted in the order of registration - register the ones which
+    are the cheapest to rebuild first. Without a budget, usage is only reported.
+    Nothing is evicted if the budget can't be met even with all rebuildable structures
+    released - they would be rebuilt right away, without ever freeing any memory.
+    """
+
+    def __init__(self, budget: Optional[int] = None, interval: float = DEFAULT_INTERVAL) -> None:
+        self.budget = budget
+        self.interval = interval
+        self.structures: list[Structure] = []
+        self.evictions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._warned = False
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        size: Callable[[], int],
+        evict: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.structures.append(Structure(name, size, evict))
+        self.evictions[name] = 0
+
+    def usage(self) -> dict[str, int]:
+        """Returns the estimated size (in bytes) of every structure"""
+        return {i.name: i.size() for i in self.structures}
+
+    def enforce(self) -> list[str]:
+        """Evicts structures until the total estimated usage fits in the budget.
+        Returns the names of evicted structures."""
+        if self.budget is None:
+            return []
+
+        with self._lock:
+            usage = self.usage()
+            total = sum(usage.values())
+            evicted: list[str] = []
+
+            fixed = sum(usage[i.name] for i in self.structures if i.evict is None)
+            if fixed > self.budget:
+                if not self._warned:
+                    logger.warning(
+                        f"Tables alone use {fixed} bytes, over the memory budget of "
+                        f"{self.budget} bytes - not evicting anything"
+                    )
+                    self._warned = True
+                return evicted
+
+            for structure in self.structures:
+                if total <= self.budget:
+                    break
+                if structure.evict is None or usage[structure.name] == 0:
+                    continue
+
+                structure.evict()
+                total -= usage[structure.name]
+                self.evictions[structure.name] += 1
+                evicted.append(structure.name)
+
+            if evicted:
+                logger.info(f"Over the memory budget - evicted {', '.join(evicted)}")
+            return evicted
+
+    def start(self) -> None:
+        """Starts enforcing the budget every `interval` seconds, on a daemon thread"""
+        if self.budget is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="jvig-memory", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.enforce()
+
+    def as_json(self) -> dict[str, Any]:
+        usage = self.usage()
+        return {
+            "budget": self.budget,
+            "total": sum(usage.values()),
+            "structures": [
+                {
+                    "name": i.name,
+                    "bytes": usage[i.name],
+                    "evictable": i.evict is not None,
+                    "evictions": self.evictions[i.name],
+                }
+                for i in self.structures
+            ],
+        }
@@ -0,0 +1,119 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import threading
+from queue import Empty, Full, Queue
+from typing import IO, Any, Union
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_BLOCKS = 16
+
+_POLL_INTERVAL = 0.1
+
+
+class PipelinedReader(io.RawIOBase):
+    """PipelinedReader is a read-only binary stream, which reads blocks
+    from the `source` stream on a separate producer thread.
+
+    For compressed zip members, reading the source inflates the data, and zlib
+    releases the GIL while doing so. This allows decompression to overlap
+    with the (Python-level) CSV parsing done by the consumer.
+
+    At most `max_blocks` blocks of `block_size` bytes are buffered at once.
+
+    The source stream is not closed by the PipelinedReader.
+    """
+
+    def __init__(
+        self,
+        source: IO[bytes],
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_blocks: int = DEFAULT_MAX_BLOCKS,
+    ) -> None:
+        super().__init__()
+        self._source = source
+        self._block_size = block_size
+        self._queue: "Queue[Union[bytes, BaseException]]" = Queue(max_blocks)
+        self._stopped = threading.Event()
+        self._block = b""
+        self._offset = 0
+        self._eof = False
+        self._thread = threading.Thread(
+            target=self._produce,
+            name="jvig-pipelined-reader",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _produce(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                block = self._source.read(self._block_size)
+                self._put(block)
+                if not block:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item: Union[bytes, BaseException]) -> None:
+        # Poll the stopped flag, so that the producer doesn't block forever
+        # if the consumer goes away before reaching the end of the stream.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                return
+            except Full:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self._eof:
+            return 0
+
+        if self._offset >= len(self._block):
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            elif not item:
+                self._eof = True
+                return 0
+
+            self._block = item
+            self._offset = 0
+
+        view = memoryview(buffer).cast("B")
+        n = min(len(view), len(self._block) - self._offset)
+        view[:n] = self._block[self._offset : self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stopped.set()
+
+            # Unblock the producer, if it's waiting for space in the queue
+            try:
+                while True:
+                    self._queue.get_nowait()
+            except Empty:
+                pass
+
+            self._thread.join()
+        super().close()
@@ -0,0 +1,503 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from math import ceil
+from typing import Any, Iterator, NamedTuple, Optional, Union
+
+from .gtfs import Gtfs, Row
+from .headways import HeadwayExpander
+from .memory import estimate_size
+from .util import haversine, int_to_time, time_to_int
+
+INFINITY = 1 << 30
+"""Arrival time at stops which weren't reached (yet)"""
+
+MAX_ROUNDS = 6
+"""Maximum number of vehicles used in a journey (so at most 5 transfers)"""
+
+WALK_SPEED = 1.25
+"""Walking speed (in m/s) used to compute the duration of transfers"""
+
+MAX_WALK_DISTANCE = 300.0
+"""Maximum distance (in meters) of a walking transfer between stops outside of a station"""
+
+STATION_TRANSFER_TIME = 120
+"""Duration (in seconds) of a transfer between stops of a station without known positions"""
+
+DAYS_CACHE_SIZE = 8
+"""Number of days for which active trips of all patterns are cached"""
+
+
+@dataclass
+class Pattern:
+    """Pattern is a group of trips visiting exactly the same sequence of stops, which never
+    overtake each other - that is, trips are ordered by their times at every stop.
+
+    Times of all trips are kept in a single flat array: the arrival of the t-th trip
+    at the i-th stop is at index `2 * (t * len(stops) + i)`, and the departure right after it.
+    """
+
+    stops: list[int]
+    trip_ids: list[str] = field(default_factory=list)
+    service_ids: list[str] = field(default_factory=list)
+    # NOTE: array only supports subscripting at runtime since Python 3.12
+    times: "array[int]" = field(default_factory=lambda: array("l"))
+
+    def arrival(self, trip: int, position: int) -> int:
+        return self.times[2 * (trip * len(self.stops) + position)]
+
+    def departure(self, trip: int, position: int) -> int:
+        return self.times[2 * (trip * len(self.stops) + position) + 1]
+
+
+class Leg(NamedTuple):
+    """Leg is a part of a journey - a ride on a single trip, or a walk (if `trip_id` is None)."""
+
+    from_stop_id: str
+    to_stop_id: str
+    departure: int
+    arrival: int
+    trip_id: Optional[str] = None
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "from_stop_id": self.from_stop_id,
+            "to_stop_id": self.to_stop_id,
+            "departure_time": int_to_time(self.departure),
+            "arrival_time": int_to_time(self.arrival),
+            "trip_id": self.trip_id,
+        }
+
+
+class Journey(NamedTuple):
+    legs: list[Leg]
+
+    @property
+    def departure(self) -> int:
+        return self.legs[0].departure if self.legs else -1
+
+    @property
+    def arrival(self) -> int:
+        return self.legs[-1].arrival if self.legs else -1
+
+    @property
+    def rides(self) -> int:
+        return sum(1 for leg in self.legs if leg.trip_id is not None)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "departure_time": int_to_time(self.departure),
+            "arrival_time": int_to_time(self.arrival),
+            "legs": [i.as_json() for i in self.legs],
+        }
+
+
+_Ride = tuple[int, int, int, int]
+"""Reached a stop by riding a (pattern, trip, boarding position, alighting position)"""
+
+_Walk = tuple[int, int]
+"""Reached a stop by walking (from stop, duration)"""
+
+
+def walking_transfers(
+    gtfs: Gtfs,
+    max_distance: float = MAX_WALK_DISTANCE,
+) -> Iterator[tuple[str, str, int]]:
+    """Yields (from_stop_id, to_stop_id, duration) of all candidate walking transfers
+    between stops at most `max_distance` meters apart (see StopGrid.pairs_within).
+    Every pair of stops is only yielded once, as walking durations are symmetric."""
+    for a, b, distance in gtfs.stop_grid.pairs_within(max_distance):
+        yield a, b, ceil(distance / WALK_SPEED)
+
+
+def _interpolate(times: list[int]) -> bool:
+    """Fills unknown (negative) times by linear interpolation between known ones.
+    Returns False if the first or the last time is unknown."""
+    if not times or times[0] < 0 or times[-1] < 0:
+        return False
+
+    previous = 0
+    for i in range(1, len(times)):
+        if times[i] < 0:
+            continue
+        if i - previous > 1:
+            step = (times[i] - times[previous]) / (i - previous)
+            for j in range(previous + 1, i):
+                times[j] = times[previous] + round(step * (j - previous))
+        previous = i
+    return True
+
+
+class Planner:
+    """Planner finds journeys between stops of a Gtfs instance,
+    using the round-based RAPTOR algorithm.
+
+    The timetable (patterns, per-stop lists of patterns and transfers) is built
+    on the first query. Frequency-based trips are expanded into regular trips.
+    Only trips active on the day of the query are used - trips after midnight
+    of the previous day (with times over 24:00:00) are not considered.
+    """
+
+    def __init__(self, gtfs: Gtfs, headways: HeadwayExpander) -> None:
+        self.gtfs = gtfs
+        self.headways = headways
+        self.stop_ids: list[str] = []
+        self.stop_index: dict[str, int] = {}
+        self.patterns: list[Pattern] = []
+        self.stop_patterns: list[list[tuple[int, int]]] = []
+        """Maps stops to (pattern, position) pairs of all patterns visiting them"""
+        self.transfers: list[list[tuple[int, int]]] = []
+        """Maps stops to (other stop, walking duration) pairs"""
+        self._built = False
+        self._lock = threading.Lock()
+        self._active: "OrderedDict[date, list[list[int]]]" = OrderedDict()
+
+    # Building the timetable
+
+    def build(self) -> None:
+        """Builds the timetable, unless it was already built"""
+        with self._lock:
+            if not self._built:
+                self._build_stops()
+                self._build_patterns()
+                self._build_transfers()
+                self._built = True
+
+    def estimated_size(self) -> int:
+        """Estimates the memory used by the timetable"""
+        return estimate_size(
+            (self.stop_ids, self.stop_index, self.patterns, self.stop_patterns, self.transfers)
+        )
+
+    def clear_days(self) -> None:
+        """Forgets the cached trips active on every day"""
+        with self._lock:
+            self._active.clear()
+
+    def days_estimated_size(self) -> int:
+        with self._lock:
+            return estimate_size(self._active)
+
+    def _build_stops(self) -> None:
+        self.stop_ids = list(self.gtfs.stops)
+        for stop_id in self.gtfs.stop_times_by_stops:
+            if stop_id not in self.gtfs.stops:
+                self.stop_ids.append(stop_id)
+        self.stop_index = {stop_id: idx for idx, stop_id in enumerate(self.stop_ids)}
+
+    def _build_patterns(self) -> None:
+        # Group trips by their sequences of stops
+        by_stops: dict[tuple[int, ...], list[tuple[list[int], str, str]]] = {}
+        for trip_id, trip in self.gtfs.trips.items():
+            stop_times = self.gtfs.stop_times.get(trip_id, [])
+            if len(stop_times) < 2:
+                continue
+
+            stops = tuple(self.stop_index[i["stop_id"]] for i in stop_times)
+            arrivals = [time_to_int(i.get("arrival_time") or "") for i in stop_times]
+            departures = [time_to_int(i.get("departure_time") or "") for i in stop_times]
+            for i in range(len(stops)):
+                if arrivals[i] < 0:
+                    arrivals[i] = departures[i]
+                elif departures[i] < 0:
+                    departures[i] = arrivals[i]
+            if not _interpolate(arrivals) or not _interpolate(departures):
+                continue
+
+            times = [t for pair in zip(arrivals, departures) for t in pair]
+            service_id = trip.get("service_id", "")
+            group = by_stops.setdefault(stops, [])
+
+            if trip_id in self.gtfs.frequencies:
+                for start, _ in self.headways.trip_starts(trip_id):
+                    offset = start - departures[0]
+                    group.append(([t + offset for t in times], trip_id, service_id))
+            else:
+                group.append((times, trip_id, service_id))
+
+        # Split every group into patterns of non-overtaking trips
+        for stops, trips in by_stops.items():
+            trips.sort(key=lambda i: i[0][1])
+            patterns: list[Pattern] = []
+            last_times: list[list[int]] = []
+
+            for times, trip_id, service_id in trips:
+                for pattern, last in zip(patterns, last_times):
+                    if all(a >= b for a, b in zip(times, last)):
+                        break
+                else:
+                    pattern = Pattern(list(stops))
+                    patterns.append(pattern)
+                    last_times.append(times)
+
+                last_times[patterns.index(pattern)] = times
+                pattern.trip_ids.append(trip_id)
+                pattern.service_ids.append(service_id)
+                pattern.times.extend(times)
+
+            self.patterns.extend(patterns)
+
+        # Index patterns by their stops
+        self.stop_patterns = [[] for _ in self.stop_ids]
+        for pattern_idx, pattern in enumerate(self.patterns):
+            for position, stop in enumerate(pattern.stops):
+                self.stop_patterns[stop].append((pattern_idx, position))
+
+    def _stop_position(self, stop: Row) -> Optional[tuple[float, float]]:
+        try:
+            return float(stop["stop_lat"]), float(stop["stop_lon"])
+        except (KeyError, ValueError):
+            return None
+
+    def _build_transfers(self) -> None:
+        transfers: list[dict[int, int]] = [{} for _ in self.stop_ids]
+
+        def add(a: int, b: int, duration: int) -> None:
+            if a != b and duration < transfers[a].get(b, INFINITY):
+                transfers[a][b] = duration
+                transfers[b][a] = duration
+
+        # Transfers within stations (see Gtfs.all_stops_in_group)
+        for parent_id, children in self.gtfs.stop_children.items():
+            group = [parent_id, *children]
+            for i, a in enumerate(group):
+                for b in group[i + 1 :]:
+                    if a not in self.stop_index or b not in self.stop_index:
+                        continue
+                    a_pt = self._stop_position(self.gtfs.stops.get(a, {}))
+                    b_pt = self._stop_position(self.gtfs.stops.get(b, {}))
+                    duration = (
+                        ceil(haversine(a_pt, b_pt) / WALK_SPEED)
+                        if a_pt is not None and b_pt is not None
+                        else STATION_TRANSFER_TIME
+                    )
+                    add(self.stop_index[a], self.stop_index[b], duration)
+
+        # Walking transfers between nearby stops
+        for a, b, duration in walking_transfers(self.gtfs):
+            add(self.stop_index[a], self.stop_index[b], duration)
+
+        self.transfers = [sorted(i.items()) for i in transfers]
+
+    # Querying the timetable
+
+    def _active_trips(self, day: date) -> list[list[int]]:
+        """Returns indices of trips of every pattern, active on the provided day"""
+        with self._lock:
+            active = self._active.get(day)
+            if active is not None:
+                self._active.move_to_end(day)
+                return active
+
+        active = [
+            [
+                trip
+                for trip, service_id in enumerate(pattern.service_ids)
+                if day in self.gtfs.service_dates(service_id)
+            ]
+            for pattern in self.patterns
+        ]
+
+        with self._lock:
+            self._active[day] = active
+            while len(self._active) > DAYS_CACHE_SIZE:
+                self._active.popitem(last=False)
+        return active
+
+    def _group_of(self, stop_id: str) -> list[int]:
+        return [
+            self.stop_index[i["stop_id"]]
+            for i in self.gtfs.all_stops_in_group(stop_id)
+            if i["stop_id"] in self.stop_index
+        ]
+
+    def plan(
+        self,
+        from_stop_id: str,
+        to_stop_id: str,
+        day: date,
+        departure: int,
+        max_rounds: int = MAX_ROUNDS,
+    ) -> list[Journey]:
+        """Finds journeys from a stop (or any stop of its station) to another stop
+        (or any stop of its station), departing at or after `departure` seconds
+        since noon minus 12h of `day`.
+
+        Returns the Pareto set of journeys - the quickest journey for every number
+        of used vehicles, as long as it arrives earlier than journeys with fewer vehicles.
+        """
+        self.build()
+        sources = self._group_of(from_stop_id)
+        targets = self._group_of(to_stop_id)
+        if not sources or not targets or not set(sources).isdisjoint(targets):
+            return []
+
+        active = self._active_trips(day)
+        best = [INFINITY] * len(self.stop_ids)
+        labels: list[list[int]] = []
+        parents: list[dict[int, Union[_Ride, _Walk]]] = []
+
+        # Round 0 - start at the sources and walk from them
+        current = [INFINITY] * len(self.stop_ids)
+        current_parents: dict[int, Union[_Ride, _Walk]] = {}
+        for s in sources:
+            current[s] = best[s] = departure
+        marked = set(sources)
+        self._relax_transfers(marked, current, best, current_parents)
+        labels.append(current)
+        parents.append(current_parents)
+
+        for _ in range(max_rounds):
+            if not marked:
+                break
+
+            previous = labels[-1]
+            current = [INFINITY] * len(self.stop_ids)
+            current_parents = {}
+            best_target = min(best[t] for t in targets)
+
+            # Collect patterns to scan, starting from the earliest marked stop of each one
+            queue: dict[int, int] = {}
+            for s in marked:
+                for pattern_idx, position in self.stop_patterns[s]:
+                    if position < queue.get(pattern_idx, INFINITY):
+                        queue[pattern_idx] = position
+            marked = set()
+
+            # Ride along every queued pattern
+            for pattern_idx, start in queue.items():
+                trips = active[pattern_idx]
+                if not trips:
+                    continue
+
+                pattern = self.patterns[pattern_idx]
+                trip = -1
+                board = -1
+                for position in range(start, len(pattern.stops)):
+                    s = pattern.stops[position]
+
+                    if trip >= 0:
+                        arrival = pattern.arrival(trips[trip], position)
+                        if arrival < best[s] and arrival < best_target:
+                            current[s] = best[s] = arrival
+                            current_parents[s] = (pattern_idx, trips[trip], board, position)
+                            marked.add(s)
+                            if s in targets:
+                                best_target = min(best_target, arrival)
+
+                    # Try to catch an earlier trip
+                    ready = previous[s]
+                    if ready < INFINITY and (
+                        trip < 0 or ready <= pattern.departure(trips[trip], position)
+                    ):
+                        lo, hi = 0, trip if trip >= 0 else len(trips)
+                        while lo < hi:
+                            mid = (lo + hi) // 2
+                            if pattern.departure(trips[mid], position) < ready:
+                                lo = mid + 1
+                            else:
+                                hi = mid
+                        if lo < len(trips) and lo != trip:
+                            trip = lo
+                            board = position
+
+            self._relax_transfers(marked, current, best, current_parents)
+            labels.append(current)
+            parents.append(current_parents)
+
+        return self._journeys(targets, labels, parents)
+
+    def _relax_transfers(
+        self,
+        marked: set[int],
+        current: list[int],
+        best: list[int],
+        current_parents: dict[int, Union[_Ride, _Walk]],
+    ) -> None:
+        for s in list(marked):
+            start = current[s]
+            for other, duration in self.transfers[s]:
+                arrival = start + duration
+                if arrival < best[other]:
+                    current[other] = best[other] = arrival
+                    current_parents[other] = (s, duration)
+                    marked.add(other)
+
+    def _journeys(
+        self,
+        targets: list[int],
+        labels: list[list[int]],
+        parents: list[dict[int, Union[_Ride, _Walk]]],
+    ) -> list[Journey]:
+        journeys: list[Journey] = []
+        best_arrival = INFINITY
+
+        for k, round_labels in enumerate(labels):
+            target = min(targets, key=lambda t: round_labels[t])
+            if round_labels[target] >= best_arrival:
+                continue
+            best_arrival = round_labels[target]
+            journeys.append(self._reconstruct(target, k, labels, parents))
+
+        return journeys
+
+    def _reconstruct(
+        self,
+        stop: int,
+        k: int,
+        labels: list[list[int]],
+        parents: list[dict[int, Union[_Ride, _Walk]]],
+    ) -> Journey:
+        legs: list[Leg] = []
+        while True:
+            parent = parents[k].get(stop)
+            if parent is None:
+                break
+
+            if len(parent) == 2:
+                from_stop, duration = parent  # type: ignore
+                arrival = labels[k][stop]
+                legs.append(
+                    Leg(
+                        self.stop_ids[from_stop],
+                        self.stop_ids[stop],
+                        arrival - duration,
+                        arrival,
+                    )
+                )
+                stop = from_stop
+            else:
+                pattern_idx, trip, board, alight = parent  # type: ignore
+                pattern = self.patterns[pattern_idx]
+                legs.append(
+                    Leg(
+                        self.stop_ids[pattern.stops[board]],
+                        self.stop_ids[stop],
+                        pattern.departure(trip, board),
+                        pattern.arrival(trip, alight),
+                        pattern.trip_ids[trip],
+                    )
+                )
+                stop = pattern.stops[board]
+                k -= 1
+
+        legs.reverse()
+        return Journey(legs)
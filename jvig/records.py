@@ -0,0 +1,131 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from functools import lru_cache
+from typing import Iterable, Iterator, Mapping, Optional, TypeVar, Union, overload
+
+T = TypeVar("T")
+
+DICTIONARY_SAMPLE = 10_000
+"""Number of rows, after which the cardinality of every column is checked"""
+
+MAX_DISTINCT_RATIO = 0.5
+"""Columns with more distinct values (relative to the number of rows) in the first
+DICTIONARY_SAMPLE rows are considered unique, and their values aren't deduplicated"""
+
+
+class Record(Mapping[str, str]):
+    """Record is a read-only row of a table, backed by a tuple of values.
+
+    Column names are only stored once, in a Record subclass generated for every header
+    (see `record_type`) - unlike dicts, which keep a hash table with all keys in every row.
+    Records behave like read-only dicts, so they can be used in place of dict rows.
+    """
+
+    __slots__ = ("_values",)
+
+    _header: tuple[str, ...] = ()
+    _index: dict[str, int] = {}
+
+    def __init__(self, values: tuple[str, ...]) -> None:
+        self._values = values
+
+    def __getitem__(self, key: str) -> str:
+        return self._values[self._index[key]]
+
+    @overload
+    def get(self, key: str) -> Optional[str]: ...
+
+    @overload
+    def get(self, key: str, default: Union[str, T]) -> Union[str, T]: ...
+
+    def get(self, key: str, default: object = None) -> object:
+        idx = self._index.get(key)
+        return default if idx is None else self._values[idx]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return f"Record({dict(self)!r})"
+
+    def __reduce__(self) -> tuple[object, ...]:
+        # NOTE: The header tuple is shared by all records, so pickle only stores it once
+        return _make_record, (self._header, self._values)
+
+
+@lru_cache(maxsize=None)
+def record_type(header: tuple[str, ...]) -> type[Record]:
+    """Returns the (cached) Record subclass for rows with the provided header.
+    Later duplicate columns shadow the earlier ones, just like in a dict."""
+    index = {column: idx for idx, column in enumerate(header)}
+    return type(  # type: ignore
+        "Record",
+        (Record,),
+        {"__slots__": (), "__module__": __name__, "_header": header, "_index": index},
+    )
+
+
+def _make_record(header: tuple[str, ...], values: tuple[str, ...]) -> Record:
+    return record_type(header)(values)
+
+
+class ColumnDictionary:
+    """ColumnDictionary deduplicates repeated values of low-cardinality columns
+    (like route_id, service_id or wheelchair_accessible of trips.txt),
+    so that all rows share a single string object for every distinct value.
+
+    Every string object takes at least 50 bytes, while a reference to a shared one
+    takes 8 - as much as an integer code of a column-oriented dictionary encoding would;
+    but without the need to decode the values on every access.
+
+    Columns with mostly distinct values (like IDs or names) are only detected after
+    DICTIONARY_SAMPLE rows; afterwards, their values are no longer looked up.
+    """
+
+    def __init__(self, width: int, skip: Iterable[int] = ()) -> None:
+        skipped = set(skip)
+        self.dictionaries: dict[int, dict[str, str]] = {
+            idx: {} for idx in range(width) if idx not in skipped
+        }
+        self.rows = 0
+        self._lookups = [(idx, i.setdefault) for idx, i in self.dictionaries.items()]
+
+    def encode(self, values: list[str]) -> tuple[str, ...]:
+        """Replaces the values of dictionary-encoded columns by their shared instances"""
+        self.rows += 1
+        if self.rows == DICTIONARY_SAMPLE:
+            self._drop_distinct_columns()
+
+        for idx, lookup in self._lookups:
+            value = values[idx]
+            values[idx] = lookup(value, value)
+        return tuple(values)
+
+    def _drop_distinct_columns(self) -> None:
+        limit = self.rows * MAX_DISTINCT_RATIO
+        self.dictionaries = {
+            idx: dictionary
+            for idx, dictionary in self.dictionaries.items()
+            if len(dictionary) <= limit
+        }
+        self._lookups = [(idx, i.setdefault) for idx, i in self.dictionaries.items()]
@@ -0,0 +1,255 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import chain
+from types import ModuleType
+from typing import Any, Iterable, Iterator, Optional
+
+from .gtfs import Gtfs, Row
+from .tables import (
+    agency,
+    calendar,
+    calendar_dates,
+    frequencies,
+    pathways,
+    routes,
+    stops,
+    times,
+    transfers,
+    trips,
+)
+
+TABLE_MODULES: dict[str, ModuleType] = {
+    "agency": agency,
+    "stops": stops,
+    "routes": routes,
+    "trips": trips,
+    "calendar": calendar,
+    "calendar_dates": calendar_dates,
+    "frequencies": frequencies,
+    "stop_times": times,
+    "transfers": transfers,
+    "pathways": pathways,
+}
+"""Maps Gtfs table names to modules from jvig.tables, which describe their fields"""
+
+ROW_KEY_FIELDS: dict[str, tuple[str, ...]] = {
+    "agency": ("agency_id",),
+    "stops": ("stop_id",),
+    "routes": ("route_id",),
+    "trips": ("trip_id",),
+    "calendar": ("service_id",),
+    "calendar_dates": ("service_id", "date"),
+    "frequencies": ("trip_id", "start_time"),
+    "stop_times": ("trip_id", "stop_sequence"),
+    "transfers": ("from_stop_id", "to_stop_id"),
+    "pathways": ("pathway_id",),
+}
+"""Fields which identify offending rows in the report"""
+
+DEFAULT_MAX_EXAMPLES = 10
+CHUNK_SIZE = 50_000
+"""Number of rows validated by a single worker task"""
+
+PARALLEL_THRESHOLD = 200_000
+"""Minimal number of rows in a feed for the validation to be spread across processes"""
+
+ChunkResult = dict[str, tuple[int, list[list[str]]]]
+
+
+@dataclass
+class Issue:
+    """Issue groups all problems of the same kind in a single column of a table."""
+
+    table: str
+    column: str
+    kind: str
+    """Either "invalid" (the value fails a check) or "unrecognized" (unknown column)"""
+
+    count: int = 0
+    examples: list[list[str]] = field(default_factory=list)
+    """Keys (as in ROW_KEY_FIELDS) of the first few offending rows"""
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "table": self.table,
+            "column": self.column,
+            "kind": self.kind,
+            "count": self.count,
+            "examples": self.examples,
+        }
+
+
+@dataclass
+class ValidationReport:
+    """ValidationReport summarizes checks of every field of a whole feed."""
+
+    rows_checked: dict[str, int] = field(default_factory=dict)
+    issues: list[Issue] = field(default_factory=list)
+
+    @property
+    def total_issues(self) -> int:
+        return sum(i.count for i in self.issues)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "rows_checked": self.rows_checked,
+            "total_issues": self.total_issues,
+            "issues": [i.as_json() for i in self.issues],
+        }
+
+    def as_text(self) -> str:
+        lines = [f"{sum(self.rows_checked.values())} rows checked, {self.total_issues} issues"]
+        for issue in self.issues:
+            lines.append(f"{issue.table}.{issue.column}: {issue.count} {issue.kind}")
+            for example in issue.examples:
+                lines.append(f"    {', '.join(example)}")
+        return "\n".join(lines)
+
+
+def _rows_of(gtfs: Gtfs, table_name: str) -> Iterator[Row]:
+    table = getattr(gtfs, table_name)
+    if table and isinstance(next(iter(table.values())), list):
+        return chain.from_iterable(table.values())
+    return iter(table.values())
+
+
+def _row_count(gtfs: Gtfs, table_name: str) -> int:
+    table = getattr(gtfs, table_name)
+    if table and isinstance(next(iter(table.values())), list):
+        return sum(len(i) for i in table.values())
+    return len(table)
+
+
+Task = tuple[str, list[str], list[tuple[list[str], list[str]]]]
+
+
+def _tasks(gtfs: Gtfs, table_name: str, columns: list[str]) -> Iterator[Task]:
+    """Generates chunks of (key, values) pairs, with values of only the checked columns.
+    This keeps the amount of data sent to worker processes to a minimum."""
+    key_fields = ROW_KEY_FIELDS[table_name]
+    chunk: list[tuple[list[str], list[str]]] = []
+
+    for row in _rows_of(gtfs, table_name):
+        key = [row.get(i) or "" for i in key_fields]
+        values = [row.get(i) or "" for i in columns]
+        chunk.append((key, values))
+        if len(chunk) >= CHUNK_SIZE:
+            yield table_name, columns, chunk
+            chunk = []
+
+    if chunk:
+        yield table_name, columns, chunk
+
+
+def _validate_chunk(
+    table_name: str,
+    columns: list[str],
+    rows: list[tuple[list[str], list[str]]],
+    max_examples: int,
+) -> ChunkResult:
+    """Validates a chunk of rows. Runs in worker processes,
+    so the checks are looked up by the table name (lambdas can't be pickled)."""
+    checks = [TABLE_MODULES[table_name].FIELD_CHECKS[i] for i in columns]
+    result: ChunkResult = {}
+
+    for key, values in rows:
+        for column, check, value in zip(columns, checks, values):
+            if not check(value):
+                count, examples = result.get(column, (0, []))
+                if len(examples) < max_examples:
+                    examples.append(key)
+                result[column] = (count + 1, examples)
+
+    return result
+
+
+def _run_in_pool(
+    tasks: Iterator[Task],
+    processes: Optional[int],
+    max_examples: int,
+) -> Iterator[tuple[str, ChunkResult]]:
+    """Runs _validate_chunk over all tasks in a process pool, yielding results in order.
+    Only a few tasks are in flight at once, so that the feed isn't copied as a whole."""
+    with ProcessPoolExecutor(processes) as pool:
+        in_flight: "deque[tuple[str, Future[ChunkResult]]]" = deque()
+        max_in_flight = 2 * (processes or os.cpu_count() or 1)
+
+        for task in tasks:
+            in_flight.append((task[0], pool.submit(_validate_chunk, *task, max_examples)))
+            if len(in_flight) >= max_in_flight:
+                table_name, future = in_flight.popleft()
+                yield table_name, future.result()
+
+        while in_flight:
+            table_name, future = in_flight.popleft()
+            yield table_name, future.result()
+
+
+def validate_feed(
+    gtfs: Gtfs,
+    processes: Optional[int] = None,
+    max_examples: int = DEFAULT_MAX_EXAMPLES,
+) -> ValidationReport:
+    """Runs every field check from jvig.tables over all rows of the feed.
+
+    Large feeds are split into chunks, which are checked by a pool of `processes` workers
+    (defaults to the number of CPUs). Pass `processes=1` to check everything in the
+    calling process.
+    """
+    report = ValidationReport()
+    tasks: list[Iterator[Task]] = []
+
+    for table_name, module in TABLE_MODULES.items():
+        header = gtfs.header_of(table_name)
+        columns = [i for i in header if i in module.FIELD_CHECKS]
+        extended_fields: set[str] = getattr(module, "EXTENDED_FIELDS", set())
+
+        # Unrecognized columns are reported once per table
+        for column in header:
+            if column not in module.VALID_FIELDS and column not in extended_fields:
+                report.issues.append(Issue(table_name, column, "unrecognized", 1))
+
+        report.rows_checked[table_name] = _row_count(gtfs, table_name)
+        if columns:
+            tasks.append(_tasks(gtfs, table_name, columns))
+
+    # Run the checks
+    all_tasks = chain.from_iterable(tasks)
+    if processes == 1 or sum(report.rows_checked.values()) < PARALLEL_THRESHOLD:
+        results: Iterable[tuple[str, ChunkResult]] = (
+            (task[0], _validate_chunk(*task, max_examples)) for task in all_tasks
+        )
+    else:
+        results = _run_in_pool(all_tasks, processes, max_examples)
+
+    # Merge the results of every chunk
+    issues: dict[tuple[str, str], Issue] = {}
+    for table_name, result in results:
+        for column, (count, examples) in result.items():
+            issue = issues.get((table_name, column))
+            if issue is None:
+                issue = Issue(table_name, column, "invalid")
+                issues[table_name, column] = issue
+            issue.count += count
+            issue.examples.extend(examples[: max_examples - len(issue.examples)])
+
+    report.issues.extend(issues.values())
+    return report
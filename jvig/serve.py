@@ -0,0 +1,192 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from flask import Flask, abort, redirect, render_template
+from werkzeug.serving import run_simple
+from werkzeug.wrappers import Response
+
+from .app import Application
+from .snapshot import load_gtfs
+
+logger = logging.getLogger("jvig.serve")
+
+DEFAULT_MEMORY_LIMIT = 2048 * 1024 * 1024
+
+MEMORY_FACTOR = 8
+"""Estimated ratio between the size of a loaded feed and the size of its .txt files"""
+
+FEED_PREFIX = "/feed/"
+
+
+class FeedInfo(NamedTuple):
+    name: str
+    path: Path
+    estimated_size: int
+
+
+def estimate_size(where: Path) -> int:
+    """Estimates the memory used by a loaded feed, based on sizes of its tables"""
+    if where.is_file():
+        with zipfile.ZipFile(where, mode="r") as archive:
+            size = sum(i.file_size for i in archive.infolist() if i.filename.endswith(".txt"))
+    else:
+        size = sum(i.stat().st_size for i in where.glob("*.txt"))
+    return size * MEMORY_FACTOR
+
+
+def find_feeds(where: Path) -> dict[str, FeedInfo]:
+    """Finds all feeds in a directory: .zip archives and directories with .txt files.
+    Feeds are named after their files, without the extension."""
+    feeds: dict[str, FeedInfo] = {}
+
+    for path in sorted(where.iterdir()):
+        if path.name.startswith("."):
+            continue
+        elif path.is_file() and path.suffix == ".zip":
+            name = path.stem
+        elif path.is_dir() and any(path.glob("*.txt")):
+            name = path.name
+        else:
+            continue
+
+        if name in feeds:
+            logger.warning(f"Skipping {path} - feed {name} already exists")
+            continue
+
+        feeds[name] = FeedInfo(name, path, estimate_size(path))
+
+    return feeds
+
+
+class FeedPool:
+    """FeedPool lazily creates Applications for feeds on first access, and keeps
+    them in an LRU cache. Least recently used feeds are evicted once the estimated
+    memory usage of all loaded feeds exceeds `memory_limit`.
+    The most recently used feed is never evicted.
+    """
+
+    def __init__(
+        self,
+        feeds: dict[str, FeedInfo],
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        snapshot_dir: Optional[Path] = None,
+    ) -> None:
+        self.feeds = feeds
+        self.memory_limit = memory_limit
+        self.snapshot_dir = snapshot_dir
+        self.size = 0
+        self._loaded: "OrderedDict[str, Application]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks = {name: threading.Lock() for name in feeds}
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._loaded
+
+    def get(self, name: str) -> Optional[Application]:
+        """Returns the Application of a particular feed, loading it if necessary.
+        Returns None if no such feed exists."""
+        info = self.feeds.get(name)
+        if info is None:
+            return None
+
+        with self._lock:
+            app = self._loaded.get(name)
+            if app is not None:
+                self._loaded.move_to_end(name)
+                return app
+
+        # Only one thread loads a particular feed, others wait for it
+        with self._loading_locks[name]:
+            with self._lock:
+                app = self._loaded.get(name)
+                if app is not None:
+                    self._loaded.move_to_end(name)
+                    return app
+
+            logger.info(f"Loading feed {name}")
+            app = Application(load_gtfs(info.path, self.snapshot_dir))
+
+            with self._lock:
+                self._loaded[name] = app
+                self.size += info.estimated_size
+                self._evict()
+
+        return app
+
+    def _evict(self) -> None:
+        while self.size > self.memory_limit and len(self._loaded) > 1:
+            name, _ = self._loaded.popitem(last=False)
+            self.size -= self.feeds[name].estimated_size
+            logger.info(f"Evicted feed {name}")
+
+
+class FeedServer:
+    """FeedServer is a WSGI application serving multiple feeds, each one
+    mounted under /feed/<name>/. The list of all feeds is shown at /."""
+
+    def __init__(self, pool: FeedPool) -> None:
+        self.pool = pool
+        self.index = Flask(__name__)
+        self.index.add_url_rule("/", view_func=self.route_feeds)
+        self.index.add_url_rule("/feed/<name>", view_func=self.route_feed)
+
+    def route_feeds(self) -> str:
+        return render_template(
+            "feeds.html.jinja",
+            base_href="/",
+            feeds=self.pool.feeds.values(),
+            is_loaded=self.pool.is_loaded,
+        )
+
+    def route_feed(self, name: str) -> Response:
+        if name not in self.pool.feeds:
+            abort(404)
+        return redirect(f"{FEED_PREFIX}{name}/")
+
+    def __call__(
+        self,
+        environ: dict[str, Any],
+        start_response: Callable[..., Any],
+    ) -> Any:
+        path: str = environ.get("PATH_INFO", "")
+        if path.startswith(FEED_PREFIX):
+            name, slash, rest = path[len(FEED_PREFIX) :].partition("/")
+            app = self.pool.get(name) if slash else None
+            if app is not None:
+                environ = dict(environ)
+                environ["SCRIPT_NAME"] = f"{environ.get('SCRIPT_NAME', '')}{FEED_PREFIX}{name}"
+                environ["PATH_INFO"] = f"/{rest}"
+                return app.flask.wsgi_app(environ, start_response)
+
+        return self.index.wsgi_app(environ, start_response)
+
+    def run(self, debug: bool = False) -> None:
+        run_simple(
+            "127.0.0.1",
+            5000,
+            self,
+            use_debugger=debug,
+            use_evalex=False,
+            threaded=True,
+        )
@@ -0,0 +1,234 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Iterable, Mapping, Optional
+
+from .util import parse_gtfs_date
+
+Row = Mapping[str, str]
+
+WEEKDAY_COLUMNS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+class BitCounter:
+    """BitCounter counts, for every bit position, how many of the added integers
+    have that bit set - processing all positions at once with a few big integer operations.
+
+    The counts are stored "vertically", in bit-planes: bit `i` of `planes[k]`
+    is the k-th bit of the count at position `i`. Adding a mask is a binary addition
+    (a ripple-carry of the mask through the planes), and adding a mask with a weight
+    is a sum of such additions for every set bit of the weight.
+    """
+
+    def __init__(self) -> None:
+        self.planes: list[int] = []
+
+    def add(self, mask: int, weight: int = 1) -> None:
+        plane = 0
+        while weight:
+            if weight & 1:
+                self._add_at(mask, plane)
+            weight >>= 1
+            plane += 1
+
+    def _add_at(self, carry: int, plane: int) -> None:
+        if plane > len(self.planes):
+            self.planes.extend([0] * (plane - len(self.planes)))
+
+        while carry:
+            if plane == len(self.planes):
+                self.planes.append(carry)
+                return
+            current = self.planes[plane]
+            self.planes[plane] = current ^ carry
+            carry &= current
+            plane += 1
+
+    def counts(self, length: int) -> list[int]:
+        """Returns the counts at bit positions from 0 to `length` (exclusive)"""
+        counts = [0] * length
+        for plane, bits in enumerate(self.planes):
+            value = 1 << plane
+            # NOTE: Bits are reversed, so that string indices are bit positions
+            digits = format(bits, f"0{length}b")[::-1]
+            position = digits.find("1")
+            while 0 <= position < length:
+                counts[position] += value
+                position = digits.find("1", position + 1)
+        return counts
+
+
+def _dates_of_services(
+    calendar: Mapping[str, Row],
+    calendar_dates: Mapping[str, list[Row]],
+) -> dict[str, tuple[Optional[tuple[date, date]], list[tuple[date, bool]]]]:
+    """Parses the calendar.txt range and calendar_dates.txt exceptions of every service.
+    Rows with invalid dates are skipped."""
+    services: dict[str, tuple[Optional[tuple[date, date]], list[tuple[date, bool]]]] = {}
+
+    for service_id, row in calendar.items():
+        try:
+            date_range = parse_gtfs_date(row["start_date"]), parse_gtfs_date(row["end_date"])
+        except (KeyError, ValueError):
+            date_range = None
+        services[service_id] = date_range, []
+
+    for service_id, rows in calendar_dates.items():
+        exceptions = services.setdefault(service_id, (None, []))[1]
+        for row in rows:
+            try:
+                day = parse_gtfs_date(row["date"])
+            except (KeyError, ValueError):
+                continue
+            if row.get("exception_type") in ("1", "2"):
+                exceptions.append((day, row["exception_type"] == "1"))
+
+    return services
+
+
+def service_masks(
+    calendar: Mapping[str, Row],
+    calendar_dates: Mapping[str, list[Row]],
+) -> tuple[date, int, dict[str, int]]:
+    """Computes the active days of all services as bitmasks - rows of a service × date matrix.
+
+    Returns the first date of the feed, the number of days between the first and last date
+    of the feed (inclusive), and the bitmasks, where bit `i` is set if the service is active
+    `i` days after the first date."""
+    services = _dates_of_services(calendar, calendar_dates)
+    all_dates = [
+        day
+        for date_range, exceptions in services.values()
+        for day in (*(date_range or ()), *(i[0] for i in exceptions))
+    ]
+    if not all_dates:
+        return date.min, 0, {service_id: 0 for service_id in services}
+
+    start = min(all_dates)
+    length = (max(all_dates) - start).days + 1
+
+    # Every weekday pattern of calendar.txt, repeated over the whole feed, is only computed once
+    day_masks = [0] * 7
+    for offset in range(length):
+        day_masks[(start.weekday() + offset) % 7] |= 1 << offset
+
+    pattern_masks: dict[tuple[bool, ...], int] = {}
+    masks: dict[str, int] = {}
+    for service_id, (date_range, exceptions) in services.items():
+        mask = 0
+
+        if date_range and date_range[0] <= date_range[1]:
+            row = calendar[service_id]
+            pattern = tuple(row.get(i) == "1" for i in WEEKDAY_COLUMNS)
+            pattern_mask = pattern_masks.get(pattern)
+            if pattern_mask is None:
+                pattern_mask = 0
+                for weekday, active in enumerate(pattern):
+                    if active:
+                        pattern_mask |= day_masks[weekday]
+                pattern_masks[pattern] = pattern_mask
+
+            first = (date_range[0] - start).days
+            last = (date_range[1] - start).days
+            mask = pattern_mask & (((1 << (last - first + 1)) - 1) << first)
+
+        for day, added in exceptions:
+            if added:
+                mask |= 1 << (day - start).days
+            else:
+                mask &= ~(1 << (day - start).days)
+
+        masks[service_id] = mask
+
+    return start, length, masks
+
+
+@dataclass
+class CalendarSummary:
+    """CalendarSummary holds the number of active services and trips on every date
+    between the first and the last date of a feed."""
+
+    start: date = date.min
+    services: list[int] = field(default_factory=list)
+    """Number of active services on every date, starting at `start`"""
+
+    trips: list[int] = field(default_factory=list)
+    """Number of active trips (trips.txt rows) on every date, starting at `start`"""
+
+    @property
+    def dates(self) -> list[date]:
+        return [self.start + timedelta(days=offset) for offset in range(len(self.services))]
+
+    @property
+    def empty_dates(self) -> list[date]:
+        """Dates without any active trips"""
+        return [day for day, trips in zip(self.dates, self.trips) if not trips]
+
+    @property
+    def max_trips(self) -> int:
+        return max(self.trips, default=0)
+
+    def weeks(self) -> list[list[Optional[int]]]:
+        """Splits the days into weeks (starting on Monday); returning their offsets
+        from `start`, or None for days outside of the feed."""
+        if not self.services:
+            return []
+
+        padding = self.start.weekday()
+        offsets: list[Optional[int]] = [None] * padding
+        offsets.extend(range(len(self.services)))
+        offsets.extend([None] * (-len(offsets) % 7))
+        return [offsets[i : i + 7] for i in range(0, len(offsets), 7)]
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "days": [
+                {"date": day.isoformat(), "services": services, "trips": trips}
+                for day, services, trips in zip(self.dates, self.services, self.trips)
+            ],
+            "empty_dates": [day.isoformat() for day in self.empty_dates],
+        }
+
+
+def summarize_calendars(
+    calendar: Mapping[str, Row],
+    calendar_dates: Mapping[str, list[Row]],
+    trips: Iterable[Row],
+) -> CalendarSummary:
+    """Counts active services and trips on every date of a feed.
+
+    Services with the same active days are counted together, and the counts of all
+    distinct bitmasks (see service_masks) are summed for all dates at once with a BitCounter.
+    """
+    start, length, masks = service_masks(calendar, calendar_dates)
+    trips_of_service = Counter(trip.get("service_id", "") for trip in trips)
+
+    services_of_mask: Counter[int] = Counter()
+    trips_of_mask: Counter[int] = Counter()
+    for service_id, mask in masks.items():
+        services_of_mask[mask] += 1
+        trips_of_mask[mask] += trips_of_service[service_id]
+
+    service_counter = BitCounter()
+    trip_counter = BitCounter()
+    for mask, services in services_of_mask.items():
+        service_counter.add(mask, services)
+        trip_counter.add(mask, trips_of_mask[mask])
+
+    return CalendarSummary(start, service_counter.counts(length), trip_counter.counts(length))
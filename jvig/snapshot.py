@@ -0,0 +1,111 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import os
+import pickle
+from dataclasses import fields
+from pathlib import Path
+from typing import Optional
+
+from .__version__ import __version__
+from .gtfs import Gtfs, gc_paused
+from .util import user_cache_dir
+
+logger = logging.getLogger("jvig.snapshot")
+
+
+def default_snapshot_dir() -> Path:
+    """Returns the default directory for snapshots, inside the user's cache directory"""
+    return user_cache_dir() / "snapshots"
+
+
+def _feed_files(where: Path) -> list[Path]:
+    return [where] if where.is_file() else sorted(where.glob("*.txt"))
+
+
+def snapshot_path(where: Path, snapshot_dir: Path) -> Path:
+    """Returns the path to the snapshot of a feed. The name depends on the path to the feed,
+    on sizes and modification times of its files, and on the version of jvig and fields
+    of the Gtfs class - so that snapshots are never used for a feed which has changed since,
+    nor loaded into a different structure."""
+    where = where.resolve()
+    path_digest = hashlib.sha256(str(where).encode("utf-8")).hexdigest()[:8]
+
+    content = hashlib.sha256(__version__.encode("utf-8"))
+    content.update(",".join(i.name for i in fields(Gtfs)).encode("utf-8"))
+    for f in _feed_files(where):
+        stat = f.stat()
+        content.update(f"\0{f.name}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8"))
+
+    return snapshot_dir / f"{where.stem}-{path_digest}-{content.hexdigest()[:16]}.pickle"
+
+
+def load_snapshot(path: Path) -> Optional[Gtfs]:
+    """Loads a snapshot of a feed, or returns None if it doesn't exist or can't be read.
+
+    Snapshots are pickles - never load them from untrusted locations."""
+    try:
+        with path.open(mode="rb") as f, gc_paused():
+            gtfs = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring broken snapshot {path}: {e}")
+        return None
+
+    return gtfs if isinstance(gtfs, Gtfs) else None
+
+
+def save_snapshot(gtfs: Gtfs, path: Path) -> None:
+    """Atomically saves a snapshot of a feed, removing older snapshots of the same feed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    try:
+        with temp.open(mode="wb") as f:
+            pickle.dump(gtfs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+    # Snapshots of the same feed share the name up to the last dash
+    prefix = path.name.rpartition("-")[0]
+    for old in path.parent.glob(f"{prefix}-*.pickle"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def load_gtfs(where: Path, snapshot_dir: Optional[Path] = None) -> Gtfs:
+    """Loads a feed from its snapshot, if available. Otherwise, the feed is loaded normally
+    and a snapshot is saved for later. Pass `snapshot_dir=None` to skip snapshots altogether."""
+    if snapshot_dir is None:
+        return Gtfs.from_user_input(where)
+
+    path = snapshot_path(where, snapshot_dir)
+    gtfs = load_snapshot(path)
+    if gtfs is not None:
+        logger.info(f"Loaded {where} from snapshot {path}")
+        return gtfs
+
+    gtfs = Gtfs.from_user_input(where)
+    try:
+        save_snapshot(gtfs, path)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+        # NOTE: Feeds with stop_times kept on disk (an ExternalTable) can't be pickled
+        logger.warning(f"Can't save snapshot of {where}: {e}")
+    return gtfs
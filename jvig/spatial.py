@@ -0,0 +1,226 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+from math import asin, ceil, cos, floor, pi, radians, sin, sqrt
+from typing import Iterable, Iterator, Mapping
+
+from .util import EARTH_RADIUS
+
+CELL_SIZE = 250.0
+"""Default size (in meters) of the cells of a StopGrid"""
+
+METERS_PER_DEGREE = EARTH_RADIUS * pi / 180
+
+NEARBY_RADIUS = 300.0
+"""Default distance (in meters) within which stops are considered to be nearby"""
+
+
+class StopGrid:
+    """StopGrid is a spatial index of stops, grouping them into square cells
+    of an equirectangular projection.
+
+    The projection is scaled for the highest latitude of all stops - cells are never
+    narrower than `cell_size`, so looking at all cells within a radius is guaranteed to find
+    every stop within that radius. Exact distances are always computed with the haversine
+    formula, over arrays of precomputed trigonometric values.
+    """
+
+    def __init__(
+        self,
+        stops: Iterable[tuple[str, float, float]] = (),
+        cell_size: float = CELL_SIZE,
+    ) -> None:
+        self.cell_size = cell_size
+        self.stop_ids: list[str] = []
+        self.lats = array("d")
+        self.lons = array("d")
+        self._cos_lats = array("d")
+        self._lat_rads = array("d")
+        self._lon_rads = array("d")
+        self._cells: dict[tuple[int, int], list[int]] = {}
+
+        for stop_id, lat, lon in stops:
+            self.stop_ids.append(stop_id)
+            self.lats.append(lat)
+            self.lons.append(lon)
+
+        max_lat = max((abs(i) for i in self.lats), default=0.0)
+        self._x_scale = METERS_PER_DEGREE * max(cos(radians(max_lat)), 0.01)
+
+        for idx, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            self._lat_rads.append(radians(lat))
+            self._lon_rads.append(radians(lon))
+            self._cos_lats.append(cos(radians(lat)))
+            self._cells.setdefault(self._cell_of(lat, lon), []).append(idx)
+
+    @classmethod
+    def from_stops(
+        cls,
+        stops: Iterable[Mapping[str, str]],
+        cell_size: float = CELL_SIZE,
+    ) -> "StopGrid":
+        """Creates a StopGrid from stops.txt rows, skipping stops without valid positions"""
+
+        def positions() -> Iterator[tuple[str, float, float]]:
+            for stop in stops:
+                try:
+                    lat = float(stop["stop_lat"])
+                    lon = float(stop["stop_lon"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+                    yield stop["stop_id"], lat, lon
+
+        return cls(positions(), cell_size)
+
+    def __len__(self) -> int:
+        return len(self.stop_ids)
+
+    def _cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+        return (
+            floor(lon * self._x_scale / self.cell_size),
+            floor(lat * METERS_PER_DEGREE / self.cell_size),
+        )
+
+    def _cells_around(self, cell: tuple[int, int], ring: int) -> Iterator[list[int]]:
+        """Yields stops from all cells at exactly `ring` cells away from `cell`"""
+        x, y = cell
+        if ring == 0:
+            coordinates: Iterable[tuple[int, int]] = [cell]
+        else:
+            coordinates = [
+                *((x + dx, y - ring) for dx in range(-ring, ring + 1)),
+                *((x + dx, y + ring) for dx in range(-ring, ring + 1)),
+                *((x - ring, y + dy) for dy in range(-ring + 1, ring)),
+                *((x + ring, y + dy) for dy in range(-ring + 1, ring)),
+            ]
+
+        for coordinate in coordinates:
+            stops = self._cells.get(coordinate)
+            if stops:
+                yield stops
+
+    def _distances(self, lat: float, lon: float, indices: Iterable[int]) -> list[float]:
+        """Computes haversine distances (in meters) from a point to multiple stops"""
+        lat_rad = radians(lat)
+        lon_rad = radians(lon)
+        cos_lat = cos(lat_rad)
+        lat_rads = self._lat_rads
+        lon_rads = self._lon_rads
+        cos_lats = self._cos_lats
+        return [
+            2
+            * EARTH_RADIUS
+            * asin(
+                min(
+                    1.0,
+                    sqrt(
+                        sin((lat_rads[i] - lat_rad) * 0.5) ** 2
+                        + cos_lat * cos_lats[i] * sin((lon_rads[i] - lon_rad) * 0.5) ** 2
+                    ),
+                )
+            )
+            for i in indices
+        ]
+
+    def within(self, lat: float, lon: float, radius: float) -> list[tuple[float, str]]:
+        """Returns (distance, stop_id) pairs of all stops within `radius` meters
+        from a point, ordered by the distance."""
+        center = self._cell_of(lat, lon)
+        candidates: list[int] = []
+        for ring in range(ceil(radius / self.cell_size) + 1):
+            for stops in self._cells_around(center, ring):
+                candidates.extend(stops)
+
+        return sorted(
+            (distance, self.stop_ids[idx])
+            for distance, idx in zip(self._distances(lat, lon, candidates), candidates)
+            if distance <= radius
+        )
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        max_distance: float = float("inf"),
+    ) -> list[tuple[float, str]]:
+        """Returns (distance, stop_id) pairs of `k` stops closest to a point,
+        ordered by the distance. Only stops within `max_distance` meters are returned."""
+        if k <= 0 or not self.stop_ids:
+            return []
+
+        center = self._cell_of(lat, lon)
+        found: list[tuple[float, str]] = []
+        ring = 0
+        remaining = len(self.stop_ids)
+
+        while remaining > 0:
+            # Scanning rings around sparse, distant stops would take forever -
+            # at some point it's quicker to look at all stops
+            if (2 * ring + 1) ** 2 > 4 * len(self._cells):
+                everything = range(len(self.stop_ids))
+                found = sorted(
+                    (distance, self.stop_ids[idx])
+                    for distance, idx in zip(self._distances(lat, lon, everything), everything)
+                    if distance <= max_distance
+                )
+                break
+
+            candidates = [i for stops in self._cells_around(center, ring) for i in stops]
+            remaining -= len(candidates)
+            found.extend(
+                (distance, self.stop_ids[idx])
+                for distance, idx in zip(self._distances(lat, lon, candidates), candidates)
+                if distance <= max_distance
+            )
+
+            # Every stop outside of the scanned rings is at least `ring * cell_size` away
+            found.sort()
+            reach = ring * self.cell_size
+            if (len(found) >= k and found[k - 1][0] <= reach) or reach > max_distance:
+                break
+            ring += 1
+
+        return found[:k]
+
+    def pairs_within(self, radius: float) -> Iterator[tuple[str, str, float]]:
+        """Yields (stop_id, other_stop_id, distance) triples of all pairs of different stops
+        at most `radius` meters apart. Every pair is only yielded once."""
+        rings = ceil(radius / self.cell_size)
+        cells = self._cells
+
+        # Only look at "later" neighboring cells, so that every pair of cells
+        # (and stops) is only considered once
+        offsets = [
+            (dx, dy)
+            for dx in range(-rings, rings + 1)
+            for dy in range(-rings, rings + 1)
+            if (dx, dy) > (0, 0)
+        ]
+
+        for (x, y), stops in cells.items():
+            neighbors = [other for dx, dy in offsets for other in cells.get((x + dx, y + dy), ())]
+
+            for i, a in enumerate(stops):
+                candidates = stops[i + 1 :] + neighbors
+                if not candidates:
+                    continue
+                distances = self._distances(self.lats[a], self.lons[a], candidates)
+                for b, distance in zip(candidates, distances):
+                    if distance <= radius:
+                        yield self.stop_ids[a], self.stop_ids[b], distance
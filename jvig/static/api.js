@@ -0,0 +1,40 @@
+/*
+jvig - GTFS Viewer, created using Flask.
+Copyright © 2024 Mikołaj Kuranowski
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*/
+"use strict";
+
+/**
+ * Fetches JSON data from the jvig API. Requests rejected by a busy server
+ * (503 Service Unavailable) are retried after the time requested by the server.
+ * The returned promise is rejected if the final response is not successful.
+ * @param {string} url
+ * @param {number} attempts
+ * @returns {Promise<any>}
+ */
+function fetchJSON(url, attempts = 5) {
+    return fetch(url).then(r => {
+        if (r.status === 503 && attempts > 1) {
+            const delay = (parseFloat(r.headers.get("Retry-After")) || 1) * 1000;
+            return new Promise(resolve => setTimeout(resolve, delay))
+                .then(() => fetchJSON(url, attempts - 1));
+        }
+        if (!r.ok) {
+            throw new Error(`${url}: ${r.status} ${r.statusText}`);
+        }
+        return r.json();
+    });
+}
@@ -712,8 +712,7 @@ class TripleCalendar extends Calendar {
  * @param {string} serviceId
  */
 function showServiceActiveDates(divId, serviceId) {
-    fetch(`/api/calendar/days/${encodeURIComponent(serviceId)}`)
-    .then(r => r.json())
+    fetchJSON(`api/calendar/days/${encodeURIComponent(serviceId)}`)
     .then(datesList => {
         const dates = new Set(datesList);
 
@@ -0,0 +1,158 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from heapq import heappop, heappush
+from typing import Any, Callable, Iterable, Mapping, NamedTuple, Optional
+
+WALK_SPEED = 1.0
+"""Walking speed (in m/s) inside stations, used for pathways without a traversal_time"""
+
+DEFAULT_PATHWAY_TIME = 30.0
+"""Time (in seconds) of traversing a pathway with neither a traversal_time nor a length"""
+
+Row = Mapping[str, str]
+
+
+def pathway_time(pathway: Row) -> float:
+    """Estimates the time (in seconds) it takes to traverse a pathway"""
+    try:
+        return max(float(pathway.get("traversal_time", "")), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(float(pathway.get("length", "")), 0.0) / WALK_SPEED
+    except ValueError:
+        return DEFAULT_PATHWAY_TIME
+
+
+class PathwayEdge(NamedTuple):
+    """PathwayEdge is a traversal of a pathway, in one of its directions."""
+
+    from_stop_id: str
+    to_stop_id: str
+    time: float
+    pathway: Row
+
+    @property
+    def reversed(self) -> bool:
+        """Is the pathway traversed from its to_stop_id to its from_stop_id?"""
+        return self.from_stop_id != self.pathway.get("from_stop_id")
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "pathway_id": self.pathway.get("pathway_id", ""),
+            "from_stop_id": self.from_stop_id,
+            "to_stop_id": self.to_stop_id,
+            "time": self.time,
+            "reversed": self.reversed,
+            "signposted_as": self.pathway.get(
+                "reversed_signposted_as" if self.reversed else "signposted_as",
+                "",
+            ),
+        }
+
+
+class StationPath(NamedTuple):
+    time: float
+    edges: list[PathwayEdge]
+
+    def as_json(self) -> dict[str, Any]:
+        return {"time": self.time, "edges": [i.as_json() for i in self.edges]}
+
+
+class StationGraph:
+    """StationGraph holds pathways between nodes (platforms, entrances, generic nodes
+    and boarding areas) of a single station, as an adjacency list of PathwayEdges.
+    Bidirectional pathways are traversable both ways."""
+
+    def __init__(self, station_id: str, pathways: Iterable[Row] = ()) -> None:
+        self.station_id = station_id
+        self.pathways: list[Row] = []
+        self.edges: dict[str, list[PathwayEdge]] = {}
+        for pathway in pathways:
+            self.add(pathway)
+
+    def add(self, pathway: Row) -> None:
+        self.pathways.append(pathway)
+        a = pathway.get("from_stop_id", "")
+        b = pathway.get("to_stop_id", "")
+        time = pathway_time(pathway)
+        self.edges.setdefault(a, []).append(PathwayEdge(a, b, time, pathway))
+        self.edges.setdefault(b, [])
+        if pathway.get("is_bidirectional") == "1":
+            self.edges[b].append(PathwayEdge(b, a, time, pathway))
+
+    @property
+    def nodes(self) -> list[str]:
+        return sorted(self.edges)
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self.edges.values())
+
+    def shortest_path(self, from_stop_id: str, to_stop_id: str) -> Optional[StationPath]:
+        """Finds the quickest way between two nodes of the station (with Dijkstra's algorithm).
+        Returns None if there's no such way."""
+        if from_stop_id not in self.edges or to_stop_id not in self.edges:
+            return None
+
+        times: dict[str, float] = {from_stop_id: 0.0}
+        via: dict[str, PathwayEdge] = {}
+        queue: list[tuple[float, str]] = [(0.0, from_stop_id)]
+
+        while queue:
+            time, node = heappop(queue)
+            if node == to_stop_id:
+                break
+            if time > times[node]:
+                continue  # Stale entry
+
+            for edge in self.edges[node]:
+                arrival = time + edge.time
+                if arrival < times.get(edge.to_stop_id, float("inf")):
+                    times[edge.to_stop_id] = arrival
+                    via[edge.to_stop_id] = edge
+                    heappush(queue, (arrival, edge.to_stop_id))
+        else:
+            if to_stop_id != from_stop_id:
+                return None
+
+        # Reconstruct the path
+        edges: list[PathwayEdge] = []
+        node = to_stop_id
+        while node != from_stop_id:
+            edge = via[node]
+            edges.append(edge)
+            node = edge.from_stop_id
+        edges.reverse()
+        return StationPath(times[to_stop_id], edges)
+
+
+def build_station_graphs(
+    pathways: Iterable[Row],
+    station_of: Callable[[str], str],
+) -> dict[str, StationGraph]:
+    """Groups pathways into StationGraphs, keyed by the station (as returned by
+    `station_of`) of their from_stop_id."""
+    graphs: dict[str, StationGraph] = {}
+    for pathway in pathways:
+        station_id = station_of(pathway.get("from_stop_id", ""))
+        graph = graphs.get(station_id)
+        if graph is None:
+            graph = StationGraph(station_id)
+            graphs[station_id] = graph
+        graph.add(pathway)
+    return graphs
@@ -0,0 +1,234 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Iterable, Optional
+
+from .gtfs import Gtfs
+from .headways import HeadwayExpander
+from .util import int_to_time
+
+
+@dataclass
+class ServiceStats:
+    """ServiceStats holds numbers describing a group of trips (of a route or an agency)."""
+
+    trips: int = 0
+    """Number of trips.txt rows"""
+
+    trip_days: int = 0
+    """Number of (trip, date) pairs - departures of frequency-based trips are counted separately"""
+
+    vehicle_seconds: int = 0
+    """Sum of durations of all trips on all of their days"""
+
+    first_departure: int = -1
+    last_departure: int = -1
+    stops: set[str] = field(default_factory=set)
+    dates: Counter[date] = field(default_factory=Counter)
+    """Number of trips on every date"""
+
+    @property
+    def days(self) -> int:
+        return len(self.dates)
+
+    @property
+    def trips_per_day(self) -> float:
+        return self.trip_days / len(self.dates) if self.dates else 0.0
+
+    @property
+    def vehicle_hours_per_day(self) -> float:
+        return self.vehicle_seconds / 3600 / len(self.dates) if self.dates else 0.0
+
+    def add_departures(self, departures: list[int]) -> None:
+        if departures:
+            if self.first_departure < 0 or departures[0] < self.first_departure:
+                self.first_departure = departures[0]
+            if departures[-1] > self.last_departure:
+                self.last_departure = departures[-1]
+
+    def merge(self, other: "ServiceStats") -> None:
+        self.trips += other.trips
+        self.trip_days += other.trip_days
+        self.vehicle_seconds += other.vehicle_seconds
+        if other.first_departure >= 0:
+            self.add_departures([other.first_departure, other.last_departure])
+        self.stops.update(other.stops)
+        self.dates.update(other.dates)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "trips": self.trips,
+            "days": self.days,
+            "trips_per_day": round(self.trips_per_day, 2),
+            "vehicle_hours_per_day": round(self.vehicle_hours_per_day, 2),
+            "first_departure": int_to_time(self.first_departure),
+            "last_departure": int_to_time(self.last_departure),
+            "stops": len(self.stops),
+        }
+
+
+@dataclass
+class RouteStats(ServiceStats):
+    route_id: str = ""
+    agency_id: str = ""
+
+    busiest_date: Optional[date] = None
+    """Date with the most trips of the route, on which headways are computed"""
+
+    headways: dict[int, float] = field(default_factory=dict)
+    """Average time (in minutes) between consecutive departures in the same direction
+    on the busiest date, by the hour of the earlier departure"""
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "route_id": self.route_id,
+            "agency_id": self.agency_id,
+            **super().as_json(),
+            "busiest_date": self.busiest_date.isoformat() if self.busiest_date else None,
+            "headways": {str(hour): round(i, 1) for hour, i in self.headways.items()},
+        }
+
+
+@dataclass
+class AgencyStats(ServiceStats):
+    agency_id: str = ""
+    routes: int = 0
+
+    def as_json(self) -> dict[str, Any]:
+        return {"agency_id": self.agency_id, "routes": self.routes, **super().as_json()}
+
+
+@dataclass
+class FeedStats:
+    """FeedStats holds statistics of a whole feed, its agencies and routes."""
+
+    agencies: list[AgencyStats] = field(default_factory=list)
+    routes: list[RouteStats] = field(default_factory=list)
+    trips_per_date: list[tuple[date, int]] = field(default_factory=list)
+    """Number of trips on every date of the feed's validity range (including days without any)"""
+
+    @property
+    def headway_hours(self) -> list[int]:
+        """All hours for which any route has a headway"""
+        return sorted({hour for route in self.routes for hour in route.headways})
+
+    @property
+    def max_trips_per_date(self) -> int:
+        return max((i[1] for i in self.trips_per_date), default=0)
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "agencies": [i.as_json() for i in self.agencies],
+            "routes": [i.as_json() for i in self.routes],
+            "trips_per_date": {day.isoformat(): count for day, count in self.trips_per_date},
+        }
+
+
+def _average_headways(departures_by_direction: Iterable[list[int]]) -> dict[int, float]:
+    sums: Counter[int] = Counter()
+    counts: Counter[int] = Counter()
+    for departures in departures_by_direction:
+        departures.sort()
+        for a, b in zip(departures, departures[1:]):
+            sums[a // 3600] += b - a
+            counts[a // 3600] += 1
+    return {hour: sums[hour] / counts[hour] / 60 for hour in sorted(counts)}
+
+
+def compute_stats(gtfs: Gtfs, headways: HeadwayExpander) -> FeedStats:
+    """Computes statistics of a feed. This requires a pass over all stop_times and
+    expanding all calendars - it's better to do so in the background."""
+    routes: dict[str, RouteStats] = {}
+    departures_of: dict[str, list[int]] = {}
+
+    for trip_id, trip in gtfs.trips.items():
+        route_id = trip.get("route_id", "")
+        route = routes.get(route_id)
+        if route is None:
+            route = RouteStats(
+                route_id=route_id,
+                agency_id=gtfs.routes.get(route_id, {}).get("agency_id", ""),
+            )
+            routes[route_id] = route
+
+        # Departures of the trip - multiple ones for frequency-based trips
+        summary = gtfs.trip_summary(trip_id)
+        if trip_id in gtfs.frequencies:
+            departures = [start for start, _ in headways.trip_starts(trip_id)]
+        elif summary.first_departure >= 0:
+            departures = [summary.first_departure]
+        else:
+            departures = []
+        departures_of[trip_id] = departures
+
+        dates = gtfs.service_dates(trip.get("service_id", ""))
+        route.trips += 1
+        route.trip_days += len(departures) * len(dates)
+        route.vehicle_seconds += max(summary.duration, 0) * len(departures) * len(dates)
+        route.add_departures(departures)
+        route.stops.update(i["stop_id"] for i in gtfs.stop_times.get(trip_id, []))
+        if departures:
+            for day in dates:
+                route.dates[day] += len(departures)
+
+    # Headways on the busiest day of every route
+    for route in routes.values():
+        if not route.dates:
+            continue
+
+        busiest: date = max(route.dates, key=lambda day: (route.dates[day], -day.toordinal()))
+        route.busiest_date = busiest
+
+        by_direction: dict[str, list[int]] = {}
+        for trip_id in gtfs.route_trips[route.route_id]:
+            trip = gtfs.trips[trip_id]
+            if busiest in gtfs.service_dates(trip.get("service_id", "")):
+                by_direction.setdefault(trip.get("direction_id", ""), []).extend(
+                    departures_of[trip_id]
+                )
+        route.headways = _average_headways(by_direction.values())
+
+    # Aggregate routes by agencies
+    agencies: dict[str, AgencyStats] = {}
+    for route in routes.values():
+        agency = agencies.get(route.agency_id)
+        if agency is None:
+            agency = AgencyStats(agency_id=route.agency_id)
+            agencies[route.agency_id] = agency
+        agency.routes += 1
+        agency.merge(route)
+
+    # Trips on every date, including dates without any service
+    trips_per_date: Counter[date] = Counter()
+    for agency in agencies.values():
+        trips_per_date.update(agency.dates)
+
+    all_dates: list[tuple[date, int]] = []
+    if trips_per_date:
+        day = min(trips_per_date)
+        end = max(trips_per_date)
+        while day <= end:
+            all_dates.append((day, trips_per_date[day]))
+            day += timedelta(days=1)
+
+    return FeedStats(
+        agencies=sorted(agencies.values(), key=lambda i: i.agency_id),
+        routes=sorted(routes.values(), key=lambda i: i.route_id),
+        trips_per_date=all_dates,
+    )
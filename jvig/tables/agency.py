@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,6 +14,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from typing import Callable
+
 VALID_FIELDS: set[str] = {
     "agency_id",
     "agency_name",
@@ -25,6 +27,8 @@ VALID_FIELDS: set[str] = {
     "agency_email",
 }
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {}
+
 
 def header_class(field: str) -> str:
     return "" if field in VALID_FIELDS else "value-unrecognized"
@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,33 +14,40 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from markupsafe import escape
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
 
 from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, plain
 
 VALID_FIELDS: set[str] = {"service_id", "date", "exception_type"}
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "date": valid.date,
+    "exception_type": {"1", "2"}.__contains__,
+}
+
 
 def header_class(field: str) -> str:
     return "" if field in VALID_FIELDS else "value-unrecognized"
 
 
-def format_cell(row: dict[str, str], field: str) -> str:
-    value = row[field]
-
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
     if field == "date":
-        if valid.date(value):
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return checked(field, valid.date)
 
     elif field == "exception_type":
-        if value == "1":
-            return "<td>1 (+)</td>"
-        elif value == "2":
-            return "<td>2 (-)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(field, {"1": "<td>1 (+)</td>", "2": "<td>2 (-)</td>"})
 
     else:
-        return f"<td>{escape(value)}</td>"
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
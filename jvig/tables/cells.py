@@ -0,0 +1,97 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Callable, Iterable, Mapping
+from urllib.parse import quote_plus
+
+CellFormatter = Callable[[Mapping[str, str]], str]
+"""Function rendering a single column of a row as a `<td>` element"""
+
+RowFormatter = Callable[[Mapping[str, str]], str]
+"""Function rendering all columns of a row as consecutive `<td>` elements"""
+
+# NOTE: Rows shorter than the header have None in the missing fields (see gtfs._odd_row) -
+#       formatters show those as empty values.
+
+
+def escape(value: str) -> str:
+    """Escapes a value just like markupsafe.escape, but returns a plain str -
+    formatting a Markup object into an f-string is several times slower."""
+    return (
+        value.replace("&", "&amp;")
+        .replace(">", "&gt;")
+        .replace("<", "&lt;")
+        .replace("'", "&#39;")
+        .replace('"', "&#34;")
+    )
+
+
+def plain(field: str) -> CellFormatter:
+    def format(row: Mapping[str, str]) -> str:
+        return f"<td>{escape(row[field] or '')}</td>"
+
+    return format
+
+
+def checked(field: str, check: Callable[[str], bool]) -> CellFormatter:
+    """Returns a formatter, which marks values not passing `check` as invalid"""
+
+    def format(row: Mapping[str, str]) -> str:
+        value = row[field] or ""
+        if check(value):
+            return f"<td>{escape(value)}</td>"
+        else:
+            return f'<td class="value-invalid">{escape(value)}</td>'
+
+    return format
+
+
+def link(field: str, prefix: str) -> CellFormatter:
+    """Returns a formatter, which links to `prefix` followed by the value"""
+
+    def format(row: Mapping[str, str]) -> str:
+        value = row[field] or ""
+        return f'<td><a href="{prefix}{quote_plus(value)}">{escape(value)}</a></td>'
+
+    return format
+
+
+def enumerated(field: str, cells: dict[str, str]) -> CellFormatter:
+    """Returns a formatter of an enumerated column, which maps every valid value
+    to a constant, pre-rendered cell. Other values are marked as invalid."""
+    get_cell = cells.get
+
+    def format(row: Mapping[str, str]) -> str:
+        value = row[field] or ""
+        cell = get_cell(value)
+        if cell is None:
+            return f'<td class="value-invalid">{escape(value)}</td>'
+        return cell
+
+    return format
+
+
+def compile_row(
+    header: Iterable[str], cell_formatter: Callable[[str], CellFormatter]
+) -> RowFormatter:
+    """Builds a function rendering whole rows of a table with the provided header.
+    The formatter of every column is only looked up once, instead of once for every cell."""
+    formatters = tuple(cell_formatter(field) for field in header)
+
+    def format_row(row: Mapping[str, str]) -> str:
+        return "".join([format(row) for format in formatters])
+
+    return format_row
@@ -0,0 +1,88 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
+
+from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, link, plain
+
+VALID_FIELDS: set[str] = {
+    "pathway_id",
+    "from_stop_id",
+    "to_stop_id",
+    "pathway_mode",
+    "is_bidirectional",
+    "length",
+    "traversal_time",
+    "stair_count",
+    "max_slope",
+    "min_width",
+    "signposted_as",
+    "reversed_signposted_as",
+}
+
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "pathway_mode": {"1", "2", "3", "4", "5", "6", "7"}.__contains__,
+    "is_bidirectional": {"0", "1"}.__contains__,
+    "length": valid.non_negative_float,
+    "traversal_time": lambda value: not value or (valid.uint(value) and int(value) > 0),
+    "stair_count": lambda value: not value or valid.integer(value),
+    "max_slope": lambda value: not value or valid.decimal(value),
+    "min_width": lambda value: not value or (valid.non_negative_float(value) and float(value) > 0),
+}
+
+
+def header_class(field: str) -> str:
+    return "" if field in VALID_FIELDS else "value-unrecognized"
+
+
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
+    if field in {"from_stop_id", "to_stop_id"}:
+        return link(field, "stop/")
+
+    elif field == "pathway_mode":
+        return enumerated(
+            field,
+            {
+                "1": "<td>1 (🚶)</td>",
+                "2": "<td>2 (🪜)</td>",
+                "3": "<td>3 (🛤️)</td>",
+                "4": "<td>4 (↗️)</td>",
+                "5": "<td>5 (🛗)</td>",
+                "6": "<td>6 (🎫)</td>",
+                "7": "<td>7 (🚪)</td>",
+            },
+        )
+
+    elif field == "is_bidirectional":
+        return enumerated(field, {"0": "<td>0 (➡️)</td>", "1": "<td>1 (↔️)</td>"})
+
+    elif field in FIELD_CHECKS:
+        return checked(field, FIELD_CHECKS[field])
+
+    else:
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,9 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from markupsafe import escape
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
 
 from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, escape, plain
 
 VALID_FIELDS: set[str] = {
     "route_id",
@@ -75,50 +78,67 @@ ROUTE_TYPE_DATA: dict[str, tuple[str, bool]] = {
     "1700": ("❓", True),
 }
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "route_color": valid.color,
+    "route_text_color": valid.color,
+    "route_type": ROUTE_TYPE_DATA.__contains__,
+}
+
 
 def header_class(field: str) -> str:
     return "" if field in VALID_FIELDS else "value-unrecognized"
 
 
-def format_cell(row: dict[str, str], field: str) -> str:
-    value = row[field]
+def _short_name(row: Mapping[str, str]) -> str:
+    value = row["route_short_name"] or ""
+    color = row.get("route_color")
+    text_color = row.get("route_text_color")
+
+    # To create a nice color blob we need valid colors
+    if not color or not text_color or not valid.color(color) or not valid.color(text_color):
+        return f"<td>{escape(value)}</td>"
+
+    style = (
+        f"background-color: #{color}; color: #{text_color}; "
+        "border-radius: 4px; padding: 2px; margin: 2px;"
+    )
+
+    if value == "":
+        style += " display: block; width: 14px; height: 14px;"
+
+    return (
+        f'<td class="short-name-with-blob"><span style="{style}">' f"{escape(value)}</style></td>"
+    )
+
 
+ROUTE_TYPE_CELLS: dict[str, str] = {
+    value: (
+        f'<td class="value-extended">{value} ({icon})</td>'
+        if is_extended
+        else f"<td>{value} ({icon})</td>"
+    )
+    for value, (icon, is_extended) in ROUTE_TYPE_DATA.items()
+}
+
+
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
     if field in {"route_color", "route_text_color"}:
-        if valid.color(value):
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return checked(field, valid.color)
 
     elif field == "route_type":
-        if value not in ROUTE_TYPE_DATA:
-            return f'<td class="value-invalid">{escape(value)}</td>'
-
-        icon, is_extended = ROUTE_TYPE_DATA[value]
-        if is_extended:
-            return f'<td class="value-extended">{escape(value)} ({icon})</td>'
-        else:
-            return f"<td>{escape(value)} ({icon})</td>"
+        return enumerated(field, ROUTE_TYPE_CELLS)
 
     elif field == "route_short_name":
-        color = row.get("route_color")
-        text_color = row.get("route_text_color")
+        return _short_name
 
-        # To create a nice color blob we need valid colors
-        if not color or not text_color or not valid.color(color) or not valid.color(text_color):
-            return f"<td>{escape(value)}</td>"
+    else:
+        return plain(field)
 
-        style = (
-            f"background-color: #{color}; color: #{text_color}; "
-            "border-radius: 4px; padding: 2px; margin: 2px;"
-        )
 
-        if value == "":
-            style += " display: block; width: 14px; height: 14px;"
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
 
-        return (
-            f'<td class="short-name-with-blob"><span style="{style}">'
-            f"{escape(value)}</style></td>"
-        )
 
-    else:
-        return f"<td>{escape(value)}</td>"
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
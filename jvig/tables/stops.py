@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,9 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from markupsafe import escape
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
 
 from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, plain
 
 VALID_FIELDS: set[str] = {
     "stop_id",
@@ -34,49 +37,52 @@ VALID_FIELDS: set[str] = {
     "platform_code",
 }
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "stop_lat": lambda value: valid.latitude(value) is not None,
+    "stop_lon": lambda value: valid.longitude(value) is not None,
+    "location_type": {"", "0", "1", "2"}.__contains__,
+    "wheelchair_boarding": {"", "0", "1", "2"}.__contains__,
+}
+
 
 def header_class(field: str) -> str:
     return "" if field in VALID_FIELDS else "value-unrecognized"
 
 
-def format_cell(row: dict[str, str], field: str) -> str:
-    value = row[field]
-
-    if field == "stop_lat":
-        if valid.latitude(value) is not None:
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
-
-    elif field == "stop_lon":
-        if valid.longitude(value) is not None:
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
+    if field in {"stop_lat", "stop_lon"}:
+        return checked(field, FIELD_CHECKS[field])
 
     elif field == "location_type":
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (🚏)</td>"
-        elif value == "1":
-            return "<td>1 (🏢)</td>"
-        elif value == "2":
-            return "<td>2 (➡️🚪)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (🚏)</td>",
+                "1": "<td>1 (🏢)</td>",
+                "2": "<td>2 (➡️🚪)</td>",
+            },
+        )
 
     elif field == "wheelchair_boarding":
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (♿❓)</td>"
-        elif value == "1":
-            return "<td>1 (♿✔️)</td>"
-        elif value == "2":
-            return "<td>2 (♿❌)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (♿❓)</td>",
+                "1": "<td>1 (♿✔️)</td>",
+                "2": "<td>2 (♿❌)</td>",
+            },
+        )
 
     else:
-        return f"<td>{escape(value)}</td>"
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
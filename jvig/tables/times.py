@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,11 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from urllib.parse import quote_plus
-
-from markupsafe import escape
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
 
 from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, link, plain
 
 VALID_FIELDS: set[str] = {
     "trip_id",
@@ -33,61 +34,54 @@ VALID_FIELDS: set[str] = {
     "timepoint",
 }
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "arrival_time": valid.time,
+    "departure_time": valid.time,
+    "stop_sequence": valid.uint,
+    "pickup_type": {"", "0", "1", "2", "3"}.__contains__,
+    "drop_off_type": {"", "0", "1", "2", "3"}.__contains__,
+    "shape_dist_traveled": valid.non_negative_float,
+    "timepoint": {"", "0", "1"}.__contains__,
+}
+
 
 def header_class(field: str) -> str:
     return "" if field in VALID_FIELDS else "value-unrecognized"
 
 
-def format_cell(row: dict[str, str], field: str) -> str:
-    value = row[field]
-
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
     if field == "trip_id":
-        return f'<td><a href="/trip/{quote_plus(value)}">{escape(value)}</a></td>'
-
-    elif field in {"arrival_time", "departure_time"}:
-        if valid.time(value):
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return link(field, "trip/")
 
     elif field == "stop_id":
-        return f'<td><a href="/stop/{quote_plus(value)}">{escape(value)}</a></td>'
+        return link(field, "stop/")
 
-    elif field == "stop_sequence":
-        if valid.uint(value):
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+    elif field in {"arrival_time", "departure_time", "stop_sequence", "shape_dist_traveled"}:
+        return checked(field, FIELD_CHECKS[field])
 
     elif field in {"pickup_type", "drop_off_type"}:
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (🚏)</td>"
-        elif value == "1":
-            return "<td>1 (🚫)</td>"
-        elif value == "2":
-            return "<td>2 (☎️)</td>"
-        elif value == "3":
-            return "<td>3 (👈)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
-
-    elif field == "shape_dist_traveled":
-        if valid.non_negative_float(value):
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (🚏)</td>",
+                "1": "<td>1 (🚫)</td>",
+                "2": "<td>2 (☎️)</td>",
+                "3": "<td>3 (👈)</td>",
+            },
+        )
 
     elif field == "timepoint":
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (🤷)</td>"
-        elif value == "1":
-            return "<td>1 (📌)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(field, {"": "<td></td>", "0": "<td>0 (🤷)</td>", "1": "<td>1 (📌)</td>"})
 
     else:
-        return f"<td>{escape(value)}</td>"
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
@@ -0,0 +1,82 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
+
+from .. import valid
+from . import cells
+from .cells import CellFormatter, RowFormatter, checked, enumerated, link, plain
+
+VALID_FIELDS: set[str] = {
+    "from_stop_id",
+    "to_stop_id",
+    "from_route_id",
+    "to_route_id",
+    "from_trip_id",
+    "to_trip_id",
+    "transfer_type",
+    "min_transfer_time",
+}
+
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "transfer_type": {"", "0", "1", "2", "3", "4", "5"}.__contains__,
+    "min_transfer_time": lambda value: not value or valid.uint(value),
+}
+
+
+def header_class(field: str) -> str:
+    return "" if field in VALID_FIELDS else "value-unrecognized"
+
+
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
+    if field in {"from_stop_id", "to_stop_id"}:
+        return link(field, "stop/")
+
+    elif field in {"from_route_id", "to_route_id"}:
+        return link(field, "route/")
+
+    elif field in {"from_trip_id", "to_trip_id"}:
+        return link(field, "trip/")
+
+    elif field == "transfer_type":
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (👍)</td>",
+                "1": "<td>1 (⏱️)</td>",
+                "2": "<td>2 (🕑)</td>",
+                "3": "<td>3 (🚫)</td>",
+                "4": "<td>4 (💺)</td>",
+                "5": "<td>5 (💺🚫)</td>",
+            },
+        )
+
+    elif field == "min_transfer_time":
+        return checked(field, FIELD_CHECKS[field])
+
+    else:
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,9 +14,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from urllib.parse import quote_plus
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping
 
-from markupsafe import escape
+from . import cells
+from .cells import CellFormatter, RowFormatter, enumerated, link, plain
 
 VALID_FIELDS: set[str] = {
     "route_id",
@@ -33,6 +35,13 @@ VALID_FIELDS: set[str] = {
 
 EXTENDED_FIELDS: set[str] = {"exceptional"}
 
+FIELD_CHECKS: dict[str, Callable[[str], bool]] = {
+    "direction_id": {"0", "1"}.__contains__,
+    "exceptional": {"0", "1"}.__contains__,
+    "wheelchair_accessible": {"", "0", "1", "2"}.__contains__,
+    "bikes_allowed": {"", "0", "1", "2"}.__contains__,
+}
+
 
 def header_class(field: str) -> str:
     if field in EXTENDED_FIELDS:
@@ -42,47 +51,49 @@ def header_class(field: str) -> str:
     return "value-unrecognized"
 
 
-def format_cell(row: dict[str, str], field: str) -> str:
-    value = row[field]
-
+@lru_cache(maxsize=None)
+def cell_formatter(field: str) -> CellFormatter:
     if field == "route_id":
-        return f'<td><a href="/route/{quote_plus(value)}">{escape(value)}</a></td>'
+        return link(field, "route/")
 
     elif field == "service_id":
-        return f'<td><a href="/calendar/{quote_plus(value)}">{escape(value)}</a></td>'
-
-    elif field in {"direction_id", "exceptional"}:
-        if value in {"0", "1"}:
-            return f"<td>{escape(value)}</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return link(field, "calendar/")
 
     elif field == "block_id":
-        return f'<td><a href="/block/{quote_plus(value)}">{escape(value)}</a></td>'
+        return link(field, "block/")
+
+    elif field in {"direction_id", "exceptional"}:
+        return enumerated(field, {"0": "<td>0</td>", "1": "<td>1</td>"})
 
     elif field == "wheelchair_accessible":
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (♿❓)</td>"
-        elif value == "1":
-            return "<td>1 (♿✔️)</td>"
-        elif value == "2":
-            return "<td>2 (♿❌)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (♿❓)</td>",
+                "1": "<td>1 (♿✔️)</td>",
+                "2": "<td>2 (♿❌)</td>",
+            },
+        )
 
     elif field == "bikes_allowed":
-        if value == "":
-            return "<td></td>"
-        elif value == "0":
-            return "<td>0 (🚲❓)</td>"
-        elif value == "1":
-            return "<td>1 (🚲✔️)</td>"
-        elif value == "2":
-            return "<td>2 (🚲❌)</td>"
-        else:
-            return f'<td class="value-invalid">{escape(value)}</td>'
+        return enumerated(
+            field,
+            {
+                "": "<td></td>",
+                "0": "<td>0 (🚲❓)</td>",
+                "1": "<td>1 (🚲✔️)</td>",
+                "2": "<td>2 (🚲❌)</td>",
+            },
+        )
 
     else:
-        return f"<td>{escape(value)}</td>"
+        return plain(field)
+
+
+def format_cell(row: Mapping[str, str], field: str) -> str:
+    return cell_formatter(field)(row)
+
+
+def compile_row(header: Iterable[str]) -> RowFormatter:
+    return cells.compile_row(header, cell_formatter)
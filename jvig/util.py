@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,15 +14,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+import threading
 from datetime import date
-from typing import Any, Hashable, Iterable, TypeVar
+from math import asin, cos, radians, sin, sqrt
+from pathlib import Path
+from typing import Any, Callable, Generic, Hashable, Iterable, Optional, TypeVar
 
 from jinja2 import is_undefined
 
+EARTH_RADIUS = 6_371_008.8
+"""Mean radius of the Earth, in meters"""
+
 T = TypeVar("T")
 THashable = TypeVar("THashable", bound=Hashable)
 
 
+def user_cache_dir() -> Path:
+    """Returns the directory for jvig's caches, inside the user's cache directory"""
+    cache = os.environ.get("XDG_CACHE_HOME")
+    return (Path(cache) if cache else Path.home() / ".cache") / "jvig"
+
+
 def time_to_int(time: str) -> int:
     try:
         h, m, s = map(int, time.split(":"))
@@ -31,6 +44,17 @@ def time_to_int(time: str) -> int:
         return -1
 
 
+def int_to_time(seconds: int) -> str:
+    """Formats a number of seconds as a GTFS time string ("%H:%M:%S").
+    Negative values (used to represent invalid times) are formatted as an empty string.
+    """
+    if seconds < 0:
+        return ""
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02}:{m:02}:{s:02}"
+
+
 def sequence_to_int(text: str) -> int:
     try:
         return int(text)
@@ -76,3 +100,56 @@ def unique_list(it: Iterable[THashable]) -> list[THashable]:
             lst.append(i)
 
     return lst
+
+
+def haversine(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Calculates the great-circle distance (in meters) between two (lat, lon) points."""
+    lat1, lon1 = map(radians, a)
+    lat2, lon2 = map(radians, b)
+    h = sin((lat2 - lat1) * 0.5) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) * 0.5) ** 2
+    return 2 * EARTH_RADIUS * asin(sqrt(h))
+
+
+class BackgroundTask(Generic[T]):
+    """BackgroundTask computes a value on a separate thread, exactly once.
+
+    The computation starts on the first call to `start` or `result`.
+    """
+
+    def __init__(self, func: Callable[[], T], name: str = "jvig-background-task") -> None:
+        self._func = func
+        self._name = name
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._finished = threading.Event()
+        self._value: Optional[T] = None
+        self._error: Optional[BaseException] = None
+
+    def _run(self) -> None:
+        try:
+            self._value = self._func()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._finished.set()
+
+    def start(self) -> None:
+        """Starts the computation, unless it was already started"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def done(self) -> bool:
+        """Checks if the computation has finished"""
+        return self._finished.is_set()
+
+    def result(self, timeout: Optional[float] = None) -> T:
+        """Waits for the computed value and returns it.
+        Re-raises any exception raised by the computation."""
+        self.start()
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"{self._name} has not finished in {timeout} s")
+        if self._error is not None:
+            raise self._error
+        return self._value  # type: ignore
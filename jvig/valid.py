@@ -25,6 +25,7 @@ TIME_PATTERN = re.compile(r"^([0-9]+):([0-9]{2}):([0-9]{2})$")
 
 DECIMAL_PATTERN = re.compile(r"^-?[0-9]+(?:\.[0-9]+)?$")
 UINT_PATTERN = re.compile(r"^[0-9]+$")
+INT_PATTERN = re.compile(r"^-?[0-9]+$")
 
 
 def color(text: str) -> bool:
@@ -67,6 +68,14 @@ def uint(text: str) -> bool:
     return UINT_PATTERN.match(text) is not None
 
 
+def integer(text: str) -> bool:
+    return INT_PATTERN.match(text) is not None
+
+
+def decimal(text: str) -> bool:
+    return DECIMAL_PATTERN.match(text) is not None
+
+
 def date(text: str) -> bool:
     if DATE_PATTERN.match(text) is None:
         return False
@@ -0,0 +1,124 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from io import StringIO
+
+import pytest
+
+from jvig.api import ApiPool, PoolBusy
+from jvig.app import Application
+from jvig.gtfs import Gtfs
+
+HUB_TRIPS = 3000
+
+
+def get_hub_gtfs() -> Gtfs:
+    """Returns a feed with a single, very busy stop - departures from which are slow to compute"""
+    gtfs = Gtfs()
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id\r\n" + "".join(f"R,S,T{i}\r\n" for i in range(HUB_TRIPS))
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            + "".join(
+                f"T{i},0,HUB,{time},{time}\r\n"
+                for i in range(HUB_TRIPS)
+                for time in [f"{i // 120 + 5:02}:{i // 2 % 60:02}:00"]
+            )
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_pool() -> None:
+    pool = ApiPool(workers=1, max_pending=1)
+    assert pool.run(lambda: threading.current_thread().name).startswith("jvig-api")
+
+    # Occupy the only slot
+    started = threading.Event()
+    release = threading.Event()
+    blocker = threading.Thread(target=pool.run, args=(lambda: started.set() or release.wait(),))
+    blocker.start()
+    started.wait()
+
+    with pytest.raises(PoolBusy):
+        pool.run(lambda: None)
+
+    release.set()
+    blocker.join()
+    assert pool.run(lambda: 42) == 42
+    pool.shutdown()
+
+
+def test_offloaded_views() -> None:
+    app = Application(get_hub_gtfs())
+    client = app.flask.test_client()
+
+    response = client.get("/api/stop/departures/HUB")
+    assert response.status_code == 200
+    assert len(response.json) == HUB_TRIPS  # type: ignore
+
+    app.api.shutdown()
+    app.api = ApiPool(max_pending=0)
+    response = client.get("/api/stop/departures/HUB")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    # Cheap endpoints are never rejected
+    assert client.get("/api/report").status_code in (200, 202)
+    app.api.shutdown()
+
+
+def get_departures(app: Application, clients: int, requests: int) -> list[int]:
+    """Sends `requests` requests for departures from the busy stop from each of `clients`
+    concurrent clients. Returns the status codes of all responses."""
+    statuses: list[int] = []
+
+    def client() -> None:
+        test_client = app.flask.test_client()
+        for _ in range(requests):
+            statuses.append(test_client.get("/api/stop/departures/HUB").status_code)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_concurrent_requests() -> None:
+    gtfs = get_hub_gtfs()
+
+    # Without a bound every request is computed
+    unbounded = Application(gtfs)
+    unbounded.api = ApiPool(workers=64, max_pending=1000)
+    assert get_departures(unbounded, 24, 3) == [200] * (24 * 3)
+    unbounded.api.shutdown()
+
+    # With a bound, excess requests are rejected with 503 Service Unavailable
+    bounded = Application(gtfs)
+    bounded.api = ApiPool(workers=2, max_pending=4)
+    statuses = get_departures(bounded, 24, 3)
+    assert set(statuses) == {200, 503}
+    bounded.api.shutdown()
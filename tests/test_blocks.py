@@ -0,0 +1,123 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+from io import StringIO
+
+from jvig.blocks import BlockEngine
+from jvig.gtfs import Gtfs
+
+
+def get_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon\r\n"
+            "A,A,52.0,21.0\r\n"
+            "B,B,52.1,21.0\r\n"
+            "C,C,53.0,21.0\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id,block_id\r\n"
+            "R,WD,t3,b1\r\n"
+            "R,WD,t1,b1\r\n"
+            "R,WD,t2,b1\r\n"
+            "R,SA,t4,b1\r\n"
+            "R,WD,t5,\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "calendar",
+        StringIO(
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+            "start_date,end_date\r\n"
+            "WD,1,1,1,1,1,0,0,20240101,20240107\r\n"
+            "SA,0,0,0,0,0,1,0,20240101,20240107\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            "t1,0,A,08:00:00,08:00:00\r\n"
+            "t1,1,B,08:30:00,08:30:00\r\n"
+            "t2,0,B,08:40:00,08:40:00\r\n"
+            "t2,1,A,09:10:00,09:10:00\r\n"
+            "t3,0,C,09:05:00,09:05:00\r\n"
+            "t3,1,A,10:00:00,10:00:00\r\n"
+            "t4,0,A,12:00:00,12:00:00\r\n"
+            "t4,1,B,12:30:00,12:30:00\r\n"
+            "t5,0,A,12:00:00,12:00:00\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_blocks_index() -> None:
+    gtfs = get_gtfs()
+    assert gtfs.blocks == {"b1": ["t1", "t2", "t3", "t4"]}
+
+
+def test_analyze() -> None:
+    engine = BlockEngine(get_gtfs())
+    analysis = engine.analyze("b1")
+    assert analysis is not None
+    assert analysis.trip_ids == ["t1", "t2", "t3", "t4"]
+    assert analysis.has_issues
+    assert len(analysis.days) == 2
+
+    weekdays, saturdays = analysis.days
+    assert weekdays.dates == [date(2024, 1, i) for i in range(1, 6)]
+    assert weekdays.trip_ids == ["t1", "t2", "t3"]
+    assert len(weekdays.links) == 2
+
+    link = weekdays.links[0]
+    assert link.from_stop_id == "B"
+    assert link.to_stop_id == "B"
+    assert link.layover == 600
+    assert link.distance == 0.0
+    assert not link.overlap
+    assert not link.teleport
+
+    # t2 arrives at A at 09:10, while t3 departs from C (~110 km away) at 09:05
+    link = weekdays.links[1]
+    assert link.from_stop_id == "A"
+    assert link.to_stop_id == "C"
+    assert link.layover == -300
+    assert link.distance is not None and link.distance > 100_000
+    assert link.overlap
+    assert link.teleport
+
+    assert saturdays.dates == [date(2024, 1, 6)]
+    assert saturdays.trip_ids == ["t4"]
+    assert saturdays.links == []
+    assert not saturdays.has_issues
+
+
+def test_analyze_cached() -> None:
+    engine = BlockEngine(get_gtfs())
+    assert engine.analyze("b1") is engine.analyze("b1")
+
+
+def test_analyze_missing() -> None:
+    engine = BlockEngine(get_gtfs())
+    assert engine.analyze("b2") is None
+    assert engine.analyze("") is None
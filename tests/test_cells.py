@@ -0,0 +1,137 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from io import StringIO
+from pathlib import Path
+
+from flask import render_template_string
+from markupsafe import escape as markupsafe_escape
+
+from jvig.app import Application
+from jvig.gtfs import Gtfs
+from jvig.tables import routes, stops, times
+from jvig.tables.cells import enumerated, escape
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+STOP_ROWS = 10_000
+
+
+def test_escape() -> None:
+    for value in ["", "Centrum", "A & B", "<b>", "\"quoted\" 'single'", "ł&<>\"'"]:
+        assert escape(value) == str(markupsafe_escape(value))
+
+
+def test_enumerated() -> None:
+    format = enumerated("x", {"": "<td></td>", "1": "<td>1 (✔️)</td>"})
+    assert format({"x": ""}) == "<td></td>"
+    assert format({"x": "1"}) == "<td>1 (✔️)</td>"
+    assert format({"x": "<2>"}) == '<td class="value-invalid">&lt;2&gt;</td>'
+
+
+def test_compile_row() -> None:
+    gtfs = Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip")
+
+    header = gtfs.header_of("routes") + ["unknown"]
+    format_route = routes.compile_row(header)
+    for row in gtfs.routes.values():
+        row = {**row, "unknown": "<?>"}
+        assert format_route(row) == "".join(routes.format_cell(row, i) for i in header)
+
+    header = gtfs.header_of("stop_times")
+    format_time = times.compile_row(header)
+    for rows in gtfs.stop_times.values():
+        for row in rows:
+            assert format_time(row) == "".join(times.format_cell(row, i) for i in header)
+
+
+def test_short_rows() -> None:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon,location_type\r\n"
+            "S0,Zero,52.0,21.0,0\r\n"
+            "S1,One,52.0,21.0\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+
+    header = gtfs.header_of("stops")
+    assert stops.compile_row(header)(gtfs.stops["S1"]) == (
+        "<td>S1</td><td>One</td><td>52.0</td><td>21.0</td><td></td>"
+    )
+
+    client = Application(gtfs).flask.test_client()
+    assert client.get("/stops").status_code == 200
+    assert client.get("/stop/S1").status_code == 200
+
+
+def get_big_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station,"
+            "wheelchair_boarding,platform_code\r\n"
+            + "".join(
+                f"S{i},Stop {i} & Co,52.{i},21.{i},{i % 2},,{i % 3},{i % 4}\r\n"
+                for i in range(STOP_ROWS)
+            )
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_stops_page_benchmark() -> None:
+    app = Application(get_big_gtfs())
+    header = app.gtfs.header_of("stops")
+    data = list(app.gtfs.stops.values())
+
+    # The stops table, as rendered before row formatters were compiled - once per cell
+    per_cell_template = (
+        "{% for row in data %}<tr>{% for field in header %}"
+        "{{ stops_format_cell(row, field) }}"
+        "{% endfor %}</tr>{% endfor %}"
+    )
+    compiled_template = (
+        "{% set format_stop = stops_compile_row(header) %}"
+        "{% for row in data %}<tr>{{ format_stop(row) }}</tr>{% endfor %}"
+    )
+
+    def render(source: str) -> tuple[str, float]:
+        with app.flask.app_context():
+            start = time.perf_counter()
+            result = render_template_string(
+                source,
+                data=data,
+                header=header,
+                stops_format_cell=stops.format_cell,
+            )
+            return result, time.perf_counter() - start
+
+    per_cell, per_cell_time = render(per_cell_template)
+    compiled, compiled_time = render(compiled_template)
+    assert per_cell == compiled
+    assert compiled.count("<tr>") == STOP_ROWS
+
+    # NOTE: Timings are too noisy to be asserted - run with `pytest -s` to see them
+    print(
+        f"{STOP_ROWS} stop rows: {per_cell_time * 1000:.1f} ms formatted per cell, "
+        f"{compiled_time * 1000:.1f} ms with a compiled row formatter"
+    )
@@ -0,0 +1,69 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from jvig.app import Application
+from jvig.gtfs import Gtfs
+
+IMPORT_BUDGET = 0.05
+"""Maximum time (in seconds) of importing jvig.cli - usually it takes about 10 ms"""
+
+HEAVY_MODULES = {"flask", "jinja2", "werkzeug", "jvig.app", "jvig.gtfs", "jvig.tables"}
+
+
+def test_import_time() -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import jvig.cli"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    # Lines of -X importtime look like: "import time:  self [us] | cumulative | imported package"
+    cumulative: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "[us]" not in line:
+            _, total, name = line[12:].split("|")
+            cumulative[name.strip()] = int(total)
+
+    assert not HEAVY_MODULES & cumulative.keys()
+    assert cumulative["jvig.cli"] / 1_000_000 < IMPORT_BUDGET
+
+
+def test_application_is_still_importable_from_cli() -> None:
+    from jvig.cli import Application as CliApplication
+
+    assert CliApplication is Application
+
+
+def test_template_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    app = Application(Gtfs())
+    app.flask.test_client().get("/agency")
+    cached = list((tmp_path / "jvig" / "templates").iterdir())
+    assert len(cached) == 1
+
+    # Other applications load the compiled template instead of compiling it again
+    other = Application(Gtfs())
+    assert other.flask.jinja_env.bytecode_cache is app.flask.jinja_env.bytecode_cache
+    other.flask.test_client().get("/agency")
+    assert list((tmp_path / "jvig" / "templates").iterdir()) == cached
@@ -0,0 +1,103 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+from pathlib import Path
+
+import pytest
+
+from jvig import compression
+from jvig.app import Application
+from jvig.compression import CompressedPayload, CompressionCache, negotiate
+from jvig.gtfs import Gtfs
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def test_negotiate(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(compression, "SUPPORTED_ENCODINGS", ("br", "gzip"))
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("br;q=0.5, gzip") == "gzip"
+    assert negotiate("br;q=0, GZIP;q=0.1") == "gzip"
+    assert negotiate("*") == "br"
+    assert negotiate("*, br;q=0") == "gzip"
+    assert negotiate("gzip;q=invalid") is None
+
+
+def test_compression_cache() -> None:
+    cache = CompressionCache(max_bytes=10)
+    cache.put("/a", "gzip", CompressedPayload(b"aaaa", "gzip", "text/plain"))
+    cache.put("/b", "gzip", CompressedPayload(b"bbbb", "gzip", "text/plain"))
+    assert cache.get("/a", "gzip") is not None  # /a is now the most recently used
+    assert cache.get("/a", "br") is None
+
+    cache.put("/c", "gzip", CompressedPayload(b"cccc", "gzip", "text/plain"))
+    assert cache.size == 8
+    assert cache.get("/b", "gzip") is None
+    assert cache.get("/a", "gzip") is not None
+    assert cache.get("/c", "gzip") is not None
+
+    cache.put("/d", "gzip", CompressedPayload(b"d" * 11, "gzip", "text/plain"))
+    assert cache.get("/d", "gzip") is None
+
+
+def test_application_compression() -> None:
+    app = Application(Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip"))
+    client = app.flask.test_client()
+
+    plain = client.get("/api/map/stops")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    compressed = client.get("/api/map/stops", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain.data
+    assert app.compressed.get("/api/map/stops", "gzip") is not None
+
+    # The second response should come straight from the cache
+    again = client.get("/api/map/stops", headers={"Accept-Encoding": "gzip"})
+    assert again.data == compressed.data
+    assert again.content_type == compressed.content_type
+
+    # Views which depend on the query aren't cached
+    trips = client.get("/route/A1", headers={"Accept-Encoding": "gzip"})
+    assert trips.headers["Content-Encoding"] == "gzip"
+    assert app.compressed.get("/route/A1", "gzip") is None
+
+
+def test_cached_queries() -> None:
+    app = Application(Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip"))
+    client = app.flask.test_client()
+
+    route = client.get("/api/map/route/A1").json
+    assert route is not None
+    assert sorted(route["shapes"]) == ["0", "3", "4", "5", "6", "7", "8"]
+    assert len(route["stops"]) == len({i["id"] for i in route["stops"]}) == 28
+
+    # Batched shapes are cached by the whole URL, including the query
+    a = client.get("/api/map/shapes?ids=0,1,missing", headers={"Accept-Encoding": "gzip"})
+    b = client.get("/api/map/shapes?ids=2", headers={"Accept-Encoding": "gzip"})
+    assert a.data != b.data
+    assert app.compressed.get("/api/map/shapes?ids=0,1,missing", "gzip") is not None
+    assert app.compressed.get("/api/map/shapes?ids=2", "gzip") is not None
+
+    shapes = client.get("/api/map/shapes?ids=0,1,missing").json
+    assert shapes is not None
+    assert list(shapes) == ["0", "1"]
+    assert shapes["0"] == route["shapes"]["0"]
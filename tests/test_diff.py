@@ -0,0 +1,102 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from jvig.diff import EntityDiff, diff_gtfs, diff_streaming
+from jvig.gtfs import Gtfs
+
+OLD_FEED = {
+    "stops.txt": (
+        "stop_id,stop_name,stop_lat,stop_lon\r\n"
+        "A,A,52.0,21.0\r\n"
+        "B,B,52.1,21.0\r\n"
+        "C,C,52.2,21.0\r\n"
+    ),
+    "routes.txt": "route_id,route_short_name,route_type\r\nR,1,3\r\n",
+    "trips.txt": ("route_id,service_id,trip_id\r\n" "R,S,t1\r\n" "R,S,t2\r\n" "R,S,t3\r\n"),
+    "calendar_dates.txt": "service_id,date,exception_type\r\nS,20240101,1\r\n",
+    "stop_times.txt": (
+        "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+        "t1,0,A,08:00:00,08:00:00\r\n"
+        "t1,1,B,08:10:00,08:10:00\r\n"
+        "t2,0,A,09:00:00,09:00:00\r\n"
+        "t2,1,B,09:10:00,09:10:00\r\n"
+        "t3,0,B,10:00:00,10:00:00\r\n"
+    ),
+}
+
+NEW_FEED = {
+    # C removed, D added, B renamed; stop_desc column added, but empty
+    "stops.txt": (
+        "stop_id,stop_name,stop_lat,stop_lon,stop_desc\r\n"
+        "A,A,52.0,21.0,\r\n"
+        "B,B2,52.1,21.0,\r\n"
+        "D,D,52.3,21.0,\r\n"
+    ),
+    "routes.txt": "route_id,route_short_name,route_type\r\nR,1,3\r\n",
+    # t3 removed, t4 added
+    "trips.txt": ("route_id,service_id,trip_id\r\n" "R,S,t1\r\n" "R,S,t2\r\n" "R,S,t4\r\n"),
+    # S gains a date
+    "calendar_dates.txt": (
+        "service_id,date,exception_type\r\n" "S,20240101,1\r\n" "S,20240102,1\r\n"
+    ),
+    # t1 unchanged (but reordered), t2 retimed
+    "stop_times.txt": (
+        "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+        "t1,1,B,08:10:00,08:10:00\r\n"
+        "t1,0,A,08:00:00,08:00:00\r\n"
+        "t2,0,A,09:00:00,09:00:00\r\n"
+        "t2,1,B,09:15:00,09:15:00\r\n"
+        "t3,0,B,10:00:00,10:00:00\r\n"
+        "t4,0,B,11:00:00,11:00:00\r\n"
+    ),
+}
+
+EXPECTED = {
+    "agency": EntityDiff(),
+    "stops": EntityDiff(added=["D"], removed=["C"], modified={"B": ["stops"]}),
+    "routes": EntityDiff(),
+    "trips": EntityDiff(added=["t4"], removed=["t3"], modified={"t2": ["stop_times"]}),
+    "calendars": EntityDiff(modified={"S": ["calendar_dates"]}),
+    "shapes": EntityDiff(),
+}
+
+
+def write_feed(where: Path, files: dict[str, str]) -> Path:
+    where.mkdir()
+    for name, content in files.items():
+        (where / name).write_text(content, encoding="utf-8", newline="")
+    return where
+
+
+def test_diff_gtfs(tmp_path: Path) -> None:
+    old = Gtfs.from_directory(write_feed(tmp_path / "old", OLD_FEED))
+    new = Gtfs.from_directory(write_feed(tmp_path / "new", NEW_FEED))
+
+    result = diff_gtfs(old, new)
+    assert result.entities == EXPECTED
+    assert result.has_changes
+    assert not diff_gtfs(new, new).has_changes
+
+
+def test_diff_streaming(tmp_path: Path) -> None:
+    old = write_feed(tmp_path / "old", OLD_FEED)
+    new = write_feed(tmp_path / "new", NEW_FEED)
+
+    result = diff_streaming(old, new)
+    assert result.entities == EXPECTED
+    assert not diff_streaming(new, new).has_changes
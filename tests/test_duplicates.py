@@ -0,0 +1,164 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import time
+from io import StringIO
+from string import ascii_lowercase
+
+import pytest
+
+from jvig.app import Application
+from jvig.duplicates import SAME_POSITION_DISTANCE, find_duplicate_stops, name_similarity
+from jvig.gtfs import Gtfs
+
+
+def stop(stop_id: str, name: str, lat: float, lon: float, **extra: str) -> dict[str, str]:
+    return {
+        "stop_id": stop_id,
+        "stop_name": name,
+        "stop_lat": f"{lat:.7f}",
+        "stop_lon": f"{lon:.7f}",
+        **extra,
+    }
+
+
+def test_name_similarity() -> None:
+    assert name_similarity("Centrum", "  centrum ") == 1.0
+    assert name_similarity("Plac  Wilsona", "plac wilsona") == 1.0
+    assert name_similarity("Plac Wilsona", "Pl. Wilsona") > 0.8
+    assert name_similarity("Centrum", "Dworzec Gdański") < 0.5
+
+
+def test_find_duplicate_stops() -> None:
+    # NOTE: 0.0001° of latitude is about 11 meters
+    stops = [
+        # Same position, different names
+        stop("A1", "Alpha", 52.0, 21.0),
+        stop("A2", "Something else", 52.0, 21.0),
+        # Similar names, a few meters apart - chained into a single cluster
+        stop("B1", "Plac Wilsona", 52.1, 21.0),
+        stop("B2", "plac wilsona", 52.1001, 21.0),
+        stop("B3", "Plac Wilsona 01", 52.1002, 21.0),
+        # Different names, a few meters apart
+        stop("C1", "Centrum", 52.2, 21.0),
+        stop("C2", "Dworzec Gdański", 52.2001, 21.0),
+        # Same names, too far apart
+        stop("D1", "Dworzec", 52.3, 21.0),
+        stop("D2", "Dworzec", 52.301, 21.0),
+        # A station and its platforms
+        stop("E", "Ochota", 52.4, 21.0, location_type="1"),
+        stop("E1", "Ochota", 52.4, 21.0, parent_station="E", platform_code="1"),
+        stop("E2", "Ochota", 52.4001, 21.0, parent_station="E", platform_code="2"),
+    ]
+
+    clusters = find_duplicate_stops({i["stop_id"]: i for i in stops})
+
+    assert [i.stop_ids for i in clusters] == [["B1", "B2", "B3"], ["A1", "A2"]]
+    assert [(i.stop_id, i.other_stop_id) for i in clusters[0].pairs] == [
+        ("B1", "B2"),
+        ("B1", "B3"),
+        ("B2", "B3"),
+    ]
+    assert clusters[1].pairs[0].distance == pytest.approx(0.0)
+    assert clusters[1].pairs[0].name_similarity < 0.5
+    assert clusters[0].as_json()["pairs"][0] == {
+        "stop_id": "B1",
+        "other_stop_id": "B2",
+        "distance": pytest.approx(11.12, abs=0.01),
+        "name_similarity": 1.0,
+    }
+
+
+def test_find_duplicate_stops_short_rows() -> None:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_lat,stop_lon,stop_name\r\n"
+            "A1,52.0,21.0,Alpha\r\n"
+            "A2,52.0,21.0\r\n"
+            "A3,52.0\r\n"
+        ),
+    )
+    app = Application(gtfs)
+    client = app.flask.test_client()
+
+    app.duplicate_stops.start()
+    assert [i.stop_ids for i in app.duplicate_stops.result()] == [["A1", "A2"]]
+    assert client.get("/report/duplicate-stops").status_code == 200
+
+
+def test_find_duplicate_stops_many() -> None:
+    rng = random.Random(42)
+    stops = {
+        f"S{i}": stop(
+            f"S{i}",
+            "".join(rng.choices(ascii_lowercase, k=12)),
+            52.0 + rng.random() * 0.5,
+            20.5 + rng.random(),
+        )
+        for i in range(100_000)
+    }
+    for i in range(1000):
+        original = stops[f"S{i}"]
+        stops[f"D{i}"] = {**original, "stop_id": f"D{i}"}
+
+    start = time.perf_counter()
+    clusters = find_duplicate_stops(stops)
+    elapsed = time.perf_counter() - start
+
+    # NOTE: A few random stops are also within a meter from each other
+    expected = {(f"D{i}", f"S{i}") for i in range(1000)}
+    found = {tuple(i.stop_ids) for i in clusters}
+    assert expected <= found
+    assert all(
+        pair.distance <= SAME_POSITION_DISTANCE
+        for cluster in clusters
+        if tuple(cluster.stop_ids) not in expected
+        for pair in cluster.pairs
+    )
+
+    # NOTE: Timings are too noisy to be asserted - run with `pytest -s` to see them
+    print(f"Found duplicates among 101k stops in {elapsed:.2f} s")
+
+
+def test_duplicate_stops_pages() -> None:
+    gtfs = Gtfs()
+    gtfs.stops = {
+        "A1": stop("A1", "Alpha", 52.0, 21.0),
+        "A2": stop("A2", "Alpha", 52.0, 21.0),
+    }
+    app = Application(gtfs)
+    client = app.flask.test_client()
+
+    app.duplicate_stops.start()
+    app.duplicate_stops.result()
+
+    response = client.get("/api/report/duplicate-stops")
+    assert response.status_code == 200
+    assert response.json == [
+        {
+            "stop_ids": ["A1", "A2"],
+            "pairs": [
+                {"stop_id": "A1", "other_stop_id": "A2", "distance": 0.0, "name_similarity": 1.0}
+            ],
+        }
+    ]
+
+    page = client.get("/report/duplicate-stops")
+    assert page.status_code == 200
+    assert b"stop/A2" in page.data
@@ -0,0 +1,96 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import re
+import shutil
+from pathlib import Path, PurePosixPath
+from urllib.parse import unquote, urljoin, urlsplit
+
+from jvig.export import MANIFEST_NAME, export_feed, output_path
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def test_output_path() -> None:
+    assert output_path("/") == PurePosixPath("index.html")
+    assert output_path("/stops") == PurePosixPath("stops/index.html")
+    assert output_path("/stop/a b") == PurePosixPath("stop/a b/index.html")
+    assert output_path("/api/map/stop/a b") == PurePosixPath("api/map/stop/a b")
+    assert output_path("/stop/../etc") is None
+    assert output_path("/stop/a//b") is None
+
+
+def test_export(tmp_path: Path) -> None:
+    feed = tmp_path / "feed"
+    out = tmp_path / "out"
+    shutil.copytree(FIXTURES_DIR / "gtfs_wkd", feed)
+
+    stats = export_feed(feed, out, processes=1)
+    assert stats.failed == 0
+    assert stats.rendered == stats.written + stats.linked
+    assert stats.linked > 0
+
+    assert (out / "index.html").is_file()
+    assert (out / "static" / "style.css").is_file()
+    assert (out / "stop" / "wsrod" / "index.html").is_file()
+    assert json.loads((out / "api" / "map" / "trip" / "0").read_text(encoding="utf-8"))
+
+    # Nothing has changed - nothing should be rendered
+    again = export_feed(feed, out, processes=1)
+    assert again.rendered == 0
+    assert again.skipped == stats.rendered
+
+    # Only calendar-dependent pages should be re-rendered
+    calendar_dates = feed / "calendar_dates.txt"
+    lines = calendar_dates.read_text(encoding="utf-8").splitlines(keepends=True)
+    calendar_dates.write_text("".join(lines[:-1]), encoding="utf-8")
+
+    partial = export_feed(feed, out, processes=1)
+    manifest = json.loads((out / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert partial.skipped == sum(
+        len(manifest["kinds"][i]["files"])
+        for i in ("agency", "routes", "stops", "stop", "route", "shape")
+    )
+    assert 0 < partial.written < partial.rendered
+    assert partial.rendered == partial.written + partial.linked + partial.unchanged
+
+
+def test_export_relative_links(tmp_path: Path) -> None:
+    out = tmp_path / "out"
+    export_feed(FIXTURES_DIR / "gtfs_wkd", out, processes=1)
+
+    # Resolve links of a nested page, just like a browser opening it from disk would
+    page = out / "stop" / "wsrod" / "index.html"
+    html = page.read_text(encoding="utf-8")
+    base = re.search(r'<base href="([^"]*)"', html)
+    assert base is not None
+    assert base[1] == "../../"
+    base_url = urljoin(page.as_uri(), base[1])
+    assert base_url == out.as_uri() + "/"
+
+    links = re.findall(r'(?:href|src)="([^"#?]+)"', html[base.end() :])
+    assert "static/style.css" in links
+    assert "trip/0" in links
+
+    for link in links:
+        url = urljoin(base_url, link)
+        if not url.startswith(base_url):
+            continue  # External resources, like Leaflet
+        target = Path(unquote(urlsplit(url).path))
+        if target.relative_to(out).parts[:1] in {("report",), ("stats",), ("plan",)}:
+            continue  # Not exported
+        assert target.is_file() or (target / "index.html").is_file(), link
@@ -0,0 +1,106 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from jvig import external
+from jvig.app import Application
+from jvig.external import ExternalTable, SortOrder, external_sort
+from jvig.gtfs import Gtfs
+
+FIXTURE_PATH = Path(__file__).with_name("fixtures") / "gtfs_wkd.zip"
+
+
+def to_row(values: list[str]) -> dict[str, str]:
+    return dict(zip(("group", "sequence", "original_index"), values))
+
+
+def test_external_sort(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    # Force lots of tiny runs, and intermediate merges of them
+    monkeypatch.setattr(external, "MIN_RUN_ROWS", 10)
+    monkeypatch.setattr(external, "MAX_MERGED_RUNS", 4)
+
+    rng = random.Random(42)
+    rows = [[f"g{rng.randrange(50)}", str(rng.randrange(20)), str(i)] for i in range(2000)]
+    by_group, by_sequence = external_sort(
+        rows,
+        [
+            SortOrder(0, lambda values: (values[0], int(values[1]))),
+            SortOrder(1, lambda values: values[1]),
+        ],
+        to_row,
+        memory_limit=1,
+        directory=tmp_path,
+    )
+
+    expected_by_group: dict[str, list[dict[str, str]]] = {}
+    for values in sorted(rows, key=lambda values: (values[0], int(values[1]))):
+        expected_by_group.setdefault(values[0], []).append(to_row(values))
+    assert dict(by_group.items()) == expected_by_group
+    assert by_group["g7"] == expected_by_group["g7"]
+    assert len(by_group) == len(expected_by_group)
+
+    # Rows with equal keys keep their original order
+    expected_by_sequence: dict[str, list[dict[str, str]]] = {}
+    for values in rows:
+        expected_by_sequence.setdefault(values[1], []).append(to_row(values))
+    assert {k: by_sequence[k] for k in by_sequence} == expected_by_sequence
+
+    # Only the final files remain
+    assert {i.name for i in tmp_path.iterdir()} == {
+        Path(by_group.path).name,
+        Path(by_sequence.path).name,
+    }
+
+
+def test_external_table_removes_file(tmp_path: Path) -> None:
+    (table,) = external_sort(
+        [["a", "1"], ["b", "2"], ["a", "3"]],
+        [SortOrder(0, lambda values: values[0])],
+        lambda values: {"key": values[0], "value": values[1]},
+        memory_limit=1024 * 1024,
+        directory=tmp_path,
+    )
+    assert isinstance(table, ExternalTable)
+    assert [i["value"] for i in table["a"]] == ["1", "3"]
+    assert "c" not in table
+    assert table.get("c") is None
+
+    path = table.path
+    assert os.path.exists(path)
+    table.close()
+    assert not os.path.exists(path)
+
+
+def test_gtfs_memory_limit() -> None:
+    in_memory = Gtfs.from_user_input(FIXTURE_PATH)
+    on_disk = Gtfs.from_user_input(FIXTURE_PATH, memory_limit=64 * 1024)
+
+    assert isinstance(on_disk.stop_times, ExternalTable)
+    assert isinstance(on_disk.stop_times_by_stops, ExternalTable)
+    assert dict(on_disk.stop_times.items()) == in_memory.stop_times
+    assert dict(on_disk.stop_times_by_stops.items()) == in_memory.stop_times_by_stops
+    assert on_disk.trip_summaries == in_memory.trip_summaries
+    assert on_disk.dangling == in_memory.dangling
+
+    expected = Application(in_memory).flask.test_client()
+    got = Application(on_disk).flask.test_client()
+    for url in ("/trip/0", "/stop/wsrod", "/api/stop/departures/wsrod?date=20220516"):
+        assert got.get(url).data == expected.get(url).data
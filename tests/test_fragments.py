@@ -0,0 +1,90 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from typing import Iterable
+
+from jvig.app import Application
+from jvig.fragments import RowFragmentCache
+from jvig.gtfs import Gtfs, Row
+from jvig.tables import stops
+from jvig.tables.cells import RowFormatter
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def test_row_fragment_cache() -> None:
+    compiled: list[tuple[str, ...]] = []
+    calls: list[str] = []
+
+    def compile_row(header: Iterable[str]) -> RowFormatter:
+        format_row = stops.compile_row(header)
+        compiled.append(tuple(header))
+
+        def counted(row: Row) -> str:
+            calls.append(row["stop_id"])
+            return format_row(row)
+
+        return counted
+
+    cache = RowFragmentCache(max_rows=2)
+    a = {"stop_id": "A", "location_type": "1"}
+    b = {"stop_id": "B", "location_type": ""}
+    c = {"stop_id": "C", "location_type": "9"}
+    header = ["stop_id", "location_type"]
+
+    assert cache.render("stops", "A", header, a, compile_row) == "<td>A</td><td>1 (🏢)</td>"
+    assert cache.render("stops", "A", header, a, compile_row) == "<td>A</td><td>1 (🏢)</td>"
+    assert len(calls) == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    # Different headers are cached separately
+    assert cache.render("stops", "A", ["stop_id"], a, compile_row) == "<td>A</td>"
+    assert len(calls) == 2
+
+    # Least recently used entries are evicted
+    cache.render("stops", "B", header, b, compile_row)
+    assert len(cache) == 2
+    cache.render("stops", "A", header, a, compile_row)
+    assert len(calls) == 4
+    assert compiled == [("stop_id", "location_type"), ("stop_id",)]
+
+    # Entries are only reused for the same row object
+    assert cache.render("stops", "A", header, c, compile_row) == (
+        '<td>C</td><td class="value-invalid">9</td>'
+    )
+    assert cache.hit_rate == 1 / 6
+
+
+def test_application_row_fragments() -> None:
+    app = Application(Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip"))
+    client = app.flask.test_client()
+
+    first = client.get("/trip/0")
+    assert app.fragments.hits == 0
+    assert app.fragments.misses > 0
+
+    # stop_times of trip 0 are now reused on the stop page
+    client.get("/stop/wsrod")
+    assert app.fragments.hits > 0
+
+    # The page itself doesn't change
+    assert client.get("/trip/0").data == first.data
+
+    metrics = client.get("/api/metrics").get_json()
+    assert metrics["row_fragments"]["hits"] == app.fragments.hits
+    assert 0.0 < metrics["row_fragments"]["hit_rate"] < 1.0
@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022-2023 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -14,12 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import csv
 from datetime import date
 from io import StringIO
 from pathlib import Path
 from typing import ClassVar, Optional
 
-from jvig.gtfs import Gtfs
+from jvig import gtfs as gtfs_module
+from jvig.gtfs import EMPTY_TRIP_SUMMARY, MISSING_AGENCY_ID, Gtfs, TripSummary
 
 FIXTURE_PATH = Path(__file__).with_name("fixtures")
 
@@ -147,6 +149,23 @@ class TestWkdGtfsZip(BaseWkdGtfsTest):
         return TestWkdGtfsZip.gtfs_instance
 
 
+class TestWkdGtfsZipPipelined(BaseWkdGtfsTest):
+    gtfs_instance: ClassVar[Optional[Gtfs]] = None
+
+    def get_gtfs(self) -> Gtfs:
+        if not TestWkdGtfsZipPipelined.gtfs_instance:
+            # Force every compressed member to be inflated on a separate thread
+            old_threshold = gtfs_module.PIPELINE_THRESHOLD
+            gtfs_module.PIPELINE_THRESHOLD = 0
+            try:
+                TestWkdGtfsZipPipelined.gtfs_instance = Gtfs.from_zip(
+                    FIXTURE_PATH / "gtfs_wkd.zip"
+                )
+            finally:
+                gtfs_module.PIPELINE_THRESHOLD = old_threshold
+        return TestWkdGtfsZipPipelined.gtfs_instance
+
+
 class TestWkdGtfsDirectory(BaseWkdGtfsTest):
     gtfs_instance: ClassVar[Optional[Gtfs]] = None
 
@@ -220,3 +239,184 @@ def test_unordered_shapes() -> None:
     assert gtfs.shapes["B"][1] == (-1.0, -1.0)
     assert gtfs.shapes["B"][2] == (-2.0, -2.0)
     assert gtfs.shapes["B"][3] == (-3.0, -3.0)
+
+
+def test_odd_stop_times() -> None:
+    stop_times_file = StringIO(
+        (
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            "t1,1,s0,10:00:00,10:00:00\r\n"
+            "\r\n"
+            "t1,0,s1,09:55:00\r\n"
+            "t1,2,s2,10:10:00,10:10:00,extra\r\n"
+        )
+    )
+
+    gtfs = Gtfs()
+    gtfs.load_stop_times("stop_times", stop_times_file)
+
+    # Rows with an unexpected number of fields are parsed just like csv.DictReader would
+    expected = list(
+        csv.DictReader(
+            StringIO(
+                "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+                "t1,0,s1,09:55:00\r\n"
+                "t1,1,s0,10:00:00,10:00:00\r\n"
+                "t1,2,s2,10:10:00,10:10:00,extra\r\n"
+            )
+        )
+    )
+    assert gtfs.stop_times["t1"] == expected
+    assert gtfs.stop_times["t1"][0]["departure_time"] is None
+    assert gtfs.stop_times_by_stops["s2"] == [expected[2]]
+
+
+def test_shapes_with_unusual_columns() -> None:
+    shapes_file = StringIO(
+        (
+            "shape_pt_lon,shape_pt_lat,shape_id,shape_pt_sequence,shape_dist_traveled\r\n"
+            "1.0,1.0,A,1,1.5\r\n"
+            "0.0,0.0,A,0\r\n"
+            "foo,bar,A,2,3.0\r\n"
+            "2.0,2.0,A,3,3.0\r\n"
+        )
+    )
+
+    gtfs = Gtfs()
+    gtfs.load_shapes("shapes", shapes_file)
+    assert gtfs.shapes == {"A": [(0.0, 0.0), (1.0, 1.0), (2.0, 2.0)]}
+
+
+def test_shapes_truncated_rows() -> None:
+    shapes_file = StringIO(
+        (
+            "shape_id,shape_pt_sequence,shape_pt_lat,shape_pt_lon,shape_dist_traveled\r\n"
+            "A,0,1.0,1.0\r\n"
+            "A,1,2.0\r\n"
+            "A,2,3.0,3.0,1.5\r\n"
+        )
+    )
+
+    gtfs = Gtfs()
+    gtfs.load_shapes("shapes", shapes_file)
+    assert gtfs.shapes == {"A": [(1.0, 1.0), (3.0, 3.0)]}
+
+
+def test_shapes_missing_columns() -> None:
+    shapes_file = StringIO(
+        ("shape_id,shape_pt_lat,shape_pt_lon\r\n" "A,0.0,0.0\r\n" "A,1.0,1.0\r\n")
+    )
+
+    gtfs = Gtfs()
+    gtfs.load_shapes("shapes", shapes_file)
+    assert gtfs.shapes == {}
+
+
+def test_trip_summaries() -> None:
+    gtfs = Gtfs()
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id,exceptional\r\n"
+            "R,S,t1,0\r\n"
+            "R,S,t2,1\r\n"
+            "R,S,t3,\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time,shape_dist_traveled\r\n"
+            "t1,2,s2,10:10:00,10:11:00,12.5\r\n"
+            "t1,0,s0,09:58:00,10:00:00,0\r\n"
+            "t1,1,s1,10:05:00,10:05:00,5.0\r\n"
+            "t2,0,s0,,25:00:00,\r\n"
+            "t2,1,s1,25:30:00,,\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+
+    assert gtfs.trip_summary("t1") == TripSummary(36000, 36600, 3, 12.5, False)
+    assert gtfs.trip_summary("t1").duration == 600
+    assert gtfs.trip_summary("t2") == TripSummary(90000, 91800, 2, None, True)
+    assert gtfs.trip_summary("t3") == EMPTY_TRIP_SUMMARY
+    assert gtfs.trip_summary("t3").duration == -1
+    assert gtfs.trip_summary("unknown") == EMPTY_TRIP_SUMMARY
+
+
+def test_dangling_references() -> None:
+    gtfs = Gtfs()
+    gtfs.load_to_row("agency", StringIO("agency_id,agency_name\r\nA,Agency\r\n"))
+    gtfs.load_stops(
+        "stops",
+        StringIO("stop_id,stop_name,parent_station\r\ns0,Stop 0,\r\ns1,Stop 1,st\r\n"),
+    )
+    gtfs.load_to_row(
+        "routes",
+        StringIO("route_id,agency_id\r\nR,A\r\nR2,B\r\n"),
+    )
+    gtfs.load_to_rows(
+        "calendar_dates",
+        StringIO("service_id,date,exception_type\r\nS,20240101,1\r\n"),
+    )
+    gtfs.load_to_row(
+        "trips",
+        StringIO("route_id,service_id,trip_id,shape_id\r\nR,S,t1,\r\nR3,S2,t2,sh\r\n"),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id\r\n"
+            "t1,0,s0\r\n"
+            "t1,1,s2\r\n"
+            "t3,0,s0\r\n"
+            "t3,1,s1\r\n"
+            "t2,0,s2\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+
+    assert {(fk.table, fk.column): values for fk, values in gtfs.dangling.items()} == {
+        ("routes", "agency_id"): {"B": ["R2"]},
+        ("stops", "parent_station"): {"st": ["s1"]},
+        ("trips", "route_id"): {"R3": ["t2"]},
+        ("trips", "service_id"): {"S2": ["t2"]},
+        ("trips", "shape_id"): {"sh": ["t2"]},
+        ("stop_times", "trip_id"): {"t3": ["t3"]},
+        ("stop_times", "stop_id"): {"s2": ["t1", "t2"]},
+    }
+
+    assert gtfs.is_dangling("stop_times", "stop_id", "s2")
+    assert not gtfs.is_dangling("stop_times", "stop_id", "s0")
+    assert not gtfs.is_dangling("trips", "trip_id", "t3")
+    assert gtfs.dangling_columns("trips", gtfs.trips["t1"]) == []
+    assert gtfs.dangling_columns("trips", gtfs.trips["t2"]) == [
+        "route_id",
+        "service_id",
+        "shape_id",
+    ]
+
+
+def test_dangling_references_without_agency_id() -> None:
+    gtfs = Gtfs()
+    gtfs.load_to_row("agency", StringIO("agency_id,agency_name\r\nA,Agency\r\n"))
+    gtfs.load_to_row("routes", StringIO("route_id,route_short_name\r\nR,1\r\n"))
+    gtfs.build_indexes()
+
+    assert gtfs.routes["R"]["agency_id"] == MISSING_AGENCY_ID
+    assert gtfs.dangling == {}
+
+
+def test_transfers_without_stops() -> None:
+    gtfs = Gtfs()
+    gtfs.load_to_rows(
+        "transfers",
+        StringIO("from_trip_id,to_trip_id,transfer_type\r\nt1,t2,4\r\n"),
+    )
+    gtfs.build_indexes()
+
+    assert gtfs.transfers == {
+        "": [{"from_trip_id": "t1", "to_trip_id": "t2", "transfer_type": "4"}]
+    }
+    assert gtfs.transfers_to == {}
+    assert gtfs.transfers_from_trip == {"t1": gtfs.transfers[""]}
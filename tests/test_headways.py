@@ -0,0 +1,138 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+from io import StringIO
+
+from jvig.gtfs import Gtfs
+from jvig.headways import HeadwayExpander
+
+
+def get_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id\r\n"
+            "M1,WD,metro\r\n"
+            "M1,SA,metro_sa\r\n"
+            "B1,WD,bus\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "calendar",
+        StringIO(
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+            "start_date,end_date\r\n"
+            "WD,1,1,1,1,1,0,0,20240101,20240107\r\n"
+            "SA,0,0,0,0,0,1,0,20240101,20240107\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            "metro,0,A,06:00:00,06:00:00\r\n"
+            "metro,1,B,06:02:00,06:03:00\r\n"
+            "metro_sa,0,A,06:00:00,06:00:00\r\n"
+            "metro_sa,1,B,06:02:00,06:02:00\r\n"
+            "bus,0,B,07:00:00,07:00:00\r\n"
+        ),
+    )
+    gtfs.load_to_rows(
+        "frequencies",
+        StringIO(
+            "trip_id,start_time,end_time,headway_secs,exact_times\r\n"
+            "metro,06:00:00,07:00:00,600,1\r\n"
+            "metro,07:00:00,07:30:00,300,\r\n"
+            "metro,25:00:00,24:00:00,300,\r\n"
+            "metro,08:00:00,09:00:00,0,\r\n"
+            "metro_sa,10:00:00,10:30:00,900,\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_trip_starts() -> None:
+    expander = HeadwayExpander(get_gtfs())
+    starts = expander.trip_starts("metro")
+    assert [i[0] // 60 for i in starts] == [
+        360,
+        370,
+        380,
+        390,
+        400,
+        410,
+        420,
+        425,
+        430,
+        435,
+        440,
+        445,
+    ]
+    assert starts[0] == (6 * 3600, True)
+    assert starts[-1] == (7 * 3600 + 25 * 60, False)
+
+    assert expander.trip_starts("bus") == ()
+
+
+def test_trip_starts_window() -> None:
+    expander = HeadwayExpander(get_gtfs())
+    assert [i[0] // 60 for i in expander.trip_starts("metro", 6 * 3600 + 1, 7 * 3600)] == [
+        370,
+        380,
+        390,
+        400,
+        410,
+    ]
+
+
+def test_trip_starts_memoized() -> None:
+    expander = HeadwayExpander(get_gtfs(), cache_size=2)
+    first = expander.trip_starts("metro", 0, 3600 * 8)
+    assert expander.trip_starts("metro", 0, 3600 * 8) is first
+
+    # Evict the cached entry
+    expander.trip_starts("metro", 0, 3600 * 7)
+    expander.trip_starts("metro", 0, 3600 * 6)
+    assert expander.trip_starts("metro", 0, 3600 * 8) is not first
+
+
+def test_departures_at() -> None:
+    expander = HeadwayExpander(get_gtfs())
+
+    departures = expander.departures_at("B", 7 * 3600, 8 * 3600)
+    assert [(d.trip_id, d.departure // 60) for d in departures] == [
+        ("metro", 423),
+        ("metro", 428),
+        ("metro", 433),
+        ("metro", 438),
+        ("metro", 443),
+        ("metro", 448),
+    ]
+    assert departures[0].trip_start == 7 * 3600
+    assert departures[0].arrival == 7 * 3600 + 2 * 60
+
+    # Only the Saturday trip runs on 2024-01-06
+    departures = expander.departures_at("B", day=date(2024, 1, 6))
+    assert [(d.trip_id, d.departure // 60) for d in departures] == [
+        ("metro_sa", 602),
+        ("metro_sa", 617),
+    ]
+
+    assert expander.has_departures_at("A")
+    assert not expander.has_departures_at("C")
@@ -0,0 +1,154 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import pickle
+import sys
+from pathlib import Path
+
+import pytest
+
+from jvig.app import Application
+from jvig.gtfs import REBUILDABLE_STRUCTURES, Gtfs
+from jvig.memory import MemoryGovernor, estimate_size
+
+FIXTURE_PATH = Path(__file__).with_name("fixtures") / "gtfs_wkd.zip"
+
+
+def test_estimate_size() -> None:
+    rows = [{"a": str(i), "b": "x" * 100} for i in range(10_000)]
+    exact = (
+        sys.getsizeof(rows)
+        + sum(sys.getsizeof(i) for i in rows)
+        + sum(sys.getsizeof(i["a"]) for i in rows)
+        + sys.getsizeof(rows[0]["b"])  # Shared by all rows
+        + sys.getsizeof("a")
+        + sys.getsizeof("b")
+    )
+    assert estimate_size(rows) == pytest.approx(exact, rel=0.05)
+    assert estimate_size(rows, 0) == sys.getsizeof(rows)
+    assert estimate_size(rows, 1) == pytest.approx(
+        sys.getsizeof(rows) + sum(sys.getsizeof(i) for i in rows),
+        rel=0.05,
+    )
+
+
+def test_governor() -> None:
+    sizes = {"a": 100, "b": 200, "c": 300, "table": 1000}
+    evicted: list[str] = []
+
+    def evict(name: str) -> None:
+        evicted.append(name)
+        sizes[name] = 0
+
+    governor = MemoryGovernor(1350)
+    for name in sizes:
+        governor.register(
+            name,
+            lambda name=name: sizes[name],
+            None if name == "table" else lambda name=name: evict(name),
+        )
+
+    assert governor.enforce() == ["a", "b"]
+    assert evicted == ["a", "b"]
+    assert governor.enforce() == []
+
+    report = governor.as_json()
+    assert report["total"] == 1300
+    assert [(i["name"], i["evictions"]) for i in report["structures"]] == [
+        ("a", 1),
+        ("b", 1),
+        ("c", 0),
+        ("table", 0),
+    ]
+
+    # Without a budget, nothing is ever evicted
+    assert MemoryGovernor().enforce() == []
+
+
+def test_governor_over_budget(caplog: pytest.LogCaptureFixture) -> None:
+    sizes = {"a": 100, "table": 1000}
+    governor = MemoryGovernor(900)
+    governor.register("a", lambda: sizes["a"], lambda: sizes.update(a=0))
+    governor.register("table", lambda: sizes["table"])
+
+    # Evicting "a" would not bring the usage under the budget
+    with caplog.at_level(logging.WARNING, logger="jvig.memory"):
+        assert governor.enforce() == []
+        assert governor.enforce() == []
+
+    assert sizes["a"] == 100
+    assert governor.evictions == {"a": 0, "table": 0}
+    assert len(caplog.records) == 1
+
+
+def test_evict_and_rebuild() -> None:
+    gtfs = Gtfs.from_user_input(FIXTURE_PATH)
+    expected = {name: getattr(gtfs, name) for name in REBUILDABLE_STRUCTURES}
+    assert gtfs.evictable_structures() == list(REBUILDABLE_STRUCTURES)
+
+    for name in REBUILDABLE_STRUCTURES:
+        gtfs.evict(name)
+        assert gtfs.estimated_size(name) == 0
+
+    # Evicted structures survive pickling
+    gtfs = pickle.loads(pickle.dumps(gtfs))
+
+    assert gtfs.trip_summaries == expected["trip_summaries"]
+    assert gtfs.blocks == expected["blocks"]
+    assert gtfs.stop_children == expected["stop_children"]
+    assert len(gtfs.stop_grid) == len(expected["stop_grid"])
+    assert gtfs.estimated_size("stop_grid") > 0
+
+    # Rows of a stop may be ordered differently after a rebuild
+    def keys(table: dict[str, list[dict[str, str]]]) -> dict[str, list[tuple[str, str]]]:
+        return {k: sorted((i["trip_id"], i["stop_sequence"]) for i in v) for k, v in table.items()}
+
+    assert keys(gtfs.stop_times_by_stops) == keys(expected["stop_times_by_stops"])
+
+    with pytest.raises(ValueError):
+        gtfs.evict("stop_times")
+    with pytest.raises(AttributeError):
+        gtfs.missing  # type: ignore
+
+
+def test_application_budget() -> None:
+    app = Application(Gtfs.from_user_input(FIXTURE_PATH), memory_budget=1)
+    client = app.flask.test_client()
+    assert client.get("/stop/wsrod").status_code == 200
+    assert client.get("/trip/0").status_code == 200
+
+    # Only the tables fit in the budget
+    usage = app.memory.usage()
+    app.memory.budget = sum(usage[i.name] for i in app.memory.structures if i.evict is None)
+
+    evicted = app.memory.enforce()
+    assert "row_fragments" in evicted
+    assert "trip_summaries" in evicted
+    assert app.gtfs.estimated_size("trip_summaries") == 0
+
+    # Everything is rebuilt on demand
+    assert client.get("/stop/wsrod").status_code == 200
+    assert client.get("/route/A1").status_code == 200
+    assert app.gtfs.estimated_size("trip_summaries") > 0
+
+    report = client.get("/api/memory").json
+    assert report is not None
+    assert report["budget"] == app.memory.budget
+    structures = {i["name"]: i for i in report["structures"]}
+    assert structures["stop_times"]["bytes"] > 0
+    assert not structures["stop_times"]["evictable"]
+    assert structures["trip_summaries"]["evictions"] == 1
@@ -0,0 +1,67 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from io import BufferedReader, BytesIO, TextIOWrapper
+
+import pytest
+
+from jvig.pipelined import PipelinedReader
+
+
+class FailingStream(BytesIO):
+    def read(self, size: "int | None" = -1) -> bytes:
+        if self.tell() > 0:
+            raise OSError("simulated read failure")
+        return super().read(size)
+
+
+def test_reads_everything():
+    data = bytes(range(256)) * 1000
+    with PipelinedReader(BytesIO(data), block_size=1000, max_blocks=2) as reader:
+        assert reader.read() == data
+        assert reader.read() == b""
+
+
+def test_small_reads():
+    data = b"0123456789" * 10
+    with PipelinedReader(BytesIO(data), block_size=7, max_blocks=2) as reader:
+        chunks: list[bytes] = []
+        while chunk := reader.read(3):
+            chunks.append(chunk)
+        assert b"".join(chunks) == data
+        assert max(len(i) for i in chunks) <= 3
+
+
+def test_text_wrapper():
+    data = 'stop_id,stop_name\r\nA,Zażółć\r\nB,"Gęślą\r\njaźń"\r\n'.encode("utf-8-sig")
+    raw = PipelinedReader(BytesIO(data), block_size=5, max_blocks=2)
+    with TextIOWrapper(BufferedReader(raw), encoding="utf-8-sig", newline="") as stream:
+        assert stream.read() == 'stop_id,stop_name\r\nA,Zażółć\r\nB,"Gęślą\r\njaźń"\r\n'
+
+
+def test_propagates_errors():
+    with PipelinedReader(FailingStream(b"x" * 100), block_size=10) as reader:
+        assert reader.read(10) == b"x" * 10
+        with pytest.raises(OSError):
+            reader.read(10)
+
+
+def test_early_close():
+    # Closing the reader before exhausting the source must not hang the producer
+    reader = PipelinedReader(BytesIO(b"x" * 10_000), block_size=1, max_blocks=1)
+    assert reader.read(1) == b"x"
+    reader.close()
+    assert reader.closed
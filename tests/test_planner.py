@@ -0,0 +1,164 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+from io import StringIO
+
+from jvig.gtfs import Gtfs
+from jvig.headways import HeadwayExpander
+from jvig.planner import Leg, Planner
+from jvig.util import time_to_int
+
+MONDAY = date(2024, 1, 1)
+SUNDAY = date(2024, 1, 7)
+
+
+def get_planner() -> Planner:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station\r\n"
+            "A,A,52.0,21.0,,\r\n"
+            "B,B,52.1,21.0,,\r\n"
+            "C,C,52.2,21.0,1,\r\n"
+            "C1,C 1,52.2,21.0,,C\r\n"
+            "C2,C 2,52.2005,21.0,,C\r\n"
+            "D,D,52.3,21.0,,\r\n"
+            "E,E,52.3010,21.0,,\r\n"
+            "F,F,52.4,21.0,,\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id\r\n"
+            "R1,WD,r1\r\n"
+            "R2,WD,r2_early\r\n"
+            "R2,WD,r2\r\n"
+            "R3,WD,r3\r\n"
+            "SLOW,WD,slow\r\n"
+            "SHUTTLE,WD,shuttle\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "calendar",
+        StringIO(
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+            "start_date,end_date\r\n"
+            "WD,1,1,1,1,1,0,0,20240101,20240107\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            # A → C1, then transfer within station C to C2
+            "r1,0,A,08:00:00,08:00:00\r\n"
+            "r1,1,B,08:10:00,08:10:00\r\n"
+            "r1,2,C1,08:20:00,08:20:00\r\n"
+            # C2 → D, too early and catchable
+            "r2_early,0,C2,08:15:00,08:15:00\r\n"
+            "r2_early,1,D,08:30:00,08:30:00\r\n"
+            "r2,0,C2,08:25:00,08:25:00\r\n"
+            "r2,1,D,08:40:00,08:40:00\r\n"
+            # E (walking distance from D) → F
+            "r3,0,E,08:45:00,08:45:00\r\n"
+            "r3,1,F,09:00:00,09:00:00\r\n"
+            # A → F directly, but slower
+            "slow,0,A,08:05:00,08:05:00\r\n"
+            "slow,1,B,,\r\n"
+            "slow,2,F,10:05:00,10:05:00\r\n"
+            # A → B, every 10 minutes
+            "shuttle,0,A,06:00:00,06:00:00\r\n"
+            "shuttle,1,B,06:05:00,06:05:00\r\n"
+        ),
+    )
+    gtfs.load_to_rows(
+        "frequencies",
+        StringIO(
+            "trip_id,start_time,end_time,headway_secs\r\n" "shuttle,06:00:00,09:00:00,600\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+    return Planner(gtfs, HeadwayExpander(gtfs))
+
+
+def test_patterns() -> None:
+    planner = get_planner()
+    planner.build()
+
+    # r2_early and r2 share a pattern, while every other trip has its own
+    assert sorted(i.trip_ids for i in planner.patterns) == [
+        ["r1"],
+        ["r2_early", "r2"],
+        ["r3"],
+        ["shuttle"] * 18,
+        ["slow"],
+    ]
+
+    # Times of the interpolated stop
+    slow = next(i for i in planner.patterns if i.trip_ids == ["slow"])
+    assert slow.arrival(0, 1) == time_to_int("09:05:00")
+
+
+def test_transfers() -> None:
+    planner = get_planner()
+    planner.build()
+
+    def transfers_of(stop_id: str) -> list[str]:
+        return [planner.stop_ids[i] for i, _ in planner.transfers[planner.stop_index[stop_id]]]
+
+    assert sorted(transfers_of("C1")) == ["C", "C2"]
+    assert transfers_of("D") == ["E"]
+    assert transfers_of("A") == []
+
+
+def test_plan() -> None:
+    journeys = get_planner().plan("A", "F", MONDAY, time_to_int("07:55:00"))
+    assert len(journeys) == 2
+
+    # Direct, but slow
+    assert journeys[0].legs == [
+        Leg("A", "F", time_to_int("08:05:00"), time_to_int("10:05:00"), "slow"),
+    ]
+
+    # Faster, with transfers within a station and between nearby stops
+    assert journeys[1].rides == 3
+    assert journeys[1].arrival == time_to_int("09:00:00")
+    assert [(i.from_stop_id, i.to_stop_id, i.trip_id) for i in journeys[1].legs] == [
+        ("A", "C1", "r1"),
+        ("C1", "C2", None),
+        ("C2", "D", "r2"),
+        ("D", "E", None),
+        ("E", "F", "r3"),
+    ]
+
+
+def test_plan_frequencies() -> None:
+    journeys = get_planner().plan("A", "B", MONDAY, time_to_int("07:51:00"))
+    assert len(journeys) == 1
+    assert journeys[0].legs == [
+        Leg("A", "B", time_to_int("08:00:00"), time_to_int("08:05:00"), "shuttle"),
+    ]
+
+
+def test_plan_inactive_day() -> None:
+    assert get_planner().plan("A", "F", SUNDAY, time_to_int("07:55:00")) == []
+
+
+def test_plan_same_station() -> None:
+    assert get_planner().plan("C1", "C2", MONDAY, time_to_int("07:55:00")) == []
@@ -0,0 +1,140 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pickle
+import tracemalloc
+from io import StringIO
+from typing import Callable
+
+import pytest
+
+from jvig import records
+from jvig.gtfs import Gtfs, _read_rows
+from jvig.records import ColumnDictionary, Record, record_type
+
+
+def test_record() -> None:
+    Stop = record_type(("stop_id", "stop_name", "stop_code"))
+    stop = Stop(("A", "Alpha", ""))
+
+    assert isinstance(stop, Record)
+    assert record_type(("stop_id", "stop_name", "stop_code")) is Stop
+    assert not hasattr(stop, "__dict__")
+
+    assert stop["stop_name"] == "Alpha"
+    assert stop.get("stop_code") == ""
+    assert stop.get("parent_station") is None
+    assert stop.get("parent_station", "") == ""
+    assert "stop_id" in stop
+    assert "parent_station" not in stop
+    with pytest.raises(KeyError):
+        stop["parent_station"]
+
+    assert list(stop) == ["stop_id", "stop_name", "stop_code"]
+    assert len(stop) == 3
+    assert dict(stop) == {"stop_id": "A", "stop_name": "Alpha", "stop_code": ""}
+    assert stop == {"stop_id": "A", "stop_name": "Alpha", "stop_code": ""}
+    assert stop != {"stop_id": "A", "stop_name": "Alpha"}
+
+
+def test_record_duplicate_columns() -> None:
+    row = record_type(("a", "b", "a"))(("1", "2", "3"))
+    assert row == dict(zip(("a", "b", "a"), ("1", "2", "3")))
+
+
+def test_record_pickle() -> None:
+    Trip = record_type(("trip_id", "route_id"))
+    trips = [Trip((f"T{i}", "R")) for i in range(100)]
+
+    unpickled = pickle.loads(pickle.dumps(trips))
+    assert unpickled == trips
+    assert type(unpickled[0]) is Trip
+
+    # The header is only stored once
+    assert pickle.dumps(trips).count(b"route_id") == 1
+
+
+def test_column_dictionary(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(records, "DICTIONARY_SAMPLE", 10)
+    dictionary = ColumnDictionary(3, skip=[0])
+
+    # NOTE: Strings are built at runtime, so that they're distinct objects
+    rows = [
+        dictionary.encode([f"T{i}", "".join(["R", "1"]), "".join(["N", str(i)])])
+        for i in range(20)
+    ]
+
+    assert all(row[1] is rows[0][1] for row in rows)
+    assert list(dictionary.dictionaries) == [1]
+    assert rows[5] == ("T5", "R1", "N5")
+
+
+def test_gtfs_records() -> None:
+    gtfs = Gtfs()
+    gtfs.load_to_row(
+        "routes",
+        StringIO(
+            "route_id,route_short_name,route_type\r\n"
+            + "".join(f"R{i},{i},3\r\n" for i in range(100))
+            + "Odd,odd,3,extra\r\n"
+        ),
+    )
+
+    assert isinstance(gtfs.routes["R1"], Record)
+    assert gtfs.routes["R1"] == {
+        "route_id": "R1",
+        "route_short_name": "1",
+        "route_type": "3",
+        "agency_id": "(missing)",
+    }
+    assert gtfs.routes["R1"]["route_type"] is gtfs.routes["R2"]["route_type"]
+    assert gtfs.header_of("routes") == ["route_id", "route_short_name", "route_type", "agency_id"]
+
+    # Rows with an unexpected number of fields are kept as dicts
+    assert gtfs.routes["Odd"] == {
+        "route_id": "Odd",
+        "route_short_name": "odd",
+        "route_type": "3",
+        None: ["extra"],
+        "agency_id": "(missing)",
+    }
+
+
+def test_memory_saved() -> None:
+    header = "route_id,service_id,trip_id,trip_headsign,direction_id,wheelchair_accessible\r\n"
+    data = header + "".join(
+        f"Route{i % 20},Service{i % 3},T{i},Headsign {i % 20},{i % 2},1\r\n" for i in range(10_000)
+    )
+
+    def traced_size(load: Callable[[], object]) -> int:
+        tracemalloc.start()
+        try:
+            table = load()
+            size = tracemalloc.get_traced_memory()[0]
+            del table
+        finally:
+            tracemalloc.stop()
+        return size
+
+    def load_records() -> object:
+        gtfs = Gtfs()
+        gtfs.load_to_row("trips", StringIO(data))
+        return gtfs.trips
+
+    def load_dicts() -> object:
+        return {row["trip_id"]: row for row in _read_rows(StringIO(data))}
+
+    assert traced_size(load_records) < 0.5 * traced_size(load_dicts)
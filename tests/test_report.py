@@ -0,0 +1,99 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from io import StringIO
+
+import pytest
+
+from jvig import report
+from jvig.gtfs import Gtfs
+
+
+def get_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon,platform_color\r\n"
+            "A,A,52.0,21.0,red\r\n"
+            "B,B,95.0,21.0,blue\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "routes",
+        StringIO(
+            "route_id,route_short_name,route_type,route_color\r\n"
+            "R1,1,3,FF0000\r\n"
+            "R2,2,3,red\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            + "".join(f"t{i},0,A,08:0x:00,08:00:00\r\n" for i in range(15))
+            + "t15,1,B,08:30:00,08:30:00\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_validate_feed() -> None:
+    result = report.validate_feed(get_gtfs(), processes=1, max_examples=3)
+
+    assert result.rows_checked["stops"] == 2
+    assert result.rows_checked["routes"] == 2
+    assert result.rows_checked["stop_times"] == 16
+    assert result.rows_checked["trips"] == 0
+
+    issues = {(i.table, i.column): i for i in result.issues}
+    assert set(issues) == {
+        ("stops", "platform_color"),
+        ("stops", "stop_lat"),
+        ("routes", "route_color"),
+        ("stop_times", "arrival_time"),
+    }
+
+    assert issues["stops", "platform_color"].kind == "unrecognized"
+    assert issues["stops", "stop_lat"].kind == "invalid"
+    assert issues["stops", "stop_lat"].examples == [["B"]]
+    assert issues["routes", "route_color"].examples == [["R2"]]
+
+    times_issue = issues["stop_times", "arrival_time"]
+    assert times_issue.count == 15
+    assert times_issue.examples == [["t0", "0"], ["t1", "0"], ["t2", "0"]]
+
+    assert result.total_issues == 18
+
+
+def test_validate_feed_in_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    gtfs = get_gtfs()
+    expected = report.validate_feed(gtfs, processes=1, max_examples=3)
+
+    monkeypatch.setattr(report, "PARALLEL_THRESHOLD", 0)
+    monkeypatch.setattr(report, "CHUNK_SIZE", 2)
+    got = report.validate_feed(gtfs, processes=2, max_examples=3)
+
+    assert got == expected
+
+
+def test_as_text() -> None:
+    result = report.validate_feed(get_gtfs(), processes=1, max_examples=1)
+    lines = result.as_text().splitlines()
+    assert lines[0] == "20 rows checked, 18 issues"
+    assert "routes.route_color: 1 invalid" in lines
+    assert "stops.platform_color: 1 unrecognized" in lines
@@ -0,0 +1,80 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import shutil
+from pathlib import Path
+
+from werkzeug.test import Client
+
+from jvig.serve import FeedPool, FeedServer, find_feeds
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def create_feeds(where: Path) -> None:
+    shutil.copy(FIXTURES_DIR / "gtfs_wkd.zip", where / "zipped.zip")
+    shutil.copytree(FIXTURES_DIR / "gtfs_wkd", where / "unpacked")
+    (where / "empty").mkdir()
+    (where / "notes.md").write_text("not a feed", encoding="utf-8")
+
+
+def test_find_feeds(tmp_path: Path) -> None:
+    create_feeds(tmp_path)
+    feeds = find_feeds(tmp_path)
+    assert list(feeds) == ["unpacked", "zipped"]
+    assert feeds["zipped"].path == tmp_path / "zipped.zip"
+    assert feeds["zipped"].estimated_size > 0
+
+
+def test_serve(tmp_path: Path) -> None:
+    create_feeds(tmp_path)
+    pool = FeedPool(find_feeds(tmp_path))
+    client = Client(FeedServer(pool))
+
+    index = client.get("/")
+    assert index.status_code == 200
+    assert 'href="feed/zipped/"' in index.text
+    assert 'href="feed/unpacked/"' in index.text
+    assert not pool.is_loaded("zipped")
+
+    redirect = client.get("/feed/zipped")
+    assert redirect.status_code == 302
+    assert redirect.headers["Location"] == "/feed/zipped/"
+
+    stops = client.get("/feed/zipped/stops")
+    assert stops.status_code == 200
+    assert '<base href="/feed/zipped/" />' in stops.text
+    assert 'href="stop/wsrod"' in stops.text
+    assert pool.is_loaded("zipped")
+
+    assert client.get("/feed/zipped/static/style.css").status_code == 200
+    assert client.get("/feed/missing/").status_code == 404
+    assert client.get("/feed/missing").status_code == 404
+
+
+def test_serve_eviction(tmp_path: Path) -> None:
+    create_feeds(tmp_path)
+    feeds = find_feeds(tmp_path)
+    pool = FeedPool(feeds, memory_limit=feeds["zipped"].estimated_size)
+    client = Client(FeedServer(pool))
+
+    assert client.get("/feed/zipped/").status_code == 200
+    assert pool.is_loaded("zipped")
+
+    assert client.get("/feed/unpacked/").status_code == 200
+    assert pool.is_loaded("unpacked")
+    assert not pool.is_loaded("zipped")
+    assert pool.size == feeds["unpacked"].estimated_size
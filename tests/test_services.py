@@ -0,0 +1,108 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+from jvig.app import Application
+from jvig.gtfs import Gtfs
+from jvig.services import BitCounter, service_masks, summarize_calendars
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def test_bit_counter() -> None:
+    random.seed(42)
+    masks = [(random.getrandbits(100), random.randint(0, 50)) for _ in range(200)]
+
+    counter = BitCounter()
+    for mask, weight in masks:
+        counter.add(mask, weight)
+
+    assert counter.counts(100) == [
+        sum(weight for mask, weight in masks if mask & (1 << i)) for i in range(100)
+    ]
+
+
+def test_service_masks() -> None:
+    start, length, masks = service_masks(
+        {
+            "WD": {
+                "service_id": "WD",
+                "monday": "1",
+                "tuesday": "1",
+                "wednesday": "1",
+                "thursday": "1",
+                "friday": "1",
+                "saturday": "0",
+                "sunday": "0",
+                "start_date": "20240101",
+                "end_date": "20240114",
+            },
+        },
+        {
+            "WD": [
+                {"service_id": "WD", "date": "20240101", "exception_type": "2"},
+                {"service_id": "WD", "date": "20240113", "exception_type": "1"},
+            ],
+            "X": [{"service_id": "X", "date": "20240120", "exception_type": "1"}],
+            "Invalid": [{"service_id": "Invalid", "date": "2024", "exception_type": "1"}],
+        },
+    )
+
+    assert start == date(2024, 1, 1)
+    assert length == 20
+    assert masks["WD"] == sum(1 << i for i in (1, 2, 3, 4, 7, 8, 9, 10, 11, 12))
+    assert masks["X"] == 1 << 19
+    assert masks["Invalid"] == 0
+
+
+def test_summarize_calendars() -> None:
+    gtfs = Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip")
+    summary = summarize_calendars(gtfs.calendar, gtfs.calendar_dates, gtfs.trips.values())
+
+    trips_of_service = Counter(trip["service_id"] for trip in gtfs.trips.values())
+    service_ids = gtfs.calendar.keys() | gtfs.calendar_dates.keys()
+    assert summary.start == date(2021, 12, 12)
+    assert len(summary.dates) == 385
+    for day, services, trips in zip(summary.dates, summary.services, summary.trips):
+        active = [i for i in service_ids if day in gtfs.service_dates(i)]
+        assert services == len(active)
+        assert trips == sum(trips_of_service[i] for i in active)
+
+    # A "holiday" without any services
+    del gtfs.calendar_dates["C"][0]
+    summary = summarize_calendars(gtfs.calendar, gtfs.calendar_dates, gtfs.trips.values())
+    assert summary.empty_dates == [date(2021, 12, 24)]
+
+    weeks = summary.weeks()
+    assert weeks[0] == [None, None, None, None, None, None, 0]
+    assert all(len(week) == 7 for week in weeks)
+    assert sum(i is not None for week in weeks for i in week) == 385
+
+
+def test_calendar_summary_api() -> None:
+    app = Application(Gtfs.from_user_input(FIXTURES_DIR / "gtfs_wkd.zip"))
+    client = app.flask.test_client()
+
+    summary = client.get("/api/calendar/summary").json
+    assert summary is not None
+    assert summary["days"][0] == {"date": "2021-12-12", "services": 1, "trips": 112}
+    assert summary["empty_dates"] == []
+
+    assert client.get("/calendars").status_code == 200
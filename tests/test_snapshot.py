@@ -0,0 +1,78 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from jvig import snapshot
+from jvig.gtfs import Gtfs
+from jvig.snapshot import load_gtfs, load_snapshot, snapshot_path
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+def test_snapshot(tmp_path: Path) -> None:
+    feed = tmp_path / "feed"
+    snapshots = tmp_path / "snapshots"
+    shutil.copytree(FIXTURES_DIR / "gtfs_wkd", feed)
+
+    # First load saves the snapshot
+    gtfs = load_gtfs(feed, snapshots)
+    path = snapshot_path(feed, snapshots)
+    assert path.is_file()
+
+    loaded = load_snapshot(path)
+    assert loaded is not None
+    assert loaded.stops == gtfs.stops
+    assert loaded.trips == gtfs.trips
+    assert loaded.stop_times == gtfs.stop_times
+
+    # Modifying the feed invalidates the snapshot, and the old one is removed
+    stat = (feed / "stops.txt").stat()
+    os.utime(feed / "stops.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    new_path = snapshot_path(feed, snapshots)
+    assert new_path != path
+
+    load_gtfs(feed, snapshots)
+    assert new_path.is_file()
+    assert not path.exists()
+
+
+def test_broken_snapshot(tmp_path: Path) -> None:
+    path = tmp_path / "broken.pickle"
+    path.write_bytes(b"not a pickle")
+    assert load_snapshot(path) is None
+    assert load_snapshot(tmp_path / "missing.pickle") is None
+
+
+def test_unpicklable_feed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    feed = FIXTURES_DIR / "gtfs_wkd"
+    snapshots = tmp_path / "snapshots"
+
+    # Feeds with stop_times kept on disk can't be pickled
+    monkeypatch.setattr(
+        snapshot.Gtfs,
+        "from_user_input",
+        lambda where: Gtfs.from_directory(where, memory_limit=1024 * 1024),
+    )
+
+    # The feed is still loaded, just without a snapshot
+    gtfs = load_gtfs(feed, snapshots)
+    assert gtfs.stops
+    assert list(snapshots.iterdir()) == []
@@ -0,0 +1,101 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+from io import StringIO
+
+import pytest
+
+from jvig.gtfs import Gtfs
+from jvig.spatial import StopGrid
+from jvig.util import haversine
+
+
+def random_stops(count: int = 2000) -> list[tuple[str, float, float]]:
+    rng = random.Random(42)
+    return [(f"s{i}", 52.1 + rng.random() * 0.1, 20.9 + rng.random() * 0.2) for i in range(count)]
+
+
+def test_within() -> None:
+    stops = random_stops()
+    grid = StopGrid(stops)
+    expected = sorted(
+        (haversine((52.15, 21.0), (lat, lon)), stop_id)
+        for stop_id, lat, lon in stops
+        if haversine((52.15, 21.0), (lat, lon)) <= 500.0
+    )
+
+    got = grid.within(52.15, 21.0, 500.0)
+    assert [i[1] for i in got] == [i[1] for i in expected]
+    assert [i[0] for i in got] == pytest.approx([i[0] for i in expected])
+
+
+def test_nearest() -> None:
+    stops = random_stops()
+    grid = StopGrid(stops)
+    by_distance = sorted((haversine((52.12, 20.95), (lat, lon)), i) for i, lat, lon in stops)
+
+    assert [i[1] for i in grid.nearest(52.12, 20.95, 15)] == [i[1] for i in by_distance[:15]]
+    assert grid.nearest(52.12, 20.95, 0) == []
+
+    near = grid.nearest(52.12, 20.95, 15, max_distance=by_distance[4][0])
+    assert [i[1] for i in near] == [i[1] for i in by_distance[:5]]
+
+    # Far away from all stops
+    far = grid.nearest(0.0, 0.0, 3)
+    assert [i[1] for i in far] == [
+        i[1] for i in sorted((haversine((0.0, 0.0), (lat, lon)), i) for i, lat, lon in stops)[:3]
+    ]
+
+
+@pytest.mark.parametrize("cell_size", [250.0, 100.0])
+def test_pairs_within(cell_size: float) -> None:
+    stops = random_stops(800)
+    grid = StopGrid(stops, cell_size)
+
+    expected = {
+        frozenset((a[0], b[0]))
+        for i, a in enumerate(stops)
+        for b in stops[i + 1 :]
+        if haversine(a[1:], b[1:]) <= 400.0
+    }
+    got = [frozenset((a, b)) for a, b, _ in grid.pairs_within(400.0)]
+    assert len(got) == len(expected)
+    assert set(got) == expected
+
+
+def test_nearby_stops() -> None:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,stop_lat,stop_lon\r\n"
+            "A,A,52.0,21.0\r\n"
+            "B,B,52.001,21.0\r\n"
+            "C,C,52.002,21.0\r\n"
+            "D,D,52.1,21.0\r\n"
+            "E,E,,\r\n"
+            "F,F,52.0\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+
+    assert len(gtfs.stop_grid) == 4
+    assert [i[1]["stop_id"] for i in gtfs.nearby_stops("A")] == ["B", "C"]
+    assert [i[1]["stop_id"] for i in gtfs.nearby_stops("A", 150.0)] == ["B"]
+    assert gtfs.nearby_stops("E") == []
+    assert gtfs.nearby_stops("F") == []
+    assert gtfs.nearby_stops("missing") == []
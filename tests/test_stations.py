@@ -0,0 +1,204 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import time
+from io import StringIO
+
+import pytest
+
+from jvig.app import Application
+from jvig.gtfs import Gtfs
+from jvig.stations import DEFAULT_PATHWAY_TIME, StationGraph, pathway_time
+
+
+def pathway(
+    pathway_id: str,
+    from_stop_id: str,
+    to_stop_id: str,
+    traversal_time: str = "",
+    is_bidirectional: str = "1",
+    **extra: str,
+) -> dict[str, str]:
+    return {
+        "pathway_id": pathway_id,
+        "from_stop_id": from_stop_id,
+        "to_stop_id": to_stop_id,
+        "pathway_mode": "1",
+        "is_bidirectional": is_bidirectional,
+        "traversal_time": traversal_time,
+        **extra,
+    }
+
+
+def test_pathway_time() -> None:
+    assert pathway_time(pathway("p", "a", "b", "42")) == 42.0
+    assert pathway_time(pathway("p", "a", "b", length="15.5")) == 15.5
+    assert pathway_time(pathway("p", "a", "b")) == DEFAULT_PATHWAY_TIME
+
+
+def test_shortest_path() -> None:
+    graph = StationGraph(
+        "st",
+        [
+            pathway("p1", "entrance", "hall", "30"),
+            pathway("p2", "hall", "platform1", "60", signposted_as="Platform 1"),
+            pathway("p3", "hall", "mezzanine", "20"),
+            pathway("p4", "mezzanine", "platform1", "20", reversed_signposted_as="Exit"),
+            pathway("p5", "platform1", "platform2", "10", is_bidirectional="0"),
+        ],
+    )
+
+    assert graph.nodes == ["entrance", "hall", "mezzanine", "platform1", "platform2"]
+    assert len(graph) == 9
+
+    path = graph.shortest_path("entrance", "platform2")
+    assert path is not None
+    assert path.time == 80.0
+    assert [i.pathway["pathway_id"] for i in path.edges] == ["p1", "p3", "p4", "p5"]
+
+    # Going back takes the reversed pathways, and p5 can't be traversed backwards
+    assert graph.shortest_path("platform2", "entrance") is None
+    path = graph.shortest_path("platform1", "entrance")
+    assert path is not None
+    assert [(i.pathway["pathway_id"], i.reversed) for i in path.edges] == [
+        ("p4", True),
+        ("p3", True),
+        ("p1", True),
+    ]
+    assert path.as_json()["edges"][0]["signposted_as"] == "Exit"
+
+    # Trivial and impossible paths
+    assert graph.shortest_path("hall", "hall") == (0.0, [])
+    assert graph.shortest_path("hall", "missing") is None
+
+
+def test_shortest_path_large_station() -> None:
+    # A grid of 10 000 nodes with randomly timed pathways -
+    # way larger than any real station
+    rng = random.Random(42)
+    size = 100
+    pathways = [
+        pathway(f"{x}-{y}-{dx}", f"{x}-{y}", f"{x + dx}-{y + 1 - dx}", str(rng.randint(5, 60)))
+        for x in range(size)
+        for y in range(size)
+        for dx in (0, 1)
+        if x + dx < size and y + 1 - dx < size
+    ]
+    graph = StationGraph("st", pathways)
+
+    start = time.perf_counter()
+    path = graph.shortest_path("0-0", f"{size - 1}-{size - 1}")
+    elapsed = time.perf_counter() - start
+
+    assert path is not None
+    assert len(path.edges) >= 2 * (size - 1)
+    assert path.time == sum(i.time for i in path.edges)
+    assert elapsed < 0.5
+
+
+def station_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_stops(
+        "stops",
+        StringIO(
+            "stop_id,stop_name,location_type,parent_station\r\n"
+            "st,Station,1,\r\n"
+            "e,Entrance,2,st\r\n"
+            "p1,Platform 1,0,st\r\n"
+            "p2,Platform 2,0,st\r\n"
+            "ba,Boarding area,4,p2\r\n"
+            "other,Other,0,\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "pathways",
+        StringIO(
+            "pathway_id,from_stop_id,to_stop_id,pathway_mode,is_bidirectional,traversal_time\r\n"
+            "w1,e,p1,1,1,40\r\n"
+            "w2,p1,p2,2,1,25\r\n"
+            "w3,ba,p2,1,1,5\r\n"
+            "w4,x,p2,1,1,5\r\n"
+        ),
+    )
+    gtfs.load_to_rows(
+        "transfers",
+        StringIO(
+            "from_stop_id,to_stop_id,from_trip_id,to_trip_id,transfer_type,min_transfer_time\r\n"
+            "p1,p2,,,2,120\r\n"
+            "p2,p1,t1,t2,1,\r\n"
+            "other,p1,,,3,\r\n"
+        ),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_gtfs_indexes() -> None:
+    gtfs = station_gtfs()
+
+    assert gtfs.station_of("ba") == "st"
+    assert gtfs.station_of("p1") == "st"
+    assert gtfs.station_of("st") == "st"
+    assert gtfs.station_of("other") == "other"
+
+    assert list(gtfs.station_graphs) == ["st", "x"]
+    graph = gtfs.station_graph("e")
+    assert graph is not None
+    assert graph.nodes == ["ba", "e", "p1", "p2"]
+    path = graph.shortest_path("e", "ba")
+    assert path is not None and path.time == 70.0
+
+    assert [i["to_stop_id"] for i in gtfs.transfers["p1"]] == ["p2"]
+    assert [i["from_stop_id"] for i in gtfs.transfers_to["p1"]] == ["p2", "other"]
+    assert [i["to_trip_id"] for i in gtfs.transfers_from_trip["t1"]] == ["t2"]
+
+    assert {(fk.table, fk.column): v for fk, v in gtfs.dangling.items()} == {
+        ("transfers", "from_trip_id"): {"t1": ["p2"]},
+        ("transfers", "to_trip_id"): {"t2": ["p2"]},
+        ("pathways", "from_stop_id"): {"x": ["w4"]},
+    }
+
+
+def test_pages() -> None:
+    client = Application(station_gtfs()).flask.test_client()
+
+    page = client.get("/stop/p1").get_data(as_text=True)
+    assert "Transfers" in page
+    assert "Pathways of station st" in page
+    assert 'href="stop/other"' in page
+
+    page = client.get("/stop/e?to=ba").get_data(as_text=True)
+    assert "<td>70 s</td>" in page
+
+    r = client.get("/api/pathways/path?from=ba&to=e")
+    assert r.status_code == 200
+    assert r.json is not None
+    assert r.json["time"] == 70.0
+    assert [i["pathway_id"] for i in r.json["edges"]] == ["w3", "w2", "w1"]
+
+    assert client.get("/api/pathways/path?from=ba").status_code == 400
+    assert client.get("/api/pathways/path?from=ba&to=other").status_code == 400
+    assert client.get("/api/pathways/path?from=other&to=other").status_code == 404
+
+
+@pytest.mark.parametrize("stop_id", ["p1", "other"])
+def test_stop_page_without_pathways(stop_id: str) -> None:
+    gtfs = station_gtfs()
+    gtfs.pathways.clear()
+    gtfs.build_indexes()
+    page = Application(gtfs).flask.test_client().get(f"/stop/{stop_id}").get_data(as_text=True)
+    assert "Pathways of station" not in page
@@ -0,0 +1,143 @@
+# jvig - GTFS Viewer, created using Flask.
+# Copyright © 2024 Mikołaj Kuranowski
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+from io import StringIO
+
+from jvig.gtfs import Gtfs
+from jvig.headways import HeadwayExpander
+from jvig.stats import ServiceStats, compute_stats
+
+
+def get_gtfs() -> Gtfs:
+    gtfs = Gtfs()
+    gtfs.load_to_row(
+        "agency",
+        StringIO("agency_id,agency_name,agency_url,agency_timezone\r\nA,A,a,UTC\r\n"),
+    )
+    gtfs.load_to_row(
+        "routes",
+        StringIO("route_id,agency_id,route_short_name,route_type\r\nR1,A,1,3\r\nR2,A,2,3\r\n"),
+    )
+    gtfs.load_to_row(
+        "trips",
+        StringIO(
+            "route_id,service_id,trip_id,direction_id\r\n"
+            "R1,WD,r1_1,0\r\n"
+            "R1,WD,r1_2,0\r\n"
+            "R1,WD,r1_3,1\r\n"
+            "R1,SA,r1_4,0\r\n"
+            "R2,WD,r2,0\r\n"
+        ),
+    )
+    gtfs.load_to_row(
+        "calendar",
+        StringIO(
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+            "start_date,end_date\r\n"
+            "WD,1,1,1,1,1,0,0,20240101,20240107\r\n"
+            "SA,0,0,0,0,0,1,0,20240101,20240107\r\n"
+        ),
+    )
+    gtfs.load_stop_times(
+        "stop_times",
+        StringIO(
+            "trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n"
+            "r1_1,0,A,08:00:00,08:00:00\r\n"
+            "r1_1,1,B,08:30:00,08:30:00\r\n"
+            "r1_2,0,A,08:20:00,08:20:00\r\n"
+            "r1_2,1,B,08:50:00,08:50:00\r\n"
+            "r1_3,0,B,09:00:00,09:00:00\r\n"
+            "r1_3,1,C,09:30:00,09:30:00\r\n"
+            "r1_4,0,A,10:00:00,10:00:00\r\n"
+            "r1_4,1,B,10:30:00,10:30:00\r\n"
+            "r2,0,C,06:00:00,06:00:00\r\n"
+            "r2,1,D,06:15:00,06:15:00\r\n"
+        ),
+    )
+    gtfs.load_to_rows(
+        "frequencies",
+        StringIO("trip_id,start_time,end_time,headway_secs\r\nr2,06:00:00,07:00:00,900\r\n"),
+    )
+    gtfs.build_indexes()
+    return gtfs
+
+
+def test_compute_stats() -> None:
+    gtfs = get_gtfs()
+    stats = compute_stats(gtfs, HeadwayExpander(gtfs))
+
+    r1, r2 = stats.routes
+    assert r1.route_id == "R1"
+    assert r1.trips == 4
+    assert r1.days == 6
+    assert r1.trip_days == 3 * 5 + 1
+    assert r1.trips_per_day == 16 / 6
+    assert r1.vehicle_hours_per_day == 8 / 6
+    assert r1.first_departure == 8 * 3600
+    assert r1.last_departure == 10 * 3600
+    assert r1.stops == {"A", "B", "C"}
+    assert r1.busiest_date == date(2024, 1, 1)
+    assert r1.headways == {8: 20.0}
+
+    # Departures of frequency-based trips are counted separately
+    assert r2.trips == 1
+    assert r2.trips_per_day == 4.0
+    assert r2.vehicle_hours_per_day == 1.0
+    assert r2.last_departure == 6 * 3600 + 45 * 60
+    assert r2.headways == {6: 15.0}
+
+    (agency,) = stats.agencies
+    assert agency.agency_id == "A"
+    assert agency.routes == 2
+    assert agency.trips == 5
+    assert agency.days == 6
+    assert agency.stops == {"A", "B", "C", "D"}
+
+    assert stats.trips_per_date == [
+        (date(2024, 1, 1), 7),
+        (date(2024, 1, 2), 7),
+        (date(2024, 1, 3), 7),
+        (date(2024, 1, 4), 7),
+        (date(2024, 1, 5), 7),
+        (date(2024, 1, 6), 1),
+    ]
+    assert stats.headway_hours == [6, 8]
+    assert stats.max_trips_per_date == 7
+
+
+def test_as_json() -> None:
+    gtfs = get_gtfs()
+    data = compute_stats(gtfs, HeadwayExpander(gtfs)).as_json()
+
+    assert data["agencies"][0]["trips_per_day"] == 6.0
+    assert data["routes"][0]["first_departure"] == "08:00:00"
+    assert data["routes"][0]["headways"] == {"8": 20.0}
+    assert data["trips_per_date"]["2024-01-06"] == 1
+
+
+def test_merge_without_departures() -> None:
+    agency = ServiceStats(first_departure=3600, last_departure=7200)
+    agency.merge(ServiceStats())
+
+    assert agency.first_departure == 3600
+    assert agency.last_departure == 7200
+
+    empty = ServiceStats()
+    empty.merge(agency)
+
+    assert empty.first_departure == 3600
+    assert empty.last_departure == 7200
@@ -1,5 +1,5 @@
 # jvig - GTFS Viewer, created using Flask.
-# Copyright © 2022 Mikołaj Kuranowski
+# Copyright © 2022-2024 Mikołaj Kuranowski
 
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -34,6 +34,14 @@ def test_time_to_int():
     assert util.time_to_int("foo:bar:baz") == -1
 
 
+def test_int_to_time():
+    assert util.int_to_time(38430) == "10:40:30"
+    assert util.int_to_time(28800) == "08:00:00"
+    assert util.int_to_time(95400) == "26:30:00"
+    assert util.int_to_time(0) == "00:00:00"
+    assert util.int_to_time(-1) == ""
+
+
 def test_sequence_to_int():
     assert util.sequence_to_int("1") == 1
     assert util.sequence_to_int("0") == 0
@@ -74,3 +82,34 @@ def test_parse_gtfs_date():
 
 def test_unique_list():
     assert util.unique_list([1, 2, 2, 3, 3, 1, 4, 5, 5, 4]) == [1, 2, 3, 4, 5]
+
+
+def test_haversine():
+    assert util.haversine((52.23, 21.01), (52.23, 21.01)) == 0.0
+    assert util.haversine((52.2297, 21.0122), (50.0647, 19.9450)) == pytest.approx(252_000, 1e-2)
+    assert util.haversine((0.0, 0.0), (0.0, 1.0)) == pytest.approx(111_195, 1e-3)
+
+
+def test_background_task():
+    calls: list[int] = []
+
+    def compute() -> int:
+        calls.append(1)
+        return 42
+
+    task = util.BackgroundTask(compute)
+    assert not task.done()
+    assert task.result(timeout=5) == 42
+    assert task.done()
+    task.start()
+    assert task.result() == 42
+    assert calls == [1]
+
+
+def test_background_task_error():
+    def compute() -> int:
+        raise ValueError("foo")
+
+    task = util.BackgroundTask(compute)
+    with pytest.raises(ValueError):
+        task.result(timeout=5)